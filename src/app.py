@@ -70,10 +70,13 @@ with st.expander("System Status (Debug)"):
     else:
         st.error("assessments.json NOT FOUND")
     
-    if os.path.exists('data/processed/assessments.index'):
+    if os.path.exists('data/processed/CURRENT'):
+        with open('data/processed/CURRENT') as f:
+            st.write(f"Index Bundle: {f.read().strip()}")
+    elif os.path.exists('data/processed/assessments.index'):
         st.write(f"Index Size: {os.path.getsize('data/processed/assessments.index')} bytes")
     else:
-        st.error("assessments.index NOT FOUND")
+        st.error("Index bundle NOT FOUND")
 
 # Sidebar
 with st.sidebar:
@@ -110,7 +113,7 @@ if st.button("Get Recommendations", type="primary"):
                     <span class="tag {tag_class}">{r.get('type', 'General')}</span>
                     <span class="score">Relevance: {score:.2f}</span>
                 </div>
-                <p style="margin-top:10px; color:#555;">{r['description'][:200]}...</p>
+                <p style="margin-top:10px; color:#555;">{(r.get('description') or '')[:200]}...</p>
             </div>
             """, unsafe_allow_html=True)
             
@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Inference backend for both transformer models:
+#   torch      sentence-transformers on PyTorch (default)
+#   onnx       ONNX Runtime, fp32 export
+#   onnx-int8  ONNX Runtime, dynamically quantized int8 weights
+# ONNX models are exported on first use (needs torch) and reused afterwards.
+INFERENCE_BACKEND = os.environ.get("SHL_INFERENCE_BACKEND", "torch")
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+ONNX_DIR = os.path.join(PROJECT_ROOT, "data", "processed", "onnx")
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_OPSET = 14
+
+
+def _model_dir(model_name):
+    return os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+
+
+def _onnx_path(model_dir, quantized):
+    return os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+
+
+def _session(path):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = int(os.environ.get("SHL_INFERENCE_THREADS", 0))
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _export(wrapper, sample, input_names, output_name, path):
+    import torch
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"}
+    kwargs = dict(
+        input_names=input_names,
+        output_names=[output_name],
+        dynamic_axes=dynamic_axes,
+        opset_version=ONNX_OPSET,
+    )
+    with torch.no_grad():
+        try:
+            # Newer torch defaults to the dynamo exporter, which does not take dynamic_axes
+            torch.onnx.export(wrapper, tuple(sample[n] for n in input_names), path, dynamo=False, **kwargs)
+        except TypeError:
+            torch.onnx.export(wrapper, tuple(sample[n] for n in input_names), path, **kwargs)
+
+
+def _quantize(model_dir):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(_onnx_path(model_dir, False), _onnx_path(model_dir, True), weight_type=QuantType.QInt8)
+
+
+def export_bi_encoder(model_name, quantize=True):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = _model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    hf_model = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = hf_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    logging.info(f"Exporting {model_name} to ONNX...")
+    _export(Wrapper(), sample, input_names, "last_hidden_state", _onnx_path(model_dir, False))
+    tokenizer.save_pretrained(model_dir)
+
+    # Mirror the sentence-transformers pooling/normalize modules at runtime
+    pooling = st[1] if len(st) > 1 else None
+    config = {
+        "kind": "bi-encoder",
+        "model": model_name,
+        "inputs": input_names,
+        "pooling": "cls" if getattr(pooling, "pooling_mode_cls_token", False) else "mean",
+        "normalize": any(type(module).__name__ == "Normalize" for module in st),
+        "max_length": int(st.max_seq_length),
+        "dimension": int(st.get_sentence_embedding_dimension()),
+    }
+    with open(os.path.join(model_dir, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    if quantize:
+        _quantize(model_dir)
+    return model_dir
+
+
+def export_cross_encoder(model_name, quantize=True):
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    model_dir = _model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    ce = CrossEncoder(model_name, device="cpu")
+    hf_model = ce.model.eval()
+    tokenizer = ce.tokenizer
+
+    sample = tokenizer(["export query"], ["export document"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = hf_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).logits
+
+    logging.info(f"Exporting {model_name} to ONNX...")
+    _export(Wrapper(), sample, input_names, "logits", _onnx_path(model_dir, False))
+    tokenizer.save_pretrained(model_dir)
+
+    # CrossEncoder.predict applies this to single-label logits (Identity for ms-marco)
+    activation = getattr(ce, "activation_fn", None) or getattr(ce, "default_activation_function", None)
+    config = {
+        "kind": "cross-encoder",
+        "model": model_name,
+        "inputs": input_names,
+        "activation": "sigmoid" if type(activation).__name__ == "Sigmoid" else "identity",
+        "max_length": int(getattr(ce, "max_length", None) or tokenizer.model_max_length),
+    }
+    with open(os.path.join(model_dir, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    if quantize:
+        _quantize(model_dir)
+    return model_dir
+
+
+def _prepare(model_name, quantized, export_fn):
+    model_dir = _model_dir(model_name)
+    if not os.path.exists(_onnx_path(model_dir, False)):
+        export_fn(model_name, quantize=quantized)
+    elif quantized and not os.path.exists(_onnx_path(model_dir, True)):
+        _quantize(model_dir)
+    with open(os.path.join(model_dir, "config.json"), "r") as f:
+        config = json.load(f)
+    return model_dir, config
+
+
+class OnnxBiEncoder:
+    # Drop-in for SentenceTransformer.encode / get_sentence_embedding_dimension
+    def __init__(self, model_name, quantized=False):
+        from transformers import AutoTokenizer
+
+        model_dir, self.config = _prepare(model_name, quantized, export_bi_encoder)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _session(_onnx_path(model_dir, quantized))
+        self.max_seq_length = self.config["max_length"]
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            features = self.tokenizer(
+                sentences[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np",
+            )
+            feed = {name: features[name].astype(np.int64) for name in self.config["inputs"]}
+            hidden = self.session.run(None, feed)[0]
+            if self.config["pooling"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = feed["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.config["normalize"]:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            outputs.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(outputs) if outputs else np.zeros((0, self.config["dimension"]), np.float32)
+        return embeddings[0] if single else embeddings
+
+
+class OnnxCrossEncoder:
+    # Drop-in for CrossEncoder.predict
+    def __init__(self, model_name, quantized=False):
+        from transformers import AutoTokenizer
+
+        model_dir, self.config = _prepare(model_name, quantized, export_cross_encoder)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _session(_onnx_path(model_dir, quantized))
+        self.max_length = self.config["max_length"]
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        pairs = list(pairs)
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            chunk = pairs[start:start + batch_size]
+            features = self.tokenizer(
+                [p[0] for p in chunk], [p[1] for p in chunk], padding=True,
+                truncation="longest_first", max_length=self.max_length, return_tensors="np",
+            )
+            scores.append(self.score_features(features))
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(scores)
+
+    def score_features(self, features):
+        feed = {name: np.asarray(features[name], dtype=np.int64) for name in self.config["inputs"]}
+        logits = self.session.run(None, feed)[0]
+        scores = (logits[:, 0] if logits.shape[1] == 1 else logits).astype(np.float32)
+        if self.config["activation"] == "sigmoid":
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores
+
+
+def import_backend(backend=None):
+    # The backend's Python modules take seconds to import; importing them once up
+    # front lets both models then load side by side without contending for the
+    # import lock
+    backend = backend or INFERENCE_BACKEND
+    if backend == "torch":
+        import sentence_transformers
+    elif backend in ("onnx", "onnx-int8"):
+        import onnxruntime
+        import transformers
+
+
+def load_bi_encoder(model_name, backend=None):
+    backend = backend or INFERENCE_BACKEND
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxBiEncoder(model_name, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+
+
+def load_cross_encoder(model_name, backend=None):
+    backend = backend or INFERENCE_BACKEND
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxCrossEncoder(model_name, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+
+
+def feature_scorer(reranker):
+    # Callable that scores already-tokenized, padded batches (dict of int64 arrays),
+    # matching reranker.predict. None if the reranker does not expose its model.
+    if isinstance(reranker, OnnxCrossEncoder):
+        return reranker.score_features
+    model = getattr(reranker, "model", None)
+    if model is None or getattr(reranker, "tokenizer", None) is None:
+        return None
+
+    import torch
+    activation = getattr(reranker, "activation_fn", None) or getattr(reranker, "default_activation_function", None)
+    activation = activation or torch.nn.Identity()
+
+    def score(features):
+        with torch.inference_mode():
+            inputs = {name: torch.from_numpy(array).to(model.device) for name, array in features.items()}
+            logits = activation(model(**inputs).logits)
+        scores = logits.float().cpu().numpy()
+        return scores[:, 0] if scores.ndim == 2 and scores.shape[1] == 1 else scores
+
+    return score
+
+
+def _ranks(values):
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[np.argsort(-np.asarray(values))] = np.arange(len(values))
+    return ranks
+
+
+def check_accuracy(backend, queries, k=10, initial_k=50):
+    # Compare a backend against PyTorch on the catalog:
+    #  - cosine between torch and candidate embeddings for every catalog text
+    #  - rerank order agreement (top-k overlap, Spearman) over each query's candidates
+    from embeddings import MODEL_NAME, corpus_text, load_assessments
+    from recommender import RERANKER_MODEL_NAME
+
+    assessments = load_assessments()
+    if not assessments:
+        raise RuntimeError("No catalog data to check against")
+    corpus = [corpus_text(item) for item in assessments]
+    docs = [f"{item.get('name') or ''}. {item.get('description') or ''}" for item in assessments]
+
+    reference_bi = load_bi_encoder(MODEL_NAME, "torch")
+    candidate_bi = load_bi_encoder(MODEL_NAME, backend)
+    ref = reference_bi.encode(corpus, convert_to_numpy=True)
+    cand = candidate_bi.encode(corpus, convert_to_numpy=True)
+    ref = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    cand = cand / np.linalg.norm(cand, axis=1, keepdims=True)
+    cosine = np.sum(ref * cand, axis=1)
+
+    reference_ce = load_cross_encoder(RERANKER_MODEL_NAME, "torch")
+    candidate_ce = load_cross_encoder(RERANKER_MODEL_NAME, backend)
+    query_vecs = reference_bi.encode(queries, convert_to_numpy=True)
+    query_vecs = query_vecs / np.linalg.norm(query_vecs, axis=1, keepdims=True)
+    candidates = np.argsort(-(query_vecs @ ref.T), axis=1)[:, :initial_k]
+
+    overlaps, spearman = [], []
+    for query, rows in zip(queries, candidates):
+        pairs = [[query, docs[i]] for i in rows]
+        a = np.asarray(reference_ce.predict(pairs), dtype=np.float64)
+        b = np.asarray(candidate_ce.predict(pairs), dtype=np.float64)
+        overlaps.append(len(set(np.argsort(-a)[:k]) & set(np.argsort(-b)[:k])) / k)
+        spearman.append(float(np.corrcoef(_ranks(a), _ranks(b))[0, 1]))
+
+    return {
+        "backend": backend,
+        "items": len(corpus),
+        "queries": len(queries),
+        "embedding_cosine_mean": float(cosine.mean()),
+        "embedding_cosine_min": float(cosine.min()),
+        f"rerank_top{k}_overlap_mean": float(np.mean(overlaps)),
+        "rerank_spearman_mean": float(np.mean(spearman)),
+    }
+
+
+DEFAULT_CHECK_QUERIES = [
+    "Looking for a Java Developer with good communication skills",
+    "Sales manager with strong negotiation skills",
+    "Graduate analyst with numerical reasoning",
+    "Python and SQL data engineer",
+    "Customer service representative for a call center",
+    "Personality assessment for leadership roles",
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export models to ONNX and check them against PyTorch")
+    parser.add_argument("--export", action="store_true", help="(Re-)export both models to ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 quantized export")
+    parser.add_argument("--check", choices=["onnx", "onnx-int8"], help="Compare a backend against torch")
+    args = parser.parse_args()
+
+    if args.export:
+        from embeddings import MODEL_NAME
+        from recommender import RERANKER_MODEL_NAME
+        export_bi_encoder(MODEL_NAME, quantize=not args.no_quantize)
+        export_cross_encoder(RERANKER_MODEL_NAME, quantize=not args.no_quantize)
+    if args.check:
+        print(json.dumps(check_accuracy(args.check, DEFAULT_CHECK_QUERIES), indent=2))
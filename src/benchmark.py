@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Offline CPU benchmarks:
+#
+#   python src/benchmark.py generate --items 100000 --output data/bench/catalog.jsonl
+#   python src/benchmark.py run --sizes 1000,10000,100000 --output bench.json --baseline bench_base.json
+#   python src/benchmark.py compare bench.json bench_base.json
+#
+# Suites:
+#   catalog  synthetic catalogs in the assessments.json schema at each size.
+#            Measures FAISS build/search per engine (recall@k against flat),
+#            filtered search, and BM25 build/search. Vectors are clustered
+#            random unit vectors, so no model is needed.
+#   models   query encoding and cross-encoder reranking with the real models
+#            (skipped when they cannot be loaded offline).
+#   rerank   candidate ordering, deduplication and MMR diversification (_finalize)
+#            on synthetic lists.
+#   e2e      /recommend throughput and latency against an in-process uvicorn
+#            server at each --concurrency level, using the published index.
+# Results are JSON. compare flags metrics that are worse than the baseline by
+# more than REGRESSION_THRESHOLD.
+BENCH_SIZES = [int(n) for n in os.environ.get("SHL_BENCH_SIZES", "1000,10000,100000").split(",")]
+BENCH_QUERIES = int(os.environ.get("SHL_BENCH_QUERIES", 200))
+BENCH_DIM = 384
+BENCH_K = 50
+# Relative change (0.15 = 15%) beyond which a metric counts as a regression
+REGRESSION_THRESHOLD = float(os.environ.get("SHL_BENCH_REGRESSION", 0.15))
+# BM25 is built in Python; larger synthetic catalogs skip it unless raised
+LEXICAL_MAX_ITEMS = int(os.environ.get("SHL_BENCH_LEXICAL_MAX", 200000))
+SUITES = ("catalog", "models", "rerank", "e2e")
+
+SKILLS = ["Java", "Python", "SQL", "C++", "JavaScript", "React", "Node", "AWS", "Excel", "Sales", "Customer Service",
+          "Leadership", "Numerical", "Verbal", "Deductive", "Inductive", "Mechanical", "Accounting", "Marketing",
+          "Data Entry", "Project Management", "Cloud", "Networking", "Linux", ".NET", "Selenium", "Agile", "HR"]
+LEVELS = ["Entry Level", "Professional", "Advanced", "Manager", "Graduate", "Executive", "Short Form", "8.0", "2.0"]
+KINDS = ["Assessment", "Test", "Simulation", "Questionnaire", "Reasoning", "Solution", "Interview", "Report"]
+PHRASES = ["measures the ability to", "evaluates candidates on", "is designed for roles requiring",
+           "assesses knowledge of", "provides insight into", "predicts job performance in",
+           "covers practical scenarios involving", "identifies potential for"]
+TOPICS = ["problem solving", "teamwork", "attention to detail", "communication", "coding", "data analysis",
+          "decision making", "customer focus", "time management", "critical thinking", "reasoning with numbers",
+          "written comprehension", "stakeholder management", "debugging", "system design", "negotiation"]
+
+
+def synthetic_items(count, seed=0):
+    # Yields records with the scraped schema (name, url, description, type)
+    from parsing import classify_type
+
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        skill = SKILLS[rng.integers(len(SKILLS))]
+        name = f"{skill} {LEVELS[rng.integers(len(LEVELS))]} {KINDS[rng.integers(len(KINDS))]} {i}"
+        sentences = [
+            f"This {skill} {KINDS[rng.integers(len(KINDS))].lower()} {PHRASES[rng.integers(len(PHRASES))]} "
+            f"{TOPICS[rng.integers(len(TOPICS))]} and {TOPICS[rng.integers(len(TOPICS))]}."
+            for _ in range(int(rng.integers(1, 4)))
+        ]
+        description = " ".join(sentences)
+        yield {
+            "name": name,
+            "url": f"https://www.shl.com/products/product-catalog/view/synthetic-{i}/",
+            "description": description,
+            "type": classify_type(name, description),
+        }
+
+
+def write_catalog(path, count, seed=0):
+    # JSONL, or a JSON array for .json, written one record at a time
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    as_array = path.endswith(".json")
+    with open(path, "w") as f:
+        if as_array:
+            f.write("[")
+        for i, item in enumerate(synthetic_items(count, seed)):
+            if as_array:
+                f.write(("," if i else "") + "\n" + json.dumps(item))
+            else:
+                f.write(json.dumps(item) + "\n")
+        if as_array:
+            f.write("\n]\n")
+    logging.info(f"Wrote {count} synthetic assessments to {path}")
+    return path
+
+
+def synthetic_vectors(count, dim=BENCH_DIM, clusters=64, seed=0):
+    # Unit vectors around a few centroids, closer to real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centroids[rng.integers(clusters, size=count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def synthetic_queries(vectors, count, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(len(vectors), size=count)] + 0.3 * rng.standard_normal(
+        (count, vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.ascontiguousarray(queries, dtype=np.float32)
+
+
+def summarize(samples_s, ops=None):
+    # Latency percentiles in ms; qps counts ops (default: one per sample) per second of samples
+    samples = np.asarray(samples_s, dtype=np.float64) * 1000
+    total_s = samples.sum() / 1000
+    return {
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+        "qps": round((ops if ops is not None else len(samples)) / total_s, 2) if total_s > 0 else 0.0,
+    }
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def bench_catalog(size, engines=("flat", "hnsw"), queries=BENCH_QUERIES, k=BENCH_K):
+    import faiss
+    from index_engines import build_index, recall_at_k, set_search_params, autotune
+    from filters import FilterIndex
+    from lexical import BM25Index
+
+    results = {}
+    vectors = synthetic_vectors(size)
+    query_vecs = synthetic_queries(vectors, queries)
+    labels = np.arange(size, dtype=np.int64)
+    k = min(k, size)
+
+    exact = None
+    # Flat goes first and serves as ground truth for the recall of the others
+    for engine in ["flat"] + [e for e in engines if e != "flat"]:
+        build_s, (index, build) = _timed(build_index, engine, vectors, labels, "float32")
+        # Tuned to the serving recall target, as create_index would
+        search = autotune(index, engine, build, vectors, query_vecs, k=k)["search"] if engine != "flat" else {}
+        set_search_params(index, search)
+        per_query = [_timed(index.search, query_vecs[i:i + 1], k)[0] for i in range(queries)]
+        batch_s, (_, found) = _timed(index.search, query_vecs, k)
+        if exact is None:
+            exact = found
+        results[f"catalog/{size}/faiss_{engine}"] = {
+            "build_s": round(build_s, 4),
+            **summarize(per_query),
+            "batch_qps": round(queries / batch_s, 2),
+            "recall_at_k": round(float(recall_at_k(found, exact)), 4),
+            "search": search,
+        }
+
+    # Filtered search through a type partition and through a selector bitmap
+    items = list(synthetic_items(size)) if size <= LEXICAL_MAX_ITEMS else None
+    if items is not None:
+        flat = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        flat.add_with_ids(vectors, labels)
+        filter_index = FilterIndex(items, vectors, labels)
+        for name, filters in (("partition", (("type", ("Technical",)),)),
+                              ("bitmap", (("type", ("Technical", "Cognitive")),))):
+            # The first partition query builds the partition; time steady state
+            filter_index.search(flat, query_vecs[:1], k, filters)
+            per_query = [_timed(filter_index.search, flat, query_vecs[i:i + 1], k, filters)[0] for i in range(queries)]
+            results[f"catalog/{size}/filtered_{name}"] = summarize(per_query)
+
+        texts = [item["description"].split(".")[0] for item in items[:queries]]
+        build_s, lexical = _timed(BM25Index.build, items)
+        per_query = [_timed(lexical.search, text, k)[0] for text in texts]
+        results[f"catalog/{size}/bm25"] = {"build_s": round(build_s, 4), **summarize(per_query)}
+    return results
+
+
+def bench_models(queries=BENCH_QUERIES, pairs=BENCH_K):
+    try:
+        from backends import load_bi_encoder, load_cross_encoder
+        from embeddings import MODEL_NAME
+        from recommender import RERANKER_MODEL_NAME
+
+        bi_encoder = load_bi_encoder(MODEL_NAME)
+        cross_encoder = load_cross_encoder(RERANKER_MODEL_NAME)
+    except Exception as e:
+        logging.warning(f"Skipping model benchmarks: {e}")
+        return {"models": {"skipped": str(e)}}
+
+    texts = [item["description"] for item in synthetic_items(queries)]
+    results = {}
+    bi_encoder.encode(texts[:8], convert_to_numpy=True)  # warm-up
+    results["models/encode_batch_1"] = summarize([_timed(bi_encoder.encode, [t])[0] for t in texts[:50]])
+    batches = [texts[i:i + 16] for i in range(0, len(texts), 16)]
+    results["models/encode_batch_16"] = summarize([_timed(bi_encoder.encode, b)[0] for b in batches],
+                                                  ops=len(texts))
+    query = "Java developer who works well with business stakeholders"
+    pair_batches = [[[query, t] for t in texts[i:i + pairs]] for i in range(0, len(texts) - pairs + 1, pairs)]
+    cross_encoder.predict(pair_batches[0][:4])  # warm-up
+    results[f"models/rerank_{pairs}_pairs"] = summarize([_timed(cross_encoder.predict, b)[0] for b in pair_batches],
+                                                        ops=sum(len(b) for b in pair_batches))
+    return results
+
+
+def bench_rerank(queries=BENCH_QUERIES, candidates=BENCH_K, k=10):
+    from recommender import _RerankState
+    from diversity import dedupe, diversify
+
+    # Ordering, deduplication and MMR need no models, only the stored vectors
+    rng = np.random.default_rng(0)
+    items = list(synthetic_items(candidates * 2))
+    vectors = synthetic_vectors(len(items))
+    positions = {item["url"]: pos for pos, item in enumerate(items)}
+    ordering, diversity = [], []
+    for _ in range(queries):
+        # A few duplicate URLs, as hybrid fusion can produce
+        chosen = rng.integers(len(items), size=candidates)
+        batch = [dict(items[i], score=float(rng.random()), rerank_score=float(rng.standard_normal())) for i in chosen]
+        state = _RerankState("query", batch, k, cascade=False)
+        state.reranked = len(batch)
+        started = time.perf_counter()
+        unique = dedupe(state.ordered())
+        ordering.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        diversify(unique, vectors, positions, k, lam=0.8, quota=0.5)
+        diversity.append(time.perf_counter() - started)
+    return {f"rerank/sort_dedupe_{candidates}": summarize(ordering),
+            f"rerank/mmr_{candidates}": summarize(diversity)}
+
+
+def bench_e2e(concurrency_levels=(1, 8), requests_per_level=BENCH_QUERIES, startup_timeout_s=600):
+    import httpx
+    import uvicorn
+    import main
+    from serve import bind_socket
+
+    sock = bind_socket("127.0.0.1", 0)
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    while not server.started and thread.is_alive() and time.perf_counter() - started < startup_timeout_s:
+        time.sleep(0.05)
+    listening_s = time.perf_counter() - started
+    # Models, index and warm-up load in the background after the port is open
+    if not server.started or not main.startup.wait(max(0.0, startup_timeout_s - listening_s)):
+        server.should_exit = True
+        logging.warning(f"Skipping end-to-end benchmark: server did not become ready ({main.startup.error})")
+        return {"e2e": {"skipped": "server did not become ready"}}
+
+    status = main.startup.status()
+    results = {"e2e/startup": {
+        "listening_s": round(listening_s, 3),
+        "ready_s": round(time.perf_counter() - started, 3),
+        **{f"{name}_s": c["seconds"] for name, c in status["components"].items() if c["seconds"] is not None},
+    }}
+    texts = [item["description"] for item in synthetic_items(requests_per_level)]
+
+    async def drive(concurrency):
+        latencies = []
+        statuses = {}
+        gate = asyncio.Semaphore(concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            async def one(text):
+                async with gate:
+                    t0 = time.perf_counter()
+                    response = await client.post("/recommend", json={"query": text})
+                    latencies.append(time.perf_counter() - t0)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            await asyncio.gather(*(one(t) for t in texts[:min(8, len(texts))]))  # warm-up
+            latencies.clear()
+            statuses.clear()
+            wall = time.perf_counter()
+            await asyncio.gather(*(one(t) for t in texts))
+            wall = time.perf_counter() - wall
+        return latencies, statuses, wall
+
+    try:
+        for concurrency in concurrency_levels:
+            latencies, statuses, wall = asyncio.run(drive(concurrency))
+            summary = summarize(latencies)
+            # Throughput is requests over wall time, not over summed latency
+            summary["qps"] = round(len(latencies) / wall, 2)
+            summary["errors"] = sum(n for status, n in statuses.items() if status != 200)
+            results[f"e2e/recommend_c{concurrency}"] = summary
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+    return results
+
+
+def run(suites=SUITES, sizes=BENCH_SIZES, engines=("flat", "hnsw"), concurrency=(1, 8), queries=BENCH_QUERIES):
+    results = {}
+    if "catalog" in suites:
+        for size in sizes:
+            logging.info(f"Catalog benchmarks at {size} items...")
+            results.update(bench_catalog(size, engines, queries))
+    if "rerank" in suites:
+        results.update(bench_rerank(queries))
+    if "models" in suites:
+        results.update(bench_models(queries))
+    if "e2e" in suites:
+        results.update(bench_e2e(concurrency, queries))
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "suites": list(suites),
+            "sizes": list(sizes),
+            "engines": list(engines),
+            "queries": queries,
+        },
+        "results": results,
+    }
+
+
+def _higher_is_better(metric):
+    return metric.endswith("qps") or metric.startswith("recall")
+
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    # Relative change per shared metric; worse than threshold is a regression
+    deltas = {}
+    regressions = []
+    improvements = []
+    for name, metrics in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            if metric == "errors":
+                # A count, not a ratio: any new error is a regression, including
+                # against a baseline that had none
+                change = (value - old) / abs(old) if old else float(value - old)
+            elif old == 0:
+                continue
+            else:
+                change = (value - old) / abs(old)
+            deltas[f"{name}:{metric}"] = round(change, 4)
+            entry = {"benchmark": name, "metric": metric, "baseline": old, "current": value,
+                     "change": round(change, 4)}
+            if metric == "errors":
+                if value != old:
+                    (regressions if value > old else improvements).append(entry)
+                continue
+            worse = -change if _higher_is_better(metric) else change
+            if worse > threshold:
+                regressions.append(entry)
+            elif worse < -threshold:
+                improvements.append(entry)
+    return {"threshold": threshold, "regressions": regressions, "improvements": improvements, "deltas": deltas}
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline CPU benchmarks for retrieval, reranking and serving")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Write a synthetic catalog (.jsonl or .json)")
+    generate.add_argument("--items", type=int, default=1000)
+    generate.add_argument("--output", required=True)
+    generate.add_argument("--seed", type=int, default=0)
+
+    bench = commands.add_parser("run", help="Run benchmark suites and write a JSON report")
+    bench.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of {','.join(SUITES)}")
+    bench.add_argument("--sizes", type=_ints, default=BENCH_SIZES, help="Synthetic catalog sizes, e.g. 1000,1000000")
+    bench.add_argument("--engines", default="flat,hnsw", help="Index engines for the catalog suite")
+    bench.add_argument("--concurrency", type=_ints, default=[1, 8], help="Concurrency levels for the e2e suite")
+    bench.add_argument("--queries", type=int, default=BENCH_QUERIES)
+    bench.add_argument("--output", default="bench.json")
+    bench.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    bench.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    diff = commands.add_parser("compare", help="Compare two reports")
+    diff.add_argument("report")
+    diff.add_argument("baseline")
+    diff.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        write_catalog(args.output, args.items, args.seed)
+        sys.exit(0)
+
+    if args.command == "run":
+        report = run([s for s in args.suites.split(",") if s], args.sizes, args.engines.split(","),
+                     args.concurrency, args.queries)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Benchmark report written to {args.output}")
+        baseline_file, threshold = args.baseline, args.threshold
+    else:
+        with open(args.report, "r") as f:
+            report = json.load(f)
+        baseline_file, threshold = args.baseline, args.threshold
+
+    if baseline_file:
+        with open(baseline_file, "r") as f:
+            comparison = compare(report, json.load(f), threshold)
+        print(json.dumps({k: v for k, v in comparison.items() if k != "deltas"}, indent=2))
+        # Non-zero exit so CI can fail on a regression
+        sys.exit(1 if comparison["regressions"] else 0)
+    print(json.dumps(report["results"], indent=2))
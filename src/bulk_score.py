@@ -0,0 +1,244 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import logging
+from collections import deque
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Bulk scoring of job-description files:
+#
+#   python src/bulk_score.py jds.csv results.jsonl --workers 4 --top-n 10
+#
+# Rows are streamed from CSV, JSONL or XLSX and scored in chunks through
+# recommend_batch (one encode, one FAISS search and one rerank pass per chunk).
+# With --workers > 1 the models and index are loaded once and forked workers
+# share them, as in serve.py. Results are appended as each chunk finishes and
+# a checkpoint records how far the output got, so a rerun resumes after a crash.
+CHUNK_SIZE = int(os.environ.get("SHL_BULK_CHUNK_SIZE", 64))
+TOP_N = int(os.environ.get("SHL_BULK_TOP_N", 10))
+PROGRESS_S = float(os.environ.get("SHL_BULK_PROGRESS_S", 10))
+
+# Loaded in the parent before forking; workers use the inherited instance
+_rec_system = None
+_top_n = TOP_N
+
+
+def read_rows(path, column="Query"):
+    # Yields one query string per input row, without loading the whole file
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".jsonl":
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield str(json.loads(line).get(column) or "")
+    elif ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows)]
+        index = header.index(column)
+        for row in rows:
+            value = row[index] if index < len(row) else None
+            yield str(value) if value is not None else ""
+        workbook.close()
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(path, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                yield row.get(column) or ""
+
+
+def chunked(rows, size, skip=0):
+    chunk = []
+    start = skip
+    for i, query in enumerate(rows):
+        if i < skip:
+            continue
+        chunk.append(query)
+        if len(chunk) == size:
+            yield start, chunk
+            start += len(chunk)
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def ordered_window(pool, func, items, window):
+    # Like pool.imap, but at most `window` items are read and in flight at once,
+    # so a large input is never queued (and pickled) ahead of the workers.
+    # Results come back in input order.
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _init_worker():
+    # SQLite connections must not be shared across fork
+    if _rec_system.cache is not None:
+        _rec_system.cache.reopen()
+
+
+def score_chunk(args):
+    start, queries = args
+    results = [[] for _ in queries]
+    todo = [i for i, q in enumerate(queries) if q.strip()]
+    if todo:
+        batch = _rec_system.recommend_batch([queries[i] for i in todo], k=_top_n)
+        for i, recs in zip(todo, batch):
+            # Only what the output needs crosses the process boundary
+            results[i] = [
+                {"url": r['url'], "name": r.get('name', ''), "score": float(r.get('rerank_score', r.get('score', 0.0)))}
+                for r in recs
+            ]
+    return start, queries, results
+
+
+class ResultWriter:
+    # Appends results as JSONL or CSV and keeps a checkpoint next to the output
+    def __init__(self, path, top_n, resume=True):
+        self.path = path
+        self.top_n = top_n
+        self.checkpoint_path = path + ".checkpoint"
+        self.csv = os.path.splitext(path)[1].lower() == ".csv"
+        self.rows_done = 0
+        offset = 0
+        if resume and os.path.exists(self.checkpoint_path) and os.path.exists(path):
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            self.rows_done = checkpoint["rows_done"]
+            offset = checkpoint["bytes"]
+        self.file = open(path, "r+b" if offset else "wb")
+        # Drop anything written after the last checkpoint (a chunk cut short by a crash)
+        self.file.truncate(offset)
+        self.file.seek(offset)
+        if self.csv and offset == 0:
+            header = ["row", "Query"] + [f"{name}_{i}" for i in range(1, top_n + 1) for name in ("url", "score")]
+            self._write_csv([header])
+
+    def _write_csv(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        self.file.write(buffer.getvalue().encode("utf-8"))
+
+    def write(self, start, queries, results):
+        if self.csv:
+            rows = []
+            for i, (query, recs) in enumerate(zip(queries, results)):
+                cells = []
+                for r in recs[:self.top_n]:
+                    cells += [r["url"], f"{r['score']:.6f}"]
+                rows.append([start + i, query] + cells)
+            self._write_csv(rows)
+        else:
+            lines = [
+                json.dumps({"row": start + i, "query": query, "results": recs[:self.top_n]})
+                for i, (query, recs) in enumerate(zip(queries, results))
+            ]
+            self.file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        self.rows_done = start + len(queries)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"rows_done": self.rows_done, "bytes": self.file.tell()}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def close(self, finished):
+        self.file.close()
+        if finished and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+def run(input_path, output_path, column="Query", workers=1, chunk_size=CHUNK_SIZE, top_n=TOP_N, resume=True):
+    global _rec_system, _top_n
+
+    if workers > 1:
+        from serve import configure_threads, ensure_index
+
+        # Split cores between workers before torch is imported, and never build
+        # the index in the process the workers fork from
+        configure_threads(workers)
+        ensure_index()
+    from recommender import RecommenderSystem
+
+    _rec_system = RecommenderSystem(build_missing=workers <= 1)
+    _top_n = top_n
+
+    writer = ResultWriter(output_path, top_n, resume=resume)
+    if writer.rows_done:
+        logging.info(f"Resuming after {writer.rows_done} rows from {writer.checkpoint_path}")
+    chunks = chunked(read_rows(input_path, column), chunk_size, skip=writer.rows_done)
+
+    pool = None
+    if workers > 1:
+        import gc
+        import multiprocessing
+
+        # Freeze the preloaded objects so worker GC passes do not un-share their pages
+        gc.collect()
+        gc.freeze()
+        pool = multiprocessing.get_context("fork").Pool(workers, initializer=_init_worker)
+        # Two chunks per worker keep every worker busy while the rest of the input
+        # stays unread; input order keeps the output and checkpoint moving forward
+        scored = ordered_window(pool, score_chunk, chunks, 2 * workers)
+    else:
+        scored = map(score_chunk, chunks)
+
+    started = time.time()
+    last_report = started
+    rows = 0
+    finished = False
+    try:
+        for start, queries, results in scored:
+            writer.write(start, queries, results)
+            rows += len(queries)
+            if time.time() - last_report >= PROGRESS_S:
+                elapsed = time.time() - started
+                logging.info(f"{writer.rows_done} rows done ({rows / elapsed:.1f} rows/s)")
+                last_report = time.time()
+        finished = True
+    finally:
+        if pool is not None:
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+        writer.close(finished)
+
+    elapsed = time.time() - started
+    summary = {
+        "rows": rows,
+        "total_rows": writer.rows_done,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 2) if elapsed > 0 else 0.0,
+        "workers": workers,
+        "chunk_size": chunk_size,
+    }
+    logging.info(f"Bulk scoring finished: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a file of job descriptions in bulk")
+    parser.add_argument("input", help="CSV, JSONL or XLSX with one query per row")
+    parser.add_argument("output", help="Results as .jsonl or .csv")
+    parser.add_argument("--column", default="Query", help="Column (or JSON key) holding the query text")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    parser.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+    print(json.dumps(run(args.input, args.output, args.column, args.workers, args.chunk_size, args.top_n,
+                         resume=not args.no_resume), indent=2))
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import logging
+import numpy as np
+import faiss
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# A bundle is one directory under <processed>/bundles/ holding everything a
+# serving process needs, published by write-then-rename and selected through
+# the CURRENT pointer file:
+#   manifest.json        model, dimension, corpus hash, item count, build time, columns
+#   index.faiss          FAISS index (read with mmap flags)
+#   vectors.npy          normalized float32 vectors in index storage order (np.memmap)
+#   <column>.data.npy    UTF-8 bytes of one metadata column, all rows concatenated
+#   <column>.offsets.npy int64 row offsets into the data file (count + 1 entries)
+#   <column>.nulls.npy   uint8 per row: 0 value stored, NULL or MISSING (columns that have either)
+#   <array>.npy          optional auxiliary arrays (e.g. the BM25 postings), memory-mapped
+#   <document>.json      optional small JSON structures that belong with those arrays
+BUNDLE_FORMAT = 1
+BUNDLES_SUBDIR = "bundles"
+CURRENT_FILE = "CURRENT"
+# Bundles kept on disk (current one included) for rollback; older ones are pruned
+BUNDLE_KEEP = int(os.environ.get("SHL_BUNDLE_KEEP", 2))
+# Re-hash all metadata on load and compare with the manifest (an O(N) pass over
+# every row, so opt-in). The count, dimension and layout checksum checks always run.
+VERIFY_BUNDLE = os.environ.get("SHL_VERIFY_BUNDLE", "0") != "0"
+
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+# Null mask codes; a null or missing field stores no bytes
+NULL = 1
+MISSING = 2
+
+
+class BundleMismatchError(RuntimeError):
+    pass
+
+
+def column_kind(kind, value):
+    # "str" while every value seen is a string (or None), "json" otherwise
+    if value is not None and not isinstance(value, str):
+        return "json"
+    return kind or "str"
+
+
+def encode_field(record, name, kind):
+    # (bytes, null code) for one field of one record; shared by every column writer
+    if name not in record:
+        return b"", MISSING
+    value = record[name]
+    if value is None:
+        return b"", NULL
+    return (value if kind == "str" else json.dumps(value)).encode("utf-8"), 0
+
+
+class ColumnarMetadata:
+    # Read-only sequence of assessment dicts backed by per-column byte arrays.
+    # Rows are decoded on access, so memory-mapped columns stay in page cache.
+    def __init__(self, columns, kinds, nulls=None):
+        self.columns = columns
+        self.kinds = kinds
+        # column -> null mask, only for columns with a null or missing field
+        self.nulls = nulls or {}
+        self.count = len(next(iter(columns.values()))[1]) - 1 if columns else 0
+
+    @classmethod
+    def from_records(cls, records):
+        names = []
+        for record in records:
+            for key in record:
+                if key not in names:
+                    names.append(key)
+
+        columns = {}
+        kinds = {}
+        nulls = {}
+        for name in names:
+            kind = None
+            for record in records:
+                kind = column_kind(kind, record.get(name))
+            kinds[name] = kind
+            encoded, codes = zip(*(encode_field(record, name, kind) for record in records))
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+            data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            columns[name] = (data, offsets)
+            if any(codes):
+                nulls[name] = np.array(codes, dtype=np.uint8)
+        metadata = cls(columns, kinds, nulls)
+        metadata.count = len(records)
+        return metadata
+
+    def __len__(self):
+        return self.count
+
+    def value(self, name, i):
+        # None for a null or missing field
+        mask = self.nulls.get(name)
+        if mask is not None and mask[i]:
+            return None
+        data, offsets = self.columns[name]
+        raw = bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8")
+        return raw if self.kinds[name] == "str" else json.loads(raw)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        # Fields the record never had stay absent
+        return {name: self.value(name, i) for name in self.columns
+                if name not in self.nulls or self.nulls[name][i] != MISSING}
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def save(self, directory):
+        for name, (data, offsets) in self.columns.items():
+            np.save(os.path.join(directory, f"{name}.data.npy"), data)
+            np.save(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+        for name, mask in self.nulls.items():
+            np.save(os.path.join(directory, f"{name}.nulls.npy"), mask)
+
+    @classmethod
+    def load(cls, directory, names, kinds, mmap=True, null_columns=()):
+        mode = "r" if mmap else None
+        columns = {}
+        for name in names:
+            data = np.load(os.path.join(directory, f"{name}.data.npy"), mmap_mode=mode)
+            offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode=mode)
+            columns[name] = (data, offsets)
+        nulls = {name: np.load(os.path.join(directory, f"{name}.nulls.npy"), mmap_mode=mode) for name in null_columns}
+        return cls(columns, kinds, nulls)
+
+
+class IndexBundle:
+    def __init__(self, path, manifest, index, vectors, metadata, arrays=None, documents=None):
+        self.path = path
+        self.manifest = manifest
+        self.index = index
+        self.vectors = vectors
+        self.metadata = metadata
+        self.arrays = arrays or {}
+        self.documents = documents or {}
+
+    @property
+    def version(self):
+        return os.path.basename(self.path)
+
+
+def bundles_root(processed_dir):
+    return os.path.join(processed_dir, BUNDLES_SUBDIR)
+
+
+def current_bundle_path(processed_dir):
+    pointer = os.path.join(processed_dir, CURRENT_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r") as f:
+        name = f.read().strip()
+    path = os.path.join(bundles_root(processed_dir), name)
+    return path if name and os.path.isdir(path) else None
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def layout_checksum(path, manifest):
+    # Cheap fingerprint of the files as published: the row offsets and null masks
+    # of every column (8 bytes per row) plus the size of every other file. A
+    # metadata column reordered or swapped for another bundle's changes it even
+    # when the row count still matches.
+    digest = hashlib.sha1()
+    names = ["index.faiss", "vectors.npy"] + [f"{name}.npy" for name in manifest.get("arrays", [])]
+    hashed = []
+    for column in manifest["columns"]:
+        names.append(f"{column}.data.npy")
+        hashed.append(f"{column}.offsets.npy")
+        if column in manifest.get("nulls", []):
+            hashed.append(f"{column}.nulls.npy")
+    for name in hashed:
+        with open(os.path.join(path, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    for name in names:
+        digest.update(f"{name}:{os.path.getsize(os.path.join(path, name))};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_bundle(processed_dir, index, vectors, assessments, model_name, corpus_hash, extra=None,
+                 arrays=None, documents=None):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not (index.ntotal == len(vectors) == len(assessments)):
+        raise BundleMismatchError(
+            f"Refusing to publish: index has {index.ntotal} vectors, "
+            f"vectors.npy {len(vectors)}, metadata {len(assessments)}"
+        )
+
+    root = bundles_root(processed_dir)
+    os.makedirs(root, exist_ok=True)
+    build_time = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    name = f"{build_time}-{corpus_hash[:12]}"
+    tmp_dir = os.path.join(root, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp_dir)
+
+    try:
+        metadata = assessments if isinstance(assessments, ColumnarMetadata) else ColumnarMetadata.from_records(list(assessments))
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+        np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+        metadata.save(tmp_dir)
+        for array_name, array in (arrays or {}).items():
+            np.save(os.path.join(tmp_dir, f"{array_name}.npy"), np.ascontiguousarray(array))
+        for doc_name, document in (documents or {}).items():
+            with open(os.path.join(tmp_dir, f"{doc_name}.json"), "w") as f:
+                json.dump(document, f)
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "model": model_name,
+            "dimension": int(index.d),
+            "corpus_hash": corpus_hash,
+            "count": int(index.ntotal),
+            "build_time": build_time,
+            "columns": list(metadata.columns),
+            "kinds": metadata.kinds,
+            "nulls": list(metadata.nulls),
+            "arrays": list(arrays or {}),
+            "documents": list(documents or {}),
+        }
+        if extra:
+            manifest.update(extra)
+        manifest["checksum"] = layout_checksum(tmp_dir, manifest)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(tmp_dir)
+
+        final_dir = os.path.join(root, name)
+        if os.path.exists(final_dir):
+            final_dir = os.path.join(root, f"{name}-{uuid.uuid4().hex[:6]}")
+        os.rename(tmp_dir, final_dir)
+        _fsync_dir(root)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Readers switch over atomically when the pointer is replaced
+    pointer = os.path.join(processed_dir, CURRENT_FILE)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(os.path.basename(final_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    _fsync_dir(processed_dir)
+
+    _prune_bundles(root, keep=os.path.basename(final_dir))
+    logging.info(f"Published index bundle {os.path.basename(final_dir)} ({manifest['count']} items)")
+    return final_dir
+
+
+def _prune_bundles(root, keep):
+    # Names start with the build time, so sorting them is chronological
+    others = sorted(n for n in os.listdir(root) if not n.startswith(".") and n != keep)
+    excess = len(others) - max(BUNDLE_KEEP - 1, 0)
+    for name in others[:max(excess, 0)]:
+        # Processes still mapping these files keep their pages until they exit
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def load_bundle(path, model_name=None, mmap=True, corpus_hash_fn=None):
+    with open(os.path.join(path, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleMismatchError(f"Unsupported bundle format {manifest.get('format')} in {path}")
+    if model_name and manifest["model"] != model_name:
+        raise BundleMismatchError(f"Bundle built with {manifest['model']}, expected {model_name}")
+
+    index_path = os.path.join(path, "index.faiss")
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, MMAP_FLAGS)
+        except RuntimeError as e:
+            logging.warning(f"mmap read not supported for this index ({e}); loading into memory")
+            index = faiss.read_index(index_path)
+    else:
+        index = faiss.read_index(index_path)
+
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+    metadata = ColumnarMetadata.load(path, manifest["columns"], manifest["kinds"], mmap=mmap,
+                                     null_columns=manifest.get("nulls", []))
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        for name in manifest.get("arrays", [])
+    }
+    documents = {}
+    for name in manifest.get("documents", []):
+        with open(os.path.join(path, f"{name}.json"), "r") as f:
+            documents[name] = json.load(f)
+
+    counts = {
+        "manifest": manifest["count"],
+        "index": index.ntotal,
+        "vectors": len(vectors),
+        "metadata": len(metadata),
+    }
+    if len(set(counts.values())) != 1:
+        raise BundleMismatchError(f"Bundle {path} is inconsistent: {counts}")
+    if index.d != manifest["dimension"] or (len(vectors) and vectors.shape[1] != index.d):
+        raise BundleMismatchError(f"Bundle {path} dimension mismatch")
+    # Bundles published before the checksum existed have none to compare
+    if "checksum" in manifest and layout_checksum(path, manifest) != manifest["checksum"]:
+        raise BundleMismatchError(f"Bundle {path} files do not match the checksum in its manifest")
+    if VERIFY_BUNDLE and corpus_hash_fn is not None:
+        actual = corpus_hash_fn(metadata)
+        if actual != manifest["corpus_hash"]:
+            raise BundleMismatchError(
+                f"Bundle {path} metadata hash {actual} does not match manifest {manifest['corpus_hash']}"
+            )
+
+    return IndexBundle(path, manifest, index, vectors, metadata, arrays, documents)
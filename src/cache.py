@@ -0,0 +1,412 @@
+import hashlib
+import json
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+import numpy as np
+import faiss
+
+logging.basicConfig(level=logging.INFO)
+
+# Entries per tier, time-to-live in seconds (0 = never expire) and optional
+# SQLite file that lets warm entries survive restarts.
+CACHE_ENABLED = os.environ.get("SHL_CACHE_ENABLED", "1") != "0"
+CACHE_SIZE = int(os.environ.get("SHL_CACHE_SIZE", 10000))
+CACHE_TTL_S = float(os.environ.get("SHL_CACHE_TTL_S", 3600))
+CACHE_PATH = os.environ.get("SHL_CACHE_PATH", "")
+
+# Semantic response cache (off by default: it answers with a neighbour's results).
+# A query whose vector is at least SEMANTIC_THRESHOLD cosine-similar to a recently
+# served query with the same options gets that query's final reranked list.
+SEMANTIC_CACHE = os.environ.get("SHL_SEMANTIC_CACHE", "0") != "0"
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SHL_SEMANTIC_CACHE_SIZE", 2000))
+SEMANTIC_CACHE_TTL_S = float(os.environ.get("SHL_SEMANTIC_CACHE_TTL_S", CACHE_TTL_S))
+SEMANTIC_THRESHOLD = float(os.environ.get("SHL_SEMANTIC_THRESHOLD", 0.92))
+# Share of hits that still run the full pipeline to measure how far cached
+# answers drift from fresh ones (the fresh answer is served and re-cached)
+SEMANTIC_AUDIT_RATE = float(os.environ.get("SHL_SEMANTIC_AUDIT_RATE", 0.05))
+# Nearest cached queries examined per lookup, for entries with other options
+SEMANTIC_NEIGHBORS = 8
+# Recent audits and hit similarities kept for the drift statistics
+SEMANTIC_STATS_WINDOW = 500
+
+TIERS = ("vectors", "candidates", "scores")
+
+
+def make_key(*parts):
+    # Stable string key usable by both the in-memory and SQLite backends
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_S):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.time())
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class SQLiteCache:
+    # On-disk LRU with the same interface as LRUCache. Values are pickled; rows
+    # from other index versions are purged when the version changes.
+    def __init__(self, path, tier, maxsize=CACHE_SIZE, ttl=CACHE_TTL_S):
+        self.path = path
+        self.tier = tier
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = None
+        self.reopen()
+
+    def reopen(self):
+        # SQLite connections must not be shared across fork; each process opens its own
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " tier TEXT, key TEXT, version TEXT, value BLOB, stored_at REAL, accessed_at REAL,"
+            " PRIMARY KEY (tier, key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (tier, accessed_at)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, stored_at FROM cache WHERE tier = ? AND key = ?", (self.tier, key)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE tier = ? AND key = ?", (now, self.tier, key)
+            )
+            self.conn.commit()
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value, version=""):
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                (self.tier, key, version, blob, now, now),
+            )
+            count = self.conn.execute("SELECT COUNT(*) FROM cache WHERE tier = ?", (self.tier,)).fetchone()[0]
+            overflow = count - self.maxsize
+            if overflow > 0:
+                self.conn.execute(
+                    "DELETE FROM cache WHERE rowid IN ("
+                    " SELECT rowid FROM cache WHERE tier = ? ORDER BY accessed_at LIMIT ?)",
+                    (self.tier, overflow),
+                )
+                self.evictions += overflow
+            self.conn.commit()
+
+    def purge_other_versions(self, version):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE tier = ? AND version != ?", (self.tier, version))
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE tier = ?", (self.tier,))
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM cache WHERE tier = ?", (self.tier,)).fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class CacheTier:
+    # Memory LRU in front of an optional SQLite LRU; disk hits are promoted.
+    def __init__(self, name, memory, disk=None):
+        self.name = name
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key, value, version=""):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value, version=version)
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class QueryCache:
+    # Three tiers, each keyed by the index version so a rebuild invalidates them:
+    #   vectors:    query text          -> normalized query vector
+    #   candidates: (query vector, k)   -> FAISS (distances, indices) row
+    #   scores:     (query, url)        -> cross-encoder score
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_S, path=CACHE_PATH):
+        self.version = ""
+        self.tiers = {}
+        for name in TIERS:
+            disk = SQLiteCache(path, name, maxsize=maxsize, ttl=ttl) if path else None
+            self.tiers[name] = CacheTier(name, LRUCache(maxsize=maxsize, ttl=ttl), disk)
+        if path:
+            logging.info(f"Query cache persisted to {path}")
+
+    def set_version(self, version):
+        if version == self.version:
+            return
+        logging.info(f"Query cache bound to index version {version}")
+        self.version = version
+        for tier in self.tiers.values():
+            # Old-version keys can no longer match; drop them instead of waiting for LRU
+            tier.memory.clear()
+            if tier.disk is not None:
+                tier.disk.purge_other_versions(version)
+
+    def reopen(self):
+        for tier in self.tiers.values():
+            if tier.disk is not None:
+                tier.disk.reopen()
+
+    def get(self, tier, *key_parts):
+        return self.tiers[tier].get(make_key(self.version, *key_parts))
+
+    def put(self, tier, value, *key_parts):
+        self.tiers[tier].put(make_key(self.version, *key_parts), value, version=self.version)
+
+    def stats(self):
+        return {"version": self.version, **{name: tier.stats() for name, tier in self.tiers.items()}}
+
+
+def create_query_cache():
+    if not CACHE_ENABLED:
+        return None
+    return QueryCache()
+
+
+class _SemanticEntry:
+    __slots__ = ("query", "options", "results", "stored_at")
+
+    def __init__(self, query, options, results):
+        self.query = query
+        self.options = options
+        self.results = results
+        self.stored_at = time.time()
+
+
+def _copy_results(results):
+    return [dict(r) for r in results]
+
+
+class SemanticCache:
+    # Final reranked lists of recently served queries, looked up by query vector
+    # in a small flat inner-product index (vectors are normalized, so scores are
+    # cosine similarities). Entries only match requests with the same options
+    # (k, filters, rerank mode), expire after ttl, are evicted least recently used
+    # first, and are all dropped when the catalog index version changes.
+    def __init__(self, maxsize=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL_S, threshold=SEMANTIC_THRESHOLD,
+                 audit_rate=SEMANTIC_AUDIT_RATE):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.threshold = float(threshold)
+        self.audit_rate = float(audit_rate)
+        self.lock = threading.Lock()
+        self.index = None
+        self.entries = OrderedDict()
+        self.next_id = 0
+        self.version = ""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.audits = 0
+        self.similarities = deque(maxlen=SEMANTIC_STATS_WINDOW)
+        # Overlap@k between the cached and the fresh list of audited hits
+        self.overlaps = deque(maxlen=SEMANTIC_STATS_WINDOW)
+
+    @staticmethod
+    def options_key(**options):
+        return json.dumps(options, sort_keys=True, default=str)
+
+    def _bind(self, version, dimension):
+        if version != self.version or (self.index is not None and self.index.d != dimension):
+            if self.entries:
+                logging.info(f"Semantic cache cleared for index version {version} ({len(self.entries)} entries)")
+                self.invalidations += 1
+            self.entries.clear()
+            self.index = None
+            self.version = version
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    def _remove(self, ids):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+        if ids:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+
+    def lookup(self, query_vecs, options, version):
+        # One (results copy, similarity, audit) per row, or None on a miss; with
+        # audit=True the caller should recompute and put() the fresh list
+        query_vecs = np.ascontiguousarray(query_vecs, dtype=np.float32)
+        found = [None] * len(query_vecs)
+        with self.lock:
+            self._bind(version, query_vecs.shape[1])
+            if self.entries:
+                now = time.time()
+                expired = []
+                similarities, ids = self.index.search(query_vecs, min(SEMANTIC_NEIGHBORS, len(self.entries)))
+                for row, (row_sims, row_ids) in enumerate(zip(similarities, ids)):
+                    for similarity, entry_id in zip(row_sims, row_ids):
+                        if similarity < self.threshold:
+                            break
+                        entry = self.entries.get(int(entry_id))
+                        if entry is None or entry.options != options:
+                            continue
+                        if self.ttl and now - entry.stored_at > self.ttl:
+                            expired.append(int(entry_id))
+                            continue
+                        self.entries.move_to_end(int(entry_id))
+                        audit = self.audit_rate > 0 and random.random() < self.audit_rate
+                        found[row] = (_copy_results(entry.results), float(similarity), audit)
+                        self.similarities.append(float(similarity))
+                        break
+                self._remove(list(dict.fromkeys(expired)))
+            hits = sum(1 for f in found if f is not None)
+            self.hits += hits
+            self.misses += len(found) - hits
+        return found
+
+    def put(self, query, query_vec, options, results, version, cached=None):
+        # cached: the list a hit returned, when this put() follows an audit
+        query_vec = np.ascontiguousarray(query_vec, dtype=np.float32).reshape(1, -1)
+        with self.lock:
+            self._bind(version, query_vec.shape[1])
+            if cached is not None:
+                self.audits += 1
+                fresh = {r['url'] for r in results}
+                overlap = len(fresh & {r['url'] for r in cached}) / len(fresh) if fresh else 1.0
+                self.overlaps.append(overlap)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = _SemanticEntry(query, options, _copy_results(results))
+            self.index.add_with_ids(query_vec, np.array([entry_id], dtype=np.int64))
+            stale = []
+            now = time.time()
+            # Expired entries tend to sit at the LRU end too
+            for old_id, entry in self.entries.items():
+                if len(self.entries) - len(stale) > self.maxsize:
+                    stale.append(old_id)
+                    self.evictions += 1
+                elif self.ttl and now - entry.stored_at > self.ttl:
+                    stale.append(old_id)
+                else:
+                    break
+            self._remove(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.index = None
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            overlaps = sorted(self.overlaps)
+            return {
+                "version": self.version,
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+                "threshold": self.threshold,
+                "mean_similarity": float(np.mean(self.similarities)) if self.similarities else None,
+                # Quality drift: how much of the fresh top-k the cached answer had
+                "audits": self.audits,
+                "mean_overlap": float(np.mean(overlaps)) if overlaps else None,
+                "p10_overlap": overlaps[int(len(overlaps) * 0.1)] if overlaps else None,
+            }
+
+
+def create_semantic_cache():
+    if not SEMANTIC_CACHE:
+        return None
+    return SemanticCache()
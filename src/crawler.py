@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import logging
+from urllib.parse import urlsplit
+import httpx
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# httpx logs every request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Asynchronous crawler: one pooled keep-alive client, per-host concurrency and
+# rate limits, jittered exponential backoff, and an on-disk response cache that
+# turns repeat fetches into conditional GETs (ETag / Last-Modified -> 304).
+CRAWL_CONCURRENCY = int(os.environ.get("SHL_CRAWL_CONCURRENCY", 16))
+PER_HOST_CONCURRENCY = int(os.environ.get("SHL_CRAWL_PER_HOST", 8))
+# Requests per second per host; 0 disables the rate limit
+PER_HOST_RATE = float(os.environ.get("SHL_CRAWL_RATE", 10))
+MAX_RETRIES = int(os.environ.get("SHL_CRAWL_RETRIES", 4))
+BACKOFF_BASE_S = float(os.environ.get("SHL_CRAWL_BACKOFF_S", 0.5))
+BACKOFF_MAX_S = float(os.environ.get("SHL_CRAWL_BACKOFF_MAX_S", 30))
+REQUEST_TIMEOUT_S = float(os.environ.get("SHL_CRAWL_TIMEOUT_S", 60))
+HTTP_CACHE_DIR = os.environ.get("SHL_HTTP_CACHE_DIR", os.path.join("data", "raw", "http_cache"))
+# Verify TLS certificates (0 only for hosts with a broken chain, never by default)
+VERIFY_TLS = os.environ.get("SHL_CRAWL_VERIFY_TLS", "1") != "0"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5"
+}
+
+
+class FetchResult:
+    def __init__(self, url, status, body, not_modified=False, cache_path=None):
+        self.url = url
+        self.status = status
+        self.body = body
+        # True when the server answered 304 and the cached body was reused
+        self.not_modified = not_modified
+        # Cached copy of the body on disk (None when caching is off)
+        self.cache_path = cache_path
+
+    @property
+    def ok(self):
+        return self.body is not None
+
+
+class HttpCache:
+    # <sha1(url)>.html holds the body, <sha1(url)>.json the validators
+    def __init__(self, directory=HTTP_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json"), os.path.join(self.directory, key + ".html")
+
+    def get(self, url):
+        meta_path, body_path = self._paths(url)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        try:
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def body_path(self, url):
+        return self._paths(url)[1]
+
+    def read_body(self, url):
+        with open(self._paths(url)[1], "rb") as f:
+            return f.read()
+
+    def put(self, url, body, headers):
+        meta_path, body_path = self._paths(url)
+        # Body first, metadata last: a crash never leaves validators without a body
+        with open(body_path + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(body_path + ".tmp", body_path)
+        self._write_meta(meta_path, {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time(),
+        })
+
+    def touch(self, url):
+        meta = self.get(url)
+        if meta is not None:
+            meta["fetched_at"] = time.time()
+            self._write_meta(self._paths(url)[0], meta)
+
+    @staticmethod
+    def _write_meta(path, meta):
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+
+class HostLimiter:
+    # Caps in-flight requests and spaces request starts for one host
+    def __init__(self, concurrency=PER_HOST_CONCURRENCY, rate=PER_HOST_RATE):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            async with self.lock:
+                now = time.monotonic()
+                wait = self.next_start - now
+                self.next_start = max(now, self.next_start) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_S, cap=BACKOFF_MAX_S):
+    # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class Crawler:
+    def __init__(self, concurrency=CRAWL_CONCURRENCY, per_host=PER_HOST_CONCURRENCY, rate=PER_HOST_RATE,
+                 cache_dir=HTTP_CACHE_DIR, retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT_S, verify=VERIFY_TLS):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.rate = rate
+        self.retries = retries
+        self.timeout = timeout
+        self.verify = verify
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.hosts = {}
+        self.client = None
+        self.stats = {"requests": 0, "fetched": 0, "not_modified": 0, "retries": 0, "failed": 0, "bytes": 0}
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(headers=HEADERS, limits=limits, timeout=self.timeout,
+                                        verify=self.verify, follow_redirects=True)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            limiter = self.hosts[host] = HostLimiter(self.per_host, self.rate)
+        return limiter
+
+    async def fetch(self, url):
+        cached = self.cache.get(url) if self.cache is not None else None
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        for attempt in range(self.retries):
+            delay = None
+            try:
+                async with self._limiter(url):
+                    self.stats["requests"] += 1
+                    response = await self.client.get(url, headers=headers)
+                if response.status_code == 304 and cached:
+                    self.stats["not_modified"] += 1
+                    self.cache.touch(url)
+                    return FetchResult(url, 304, self.cache.read_body(url), not_modified=True,
+                                       cache_path=self.cache.body_path(url))
+                if response.status_code in RETRY_STATUSES:
+                    retry_after = response.headers.get("retry-after", "")
+                    # Honoured, but never longer than our own backoff cap
+                    delay = min(float(retry_after), BACKOFF_MAX_S) if retry_after.isdigit() else None
+                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request,
+                                                response=response)
+                response.raise_for_status()
+                body = response.content
+                self.stats["fetched"] += 1
+                self.stats["bytes"] += len(body)
+                cache_path = None
+                if self.cache is not None:
+                    self.cache.put(url, body, response.headers)
+                    cache_path = self.cache.body_path(url)
+                return FetchResult(url, response.status_code, body, cache_path=cache_path)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRY_STATUSES:
+                    logging.warning(f"{url} returned {e.response.status_code}; not retrying")
+                    break
+                last_error = e
+            except httpx.TransportError as e:
+                last_error = e
+
+            if attempt + 1 < self.retries:
+                self.stats["retries"] += 1
+                wait = delay if delay is not None else backoff_delay(attempt)
+                logging.warning(f"Attempt {attempt + 1} failed for {url}: {last_error}; retrying in {wait:.2f}s")
+                await asyncio.sleep(wait)
+
+        self.stats["failed"] += 1
+        logging.error(f"Failed to fetch {url} after retries")
+        return FetchResult(url, None, None)
+
+    async def fetch_all(self, urls):
+        # Yields results as they complete; total concurrency is bounded by the pool
+        tasks = [asyncio.ensure_future(self.fetch(url)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,95 @@
+import os
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# Result diversification after reranking. The cross-encoder scores every
+# candidate on its own, so ten variants of the same Java test can fill the top
+# k. Maximal marginal relevance picks results greedily, trading each
+# candidate's relevance against its similarity to what was already picked:
+#   mmr(c) = lambda * relevance(c) - (1 - lambda) * max_s cos(c, s)
+# The similarities come from the normalized vectors already stored with the
+# FAISS index (one candidates x candidates matrix product, no model calls).
+# An optional type quota caps how many results may share one assessment type
+# (e.g. Technical vs Behavioral/Personality).
+# Off by default: the cross-encoder order stands unless a request asks for
+# "diversity": true or SHL_DIVERSITY=1 turns it on for every request.
+DIVERSITY = os.environ.get("SHL_DIVERSITY", "0") != "0"
+# 1.0 is plain relevance order; lower values favour variety
+MMR_LAMBDA = float(os.environ.get("SHL_MMR_LAMBDA", 0.8))
+# Largest share of k one type may take (0 = no quota); relaxed when the
+# candidates run out of other types
+TYPE_QUOTA = float(os.environ.get("SHL_TYPE_QUOTA", 0))
+
+
+def dedupe(results):
+    # First occurrence of each URL, i.e. its best-ranked copy
+    seen = set()
+    unique = []
+    for r in results:
+        if r['url'] not in seen:
+            unique.append(r)
+            seen.add(r['url'])
+    return unique
+
+
+def normalize(scores):
+    # Cross-encoder logits are unbounded; MMR needs relevance on the cosine scale
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = scores.max() - scores.min()
+    if spread <= 0:
+        return np.ones_like(scores)
+    return (scores - scores.min()) / spread
+
+
+def mmr(relevance, vectors, k, lam=MMR_LAMBDA, types=None, quota=TYPE_QUOTA):
+    # Returns the positions of the k picks, in pick order
+    count = len(relevance)
+    k = min(k, count)
+    similarity = vectors @ vectors.T
+    base = lam * np.asarray(relevance, dtype=np.float32)
+    # Highest similarity to any pick so far; negative similarities carry no penalty
+    redundancy = np.zeros(count, dtype=np.float32)
+    # -inf once picked; closed additionally holds types whose quota is full
+    picked = np.zeros(count, dtype=np.float32)
+    closed = picked
+    cap = None
+    if types is not None and quota > 0:
+        ids = {}
+        codes = np.array([ids.setdefault(t, len(ids)) for t in types])
+        taken = np.zeros(len(ids), dtype=np.int64)
+        cap = max(1, int(np.ceil(quota * k)))
+        closed = picked.copy()
+    picks = []
+    for _ in range(k):
+        scores = base - (1 - lam) * redundancy
+        pick = int(np.argmax(scores + closed))
+        if closed[pick] == -np.inf:
+            # Every open type is used up, so the quota gives way
+            pick = int(np.argmax(scores + picked))
+        picks.append(pick)
+        picked[pick] = closed[pick] = -np.inf
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+        if cap is not None:
+            taken[codes[pick]] += 1
+            if taken[codes[pick]] == cap:
+                closed[codes == codes[pick]] = -np.inf
+    return picks
+
+
+def diversify(results, vectors, positions, k, lam=MMR_LAMBDA, quota=TYPE_QUOTA):
+    # results: deduplicated, in rerank order; vectors: the stored index vectors,
+    # with positions mapping url -> row. Only cross-encoder scored results
+    # compete; an unscored tail (cascade or budget stops) keeps its FAISS order
+    # behind them.
+    scored = results[:next((i for i, r in enumerate(results) if 'rerank_score' not in r), len(results))]
+    if len(scored) < 2 or (lam >= 1 and quota <= 0) or vectors is None:
+        return results[:k]
+    rows = [positions.get(r['url']) for r in scored]
+    if None in rows:
+        return results[:k]
+    types = [r.get('type') or "" for r in scored] if quota > 0 else None
+    picks = mmr(normalize([r['rerank_score'] for r in scored]), np.asarray(vectors[rows], dtype=np.float32),
+                k, lam, types, quota)
+    return ([scored[i] for i in picks] + results[len(scored):])[:k]
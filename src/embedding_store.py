@@ -0,0 +1,69 @@
+import hashlib
+import os
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    # Persistent map of sha1(corpus text) -> normalized embedding.
+    # Vectors are only valid for the model that produced them, so a store
+    # written by another model is ignored on load.
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self.vectors = {}
+
+    def load(self):
+        self.vectors = {}
+        if not os.path.exists(self.path):
+            return self
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    logging.warning(f"Embedding store built with {data['model']}, ignoring it.")
+                    return self
+                for h, vec in zip(data["hashes"], data["vectors"]):
+                    self.vectors[str(h)] = vec
+        except Exception as e:
+            logging.warning(f"Failed to read embedding store {self.path}: {e}")
+            self.vectors = {}
+        logging.info(f"Embedding store: {len(self.vectors)} cached vectors")
+        return self
+
+    def __contains__(self, h):
+        return h in self.vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def get(self, h):
+        return self.vectors.get(h)
+
+    def put_many(self, hashes, vectors):
+        for h, vec in zip(hashes, vectors):
+            self.vectors[h] = np.asarray(vec, dtype=np.float32)
+
+    def retain(self, hashes):
+        # Drop vectors whose text is no longer in the catalog
+        keep = set(hashes)
+        self.vectors = {h: v for h, v in self.vectors.items() if h in keep}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        hashes = np.array(list(self.vectors.keys()), dtype="U40")
+        if self.vectors:
+            vectors = np.stack(list(self.vectors.values())).astype(np.float32)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        # Write-then-rename so a crash never leaves a truncated store behind
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, model=np.array(self.model_name), hashes=hashes, vectors=vectors)
+        os.replace(tmp_path, self.path)
@@ -1,10 +1,21 @@
+import hashlib
 import json
 import os
 import logging
 import pickle
+import sys
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
+from backends import load_bi_encoder
+from embedding_store import EmbeddingStore, text_hash
+from bundle import write_bundle, load_bundle, current_bundle_path, BundleMismatchError
+from lexical import BM25Index, reciprocal_rank_fusion
+from filters import FilterIndex, normalize_filters
+from metrics import stage, load_timer, set_load_state
+from long_query import LONG_QUERY, chunk_query, aggregate
+from index_engines import (INDEX_ENGINE, VECTOR_STORAGE, build_index, engine_config, engine_of, is_exact_flat,
+                           label_lookup, rescore, set_search_params, autotune, tuning_queries)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,94 +29,368 @@ DATA_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
 PROCESSED_DIR = os.path.join(PROJECT_ROOT, "data", "processed")
 
 INPUT_FILE = os.path.join(DATA_DIR, "assessments.json")
+# Legacy two-file layout, still readable when no bundle has been published
 INDEX_FILE = os.path.join(PROCESSED_DIR, "assessments.index")
 MAPPING_FILE = os.path.join(PROCESSED_DIR, "mapping.pkl")
+# Content-hashed vectors reused across rebuilds (see embedding_store.py)
+STORE_FILE = os.path.join(PROCESSED_DIR, "embedding_store.npz")
 
 # Use a lightweight model for speed and assignments
 MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
 
+# Hybrid retrieval: dense and BM25 candidates combined with reciprocal rank fusion
+HYBRID = os.environ.get("SHL_HYBRID", "1") != "0"
+RRF_K = int(os.environ.get("SHL_RRF_K", 60))
+LEXICAL_K = int(os.environ.get("SHL_LEXICAL_K", 50))
+
+# Rows per FAISS add when indexing memory-mapped vectors
+ADD_CHUNK = 65536
+
+def corpus_text(item):
+    # Combine Name + Description + Type for rich context; null fields read as empty
+    return f"{item.get('name') or ''} {item.get('description') or ''} {item.get('type') or ''}"
+
+def compute_index_version(assessments):
+    digest = hashlib.sha1(MODEL_NAME.encode("utf-8"))
+    for item in assessments:
+        digest.update(item.get('url', '').encode("utf-8"))
+        digest.update(corpus_text(item).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def load_assessments():
+    # Try full JSON first
+    if os.path.exists(INPUT_FILE):
+         try:
+             with open(INPUT_FILE, 'r') as f:
+                assessments = json.load(f)
+             if len(assessments) > 0:
+                 logging.info(f"Loaded {len(assessments)} assessments from JSON")
+                 return assessments
+             else:
+                 logging.warning("JSON file empty, trying JSONL...")
+         except: pass
+    
+    # Try partial JSONL
+    partial_file = INPUT_FILE.replace("assessments.json", "assessments_partial.jsonl")
+    if os.path.exists(partial_file):
+        assessments = []
+        with open(partial_file, 'r') as f:
+            for line in f:
+                try:
+                    assessments.append(json.loads(line))
+                except: pass
+        logging.info(f"Loaded {len(assessments)} assessments from JSONL")
+        return assessments
+
+    logging.error(f"Input file not found: {INPUT_FILE} or {partial_file}")
+    return []
+
 class EmbeddingEngine:
-    def __init__(self):
-        logging.info(f"Loading embedding model: {MODEL_NAME}")
-        self.model = SentenceTransformer(MODEL_NAME)
+    def __init__(self, cache=None, index_engine=INDEX_ENGINE, storage=VECTOR_STORAGE, load_model=True):
+        # With load_model=False the caller runs load_model() itself, e.g. alongside load_index()
+        self.model = None
+        if load_model:
+            self.load_model()
         self.index = None
+        # flat, hnsw, ivf-flat or ivf-pq (see index_engines.py); build and tuned
+        # search parameters are kept in engine_config and saved in the manifest
+        self.index_engine = index_engine
+        # float32, fp16, sq8 or pq codes in the index; compressed indexes are
+        # re-scored exactly against self.vectors
+        self.storage = storage
+        self.engine_config = None
+        # FAISS label -> position array, used by re-scoring
+        self.label_lookup = None
         self.assessments = []
+        # Normalized vectors in index storage order (np.memmap when loaded from a bundle)
+        self.vectors = None
+        self.bundle_version = None
+        self.index_version = ""
+        # FAISS label -> position in self.assessments (None when labels are positions)
+        self.label_positions = None
+        self.url_positions = {}
+        # BM25 inverted index over the same positions as self.assessments (see lexical.py)
+        self.lexical = None
+        # Metadata filters: per-type partitions and ID-selector bitmaps (see filters.py)
+        self.filter_index = None
+        # Optional QueryCache (see cache.py) for query vectors and FAISS candidates
+        self.cache = cache
+
+    def load_model(self):
+        logging.info(f"Loading embedding model: {MODEL_NAME}")
+        # torch, onnx or onnx-int8 depending on SHL_INFERENCE_BACKEND (see backends.py)
+        with load_timer("bi_encoder"):
+            self.model = load_bi_encoder(MODEL_NAME)
+        return self.model
+
+    def _refresh_labels(self):
+        if isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            labels = faiss.vector_to_array(self.index.id_map)
+            self.label_positions = {int(label): pos for pos, label in enumerate(labels)}
+        else:
+            labels = np.arange(self.index.ntotal, dtype=np.int64)
+            self.label_positions = None
+        self.label_lookup = label_lookup(self.index)
+        # url -> row of self.vectors, used to diversify results (see diversity.py)
+        self.url_positions = {item['url']: pos for pos, item in enumerate(self.assessments)}
+        # Partition sub-indexes hold float32 copies, so compressed indexes filter with bitmaps only
+        partitions = None if self._rescore_factor() == 1 else []
+        self.filter_index = FilterIndex(self.assessments, self.vectors, labels, partitions)
+
+    def _set_index_version(self, version=None):
+        # A loaded bundle passes its manifest hash instead of re-hashing every row
+        self.index_version = version or compute_index_version(self.assessments)
+        if self.cache is not None:
+            self.cache.set_version(self.index_version)
 
     def load_data(self):
-        # Try full JSON first
-        if os.path.exists(INPUT_FILE):
-             try:
-                 with open(INPUT_FILE, 'r') as f:
-                    self.assessments = json.load(f)
-                 if len(self.assessments) > 0:
-                     logging.info(f"Loaded {len(self.assessments)} assessments from JSON")
-                     return True
-                 else:
-                     logging.warning("JSON file empty, trying JSONL...")
-             except: pass
-        
-        # Try partial JSONL
-        partial_file = INPUT_FILE.replace("assessments.json", "assessments_partial.jsonl")
-        if os.path.exists(partial_file):
-            self.assessments = []
-            with open(partial_file, 'r') as f:
-                for line in f:
-                    try:
-                        self.assessments.append(json.loads(line))
-                    except: pass
-            logging.info(f"Loaded {len(self.assessments)} assessments from JSONL")
-            return len(self.assessments) > 0
-
-        logging.error(f"Input file not found: {INPUT_FILE} or {partial_file}")
-        return False
-
-    def create_index(self):
+        self.assessments = load_assessments()
+        return len(self.assessments) > 0
+
+    def create_index(self, incremental=True):
         if not self.assessments:
             logging.warning("No assessments to index.")
-            return
-
-        # Prepare text for embedding
-        # Combine Name + Description + Type for rich context
-        corpus = [
-            f"{item.get('name', '')} {item.get('description', '')} {item.get('type', '')}"
-            for item in self.assessments
-        ]
-
-        logging.info("Generating embeddings...")
-        embeddings = self.model.encode(corpus, convert_to_numpy=True)
-        
-        # Normalize for cosine similarity (InnerProduct with normalized vectors = Cosine)
-        faiss.normalize_L2(embeddings)
-        
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)
-        self.index.add(embeddings)
-        
-        logging.info(f"Index created with {self.index.ntotal} vectors.")
-        
+            return None
+
+        # Incremental mode diffs against the saved index and only encodes new or
+        # changed texts; full mode re-encodes the whole corpus.
+        if incremental:
+            previous_index, previous_items, previous_vectors = self._read_index_files()
+        else:
+            previous_index, previous_items, previous_vectors = None, [], None
+
+        report = self._apply_changes(previous_index, previous_items, self.assessments,
+                                     reuse_vectors=incremental, previous_vectors=previous_vectors)
+        report["index_engine"] = self._tune_index()
         self.save_index()
+        return report
+
+    def _tune_index(self):
+        # Pick the cheapest efSearch/nprobe meeting the target recall against flat search
+        config = self.engine_config
+        if config["engine"] != "flat":
+            queries, rows = tuning_queries(self.assessments)
+            query_vecs = self._encode(queries)
+            # Pseudo-queries are cut from catalog items; hold those items out by FAISS label
+            held_out = faiss.vector_to_array(self.index.id_map)[rows] if rows is not None else None
+            tuning = autotune(self.index, config["engine"], config["build"], self.vectors, query_vecs,
+                              rescore_factor=config["rescore"], held_out=held_out)
+            config["search"] = tuning.pop("search")
+            config["tuning"] = tuning
+        return {key: value for key, value in config.items() if key != "tuning"}
+
+    def _apply_changes(self, previous_index, previous_items, new_items, reuse_vectors=True, previous_vectors=None):
+        start = time.time()
+        store = EmbeddingStore(STORE_FILE, MODEL_NAME)
+        if reuse_vectors:
+            store.load()
+            if previous_vectors is not None:
+                # Bundles published by the streaming pipeline never went through the store
+                for item, vec in zip(previous_items, previous_vectors):
+                    h = text_hash(corpus_text(item))
+                    if h not in store:
+                        store.put_many([h], [vec])
+
+        # Duplicate URLs: last write wins
+        latest = {}
+        for item in new_items:
+            latest[item['url']] = item
+        new_hashes = {url: text_hash(corpus_text(item)) for url, item in latest.items()}
+
+        index = self._as_id_map(previous_index, previous_vectors) if previous_index is not None else None
+        old = {}
+        if index is not None:
+            for label, item in zip(faiss.vector_to_array(index.id_map), previous_items):
+                old[item['url']] = (int(label), text_hash(corpus_text(item)))
+
+        deleted = [url for url in old if url not in latest]
+        changed = [url for url in latest if url in old and old[url][1] != new_hashes[url]]
+        added = [url for url in latest if url not in old]
+        to_embed = changed + added
+
+        # Only texts never seen before go through the model
+        texts = {new_hashes[url]: corpus_text(latest[url]) for url in to_embed}
+        missing = [h for h in texts if h not in store]
+        if missing:
+            logging.info(f"Generating embeddings for {len(missing)} texts...")
+            # Normalized for cosine similarity (InnerProduct with normalized vectors = Cosine)
+            store.put_many(missing, self.encode_texts([texts[h] for h in missing]))
+
+        if index is None:
+            dimension = self.model.get_sentence_embedding_dimension()
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+        stale = [old[url][0] for url in deleted + changed]
+        if stale:
+            index.remove_ids(np.array(stale, dtype=np.int64))
+
+        labels = []
+        if to_embed:
+            next_label = max((label for label, _ in old.values()), default=-1) + 1
+            for url in to_embed:
+                if url in old:
+                    labels.append(old[url][0])
+                else:
+                    labels.append(next_label)
+                    next_label += 1
+            vectors = np.stack([store.get(new_hashes[url]) for url in to_embed]).astype(np.float32)
+            index.add_with_ids(vectors, np.array(labels, dtype=np.int64))
+
+        # Metadata follows the index storage order so positions stay aligned
+        url_by_label = {label: url for url, (label, _) in old.items() if url in latest}
+        url_by_label.update(zip(labels, to_embed))
+        self.assessments = [latest[url_by_label[int(label)]] for label in faiss.vector_to_array(index.id_map)]
+        self.vectors = np.stack([store.get(text_hash(corpus_text(item))) for item in self.assessments]).astype(np.float32)
+        if self.index_engine == "flat" and self.storage == "float32":
+            self.index = index
+            self.engine_config = engine_config("flat", {"storage": "float32"})
+        else:
+            # The flat ID map above tracks adds/removes; approximate engines and
+            # compressed storage are rebuilt from the stored vectors with the same labels
+            self.index, build = build_index(self.index_engine, self.vectors, faiss.vector_to_array(index.id_map),
+                                            self.storage)
+            self.engine_config = engine_config(self.index_engine, build)
+        self.lexical = BM25Index.build(self.assessments)
+        self._refresh_labels()
+        self._set_index_version()
+
+        store.retain(new_hashes.values())
+        store.save()
+
+        report = {
+            "added": len(added),
+            "changed": len(changed),
+            "deleted": len(deleted),
+            "unchanged": len(latest) - len(added) - len(changed),
+            "encoded": len(missing),
+            "total": self.index.ntotal,
+            "seconds": round(time.time() - start, 3),
+        }
+        logging.info(f"Index updated: {report}")
+        return report
+
+    def publish_vectors(self, assessments, vectors):
+        # Index already-embedded items (e.g. merged streaming shards) and publish a
+        # bundle. assessments and vectors may be memory-mapped; labels are positions.
+        start = time.time()
+        self.assessments = assessments
+        self.vectors = vectors
+        labels = np.arange(len(vectors), dtype=np.int64)
+        if self.index_engine == "flat" and self.storage == "float32":
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            for begin in range(0, len(vectors), ADD_CHUNK):
+                chunk = np.ascontiguousarray(vectors[begin:begin + ADD_CHUNK], dtype=np.float32)
+                self.index.add_with_ids(chunk, labels[begin:begin + ADD_CHUNK])
+            self.engine_config = engine_config("flat", {"storage": "float32"})
+        else:
+            self.index, build = build_index(self.index_engine, vectors, labels, self.storage)
+            self.engine_config = engine_config(self.index_engine, build)
+        self.lexical = BM25Index.build(self.assessments)
+        self._refresh_labels()
+        self._set_index_version()
+        report = {"total": self.index.ntotal, "index_engine": self._tune_index()}
+        self.save_index()
+        report["seconds"] = round(time.time() - start, 3)
+        logging.info(f"Index published from vectors: {report}")
+        return report
+
+    @staticmethod
+    def _as_id_map(index, vectors=None):
+        if isinstance(index, faiss.IndexIDMap2) and is_exact_flat(index):
+            return index
+        # Legacy flat index (positions become labels) or an approximate or
+        # compressed index (labels kept, exact vectors taken from the bundle)
+        if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            labels = faiss.vector_to_array(index.id_map)
+        else:
+            labels = np.arange(index.ntotal, dtype=np.int64)
+        if vectors is None:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        id_map = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+        id_map.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), labels)
+        return id_map
 
     def save_index(self):
         if not os.path.exists(PROCESSED_DIR):
             os.makedirs(PROCESSED_DIR)
-            
-        faiss.write_index(self.index, INDEX_FILE)
-        with open(MAPPING_FILE, 'wb') as f:
-            pickle.dump(self.assessments, f)
-        logging.info(f"Index and mapping saved to {PROCESSED_DIR}")
 
-    def load_index(self):
+        # Index, vectors, metadata and BM25 postings are published together as one versioned bundle
+        arrays, documents = self.lexical.to_arrays() if self.lexical is not None else (None, None)
+        extra = {"index_engine": self.engine_config} if self.engine_config else None
+        path = write_bundle(
+            PROCESSED_DIR, self.index, self.vectors, self.assessments, MODEL_NAME, self.index_version,
+            extra=extra, arrays=arrays, documents=documents,
+        )
+        self.bundle_version = os.path.basename(path)
+        logging.info(f"Index bundle saved to {path}")
+
+    def _read_bundle(self, mmap):
+        path = current_bundle_path(PROCESSED_DIR)
+        if path is None:
+            return None
+        # A bundle whose parts disagree raises instead of serving wrong documents
+        return load_bundle(path, model_name=MODEL_NAME, mmap=mmap, corpus_hash_fn=compute_index_version)
+
+    def _read_index_files(self):
+        # Writable copy of the current index, used as the base for incremental builds
+        bundle = self._read_bundle(mmap=False)
+        if bundle is not None:
+            return bundle.index, bundle.metadata, bundle.vectors
         if not os.path.exists(INDEX_FILE) or not os.path.exists(MAPPING_FILE):
+            return None, [], None
+        index = faiss.read_index(INDEX_FILE)
+        with open(MAPPING_FILE, 'rb') as f:
+            assessments = pickle.load(f)
+        return index, assessments, None
+
+    def load_index(self):
+        with load_timer("index"):
+            loaded = self._load_index()
+        if not loaded:
+            # Not ready: /readyz must not count an index that was never loaded
+            set_load_state("index", "missing", "No index bundle or legacy index files")
+        return loaded
+
+    def _load_index(self):
+        bundle = self._read_bundle(mmap=True)
+        if bundle is not None:
+            self.index = bundle.index
+            self.vectors = bundle.vectors
+            self.assessments = bundle.metadata
+            self.bundle_version = bundle.version
+            saved = bundle.manifest.get("index_engine") or {}
+            self.engine_config = engine_config(saved.get("engine", engine_of(self.index)), saved.get("build", {}),
+                                               saved.get("search"))
+            # Tuned efSearch/nprobe are not part of the serialized index
+            set_search_params(self.index, self.engine_config.get("search", {}))
+            if "bm25_vocab" in bundle.documents:
+                self.lexical = BM25Index.from_arrays(bundle.arrays, bundle.documents, self.assessments)
+            else:
+                # Bundles published before BM25 existed
+                self.lexical = BM25Index.build(self.assessments)
+        elif os.path.exists(INDEX_FILE) and os.path.exists(MAPPING_FILE):
+            logging.info("No index bundle found, reading legacy index and mapping files.")
+            self.index = faiss.read_index(INDEX_FILE)
+            with open(MAPPING_FILE, 'rb') as f:
+                self.assessments = pickle.load(f)
+            if len(self.assessments) != self.index.ntotal:
+                raise BundleMismatchError(
+                    f"{INDEX_FILE} has {self.index.ntotal} vectors but {MAPPING_FILE} has {len(self.assessments)} items"
+                )
+            self.vectors = self.index.reconstruct_n(0, self.index.ntotal)
+            self.engine_config = engine_config("flat", {"storage": "float32"})
+            self.lexical = BM25Index.build(self.assessments)
+        else:
             logging.error("Index or mapping file missing.")
             return False
-            
-        self.index = faiss.read_index(INDEX_FILE)
-        with open(MAPPING_FILE, 'rb') as f:
-            self.assessments = pickle.load(f)
-        logging.info("Index and mapping loaded.")
+
+        self._refresh_labels()
+        self._set_index_version(bundle.manifest.get("corpus_hash") if bundle is not None else None)
+        logging.info(f"Index and mapping loaded ({self.index.ntotal} items, {self.engine_config['engine']} engine, "
+                     f"bundle {self.bundle_version}).")
         return True
 
-    def search(self, query, k=10):
+    def ensure_index(self):
         if not self.index:
             loaded = self.load_index()
             if not loaded:
@@ -114,26 +399,199 @@ class EmbeddingEngine:
                     self.create_index()
                 else:
                     logging.error("Failed to load data for indexing.")
-                    return []
-        
-        if not self.index:
+                    return False
+        return self.index is not None
+
+    def encode_texts(self, texts):
+        # Normalized vectors for catalog texts: no query cache, no "encode" stage timing
+        return self._encode(texts)
+
+    def _encode(self, queries):
+        query_vecs = self.model.encode(list(queries), convert_to_numpy=True)
+        query_vecs = np.ascontiguousarray(query_vecs, dtype=np.float32)
+        faiss.normalize_L2(query_vecs)
+        return query_vecs
+
+    def encode_queries(self, queries):
+        # One bi-encoder forward pass for the whole batch of queries
+        with stage("encode"):
+            return self._encode_cached(list(queries))
+
+    def encode_chunked(self, queries):
+        # (query_vecs, chunks): one vector per query, plus chunks = (chunk_vecs,
+        # owner of each chunk) when some query is too long for the bi-encoder
+        # (see long_query.py). All chunks go through one encode call; a long
+        # query's own vector is the normalized mean of its chunks.
+        queries = list(queries)
+        if not LONG_QUERY:
+            return self.encode_queries(queries), None
+        weight = self.lexical.term_weight if self.lexical is not None else None
+        with stage("query_chunking"):
+            split = [chunk_query(query, weight) for query in queries]
+        if all(len(chunks) == 1 for chunks in split):
+            return self.encode_queries(queries), None
+        chunk_vecs = self.encode_queries([chunk for chunks in split for chunk in chunks])
+        owners = np.repeat(np.arange(len(queries)), [len(chunks) for chunks in split])
+        query_vecs = np.zeros((len(queries), chunk_vecs.shape[1]), dtype=np.float32)
+        np.add.at(query_vecs, owners, chunk_vecs)
+        faiss.normalize_L2(query_vecs)
+        return query_vecs, (chunk_vecs, owners)
+
+    def _encode_cached(self, queries):
+        if self.cache is None:
+            return self._encode(queries)
+
+        cached = [self.cache.get("vectors", q) for q in queries]
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        if missing:
+            # Encode each distinct uncached query once
+            unique = list(dict.fromkeys(queries[i] for i in missing))
+            fresh = dict(zip(unique, self._encode(unique)))
+            for query, vec in fresh.items():
+                self.cache.put("vectors", vec, query)
+            for i in missing:
+                cached[i] = fresh[queries[i]]
+        return np.ascontiguousarray(np.stack(cached), dtype=np.float32)
+
+    def _rescore_factor(self):
+        return self.engine_config.get("rescore", 1) if self.engine_config else 1
+
+    def _faiss_search(self, query_vecs, k, filters):
+        factor = self._rescore_factor()
+        # Compressed codes only shortlist; the final order comes from exact float32 scores
+        fetch = min(k * factor, self.index.ntotal) if factor > 1 else k
+        if filters is None:
+            distances, labels = self.index.search(query_vecs, fetch)
+        else:
+            # Only vectors matching the filters are scanned
+            distances, labels = self.filter_index.search(self.index, query_vecs, fetch, filters)
+        if factor > 1:
+            return rescore(query_vecs, labels, self.vectors, self.label_lookup, k)
+        return distances, labels
+
+    def _search_index(self, query_vecs, k, filters=None):
+        with stage("faiss_search"):
+            return self._search_cached(query_vecs, k, filters)
+
+    def _search_cached(self, query_vecs, k, filters):
+        if self.cache is None:
+            return self._faiss_search(query_vecs, k, filters)
+
+        keys = [vec.tobytes() for vec in query_vecs]
+        rows = [self.cache.get("candidates", key, k, filters) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            distances, indices = self._faiss_search(query_vecs[missing], k, filters)
+            for j, i in enumerate(missing):
+                rows[i] = (distances[j], indices[j])
+                self.cache.put("candidates", rows[i], keys[i], k, filters)
+        return np.stack([r[0] for r in rows]), np.stack([r[1] for r in rows])
+
+    def search_vectors(self, query_vecs, k=10, filters=None, chunks=None):
+        # One FAISS call for all query vectors; returns one result list per row.
+        # With chunks, the chunk vectors are searched instead and each query's
+        # hits are aggregated over its chunks.
+        filters = normalize_filters(filters)
+        if chunks is None:
+            distances, indices = self._search_index(query_vecs, k, filters)
+        else:
+            chunk_vecs, owners = chunks
+            distances, indices = self._search_index(chunk_vecs, k, filters)
+            distances, indices = aggregate(distances, indices, owners, len(query_vecs), k)
+
+        batch_results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results = []
+            for i, idx in enumerate(row_indices):
+                if self.label_positions is not None:
+                    idx = self.label_positions.get(int(idx), -1)
+                # FAISS pads with -1 when k exceeds the number of vectors
+                if 0 <= idx < len(self.assessments):
+                    item = self.assessments[idx].copy()
+                    item['score'] = float(row_distances[i])
+                    results.append(item)
+            batch_results.append(results)
+        return batch_results
+
+    def search_batch(self, queries, k=10, filters=None):
+        if not queries:
             return []
+        if not self.ensure_index():
+            return [[] for _ in queries]
+
+        query_vecs, chunks = self.encode_chunked(queries)
+        return self.search_encoded(queries, query_vecs, k, filters, chunks)
+
+    def search_encoded(self, queries, query_vecs, k=10, filters=None, chunks=None):
+        # Retrieval for already-encoded queries: FAISS plus BM25 fusion
+        filters = normalize_filters(filters)
+        mask = self.filter_index.mask(filters) if filters is not None else None
+        batch_results = self.search_vectors(query_vecs, k, filters, chunks)
+        if HYBRID and self.lexical is not None:
+            with stage("hybrid_fusion"):
+                batch_results = [
+                    self._fuse(query, vec, dense, k, mask) for query, vec, dense in zip(queries, query_vecs, batch_results)
+                ]
+        return batch_results
+
+    def _fuse(self, query, query_vec, dense, k, mask=None):
+        positions, bm25_scores = self.lexical.search(query, LEXICAL_K, mask)
+        if not len(positions):
+            return dense
+
+        by_url = {item['url']: item for item in dense}
+        lexical = {}
+        for pos, bm25 in zip(positions, bm25_scores):
+            item = self.assessments[int(pos)]
+            if item['url'] in by_url:
+                by_url[item['url']]['bm25_score'] = float(bm25)
+            else:
+                lexical[item['url']] = (int(pos), item, float(bm25))
 
-        query_vec = self.model.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(query_vec)
-        
-        distances, indices = self.index.search(query_vec, k)
-        
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.assessments):
-                item = self.assessments[idx].copy()
-                item['score'] = float(distances[0][i])
-                results.append(item)
-                
+        ranked = reciprocal_rank_fusion([list(by_url), [self.assessments[int(p)]['url'] for p in positions]], RRF_K)
+        for url, fused in ranked[:k]:
+            if url in by_url:
+                item = by_url[url]
+            else:
+                pos, item, bm25 = lexical[url]
+                item = dict(item)
+                # Lexical-only hits still get a dense score from the stored vector
+                item['score'] = float(np.dot(self.vectors[pos], query_vec))
+                item['bm25_score'] = bm25
+            item['rrf_score'] = fused
+            results.append(item)
         return results
 
+    def lexical_matches(self, query, k=10, filters=None):
+        # Assessments an exact product-name or product-code query refers to, at
+        # most k; None when the query is not such a lookup
+        if not self.ensure_index() or self.lexical is None:
+            return None
+        filters = normalize_filters(filters)
+        mask = self.filter_index.mask(filters) if filters is not None else None
+        exact = self.lexical.exact_matches(query, mask)[:k]
+        if not exact:
+            return None
+        scores = self.lexical.scores(query, mask)
+        results = []
+        for pos in exact:
+            item = self.assessments[pos].copy()
+            item['score'] = float(scores[pos])
+            item['bm25_score'] = float(scores[pos])
+            results.append(item)
+        return results
+
+    def search(self, query, k=10, filters=None):
+        return self.search_batch([query], k=k, filters=filters)[0]
+
 if __name__ == "__main__":
-    engine = EmbeddingEngine()
+    # Incremental by default; pass --full to re-encode the whole corpus and
+    # --engine hnsw|ivf-flat|ivf-pq to build and autotune an approximate index
+    # --storage fp16|sq8|pq to keep compressed codes in the index
+    index_engine = sys.argv[sys.argv.index("--engine") + 1] if "--engine" in sys.argv else INDEX_ENGINE
+    storage = sys.argv[sys.argv.index("--storage") + 1] if "--storage" in sys.argv else VECTOR_STORAGE
+    engine = EmbeddingEngine(index_engine=index_engine, storage=storage)
     if engine.load_data():
-        engine.create_index()
+        report = engine.create_index(incremental="--full" not in sys.argv)
+        print(json.dumps(report, indent=2))
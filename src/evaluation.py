@@ -1,12 +1,23 @@
-import pandas as pd
-import logging
-from recommender import RecommenderSystem
+import argparse
+import json
 import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from recommender import RecommenderSystem, INITIAL_K
 
 logging.basicConfig(level=logging.INFO)
 
 DATA_DIR = "data/raw"
-DATA_FILE = "/Users/tarandeepsinghjuneja/Downloads/Gen_AI Dataset.xlsx"
+DATA_FILE = os.environ.get("SHL_EVAL_FILE", "/Users/tarandeepsinghjuneja/Downloads/Gen_AI Dataset.xlsx")
+REPORT_FILE = os.environ.get("SHL_EVAL_REPORT", "eval_report.json")
+
+# Cut-offs reported for every metric; retrieval depth is INITIAL_K
+EVAL_KS = (1, 3, 5, 10, 20, 50)
+# Queries per encode/search/rerank call; 0 = the whole set in a single call.
+# Latency percentiles are taken over calls, normalized per query.
+EVAL_BATCH_SIZE = int(os.environ.get("SHL_EVAL_BATCH_SIZE", 0))
 
 def normalize_url(url):
     # Remove domain and protocol
@@ -17,56 +28,228 @@ def normalize_url(url):
         url += '/'
     return url.strip()
 
-def evaluate_model():
-    if not os.path.exists(DATA_FILE):
-        logging.error(f"Dataset not found at {DATA_FILE}")
-        return 0.0
+def normalize_urls(urls):
+    # Column-wise normalize_url for a pandas Series
+    urls = urls.astype(str).str.replace(r"^https?://www\.shl\.com", "", regex=True)
+    urls = urls.str.replace("/solutions", "", regex=False)
+    urls = urls.where(urls.str.endswith("/"), urls + "/")
+    return urls.str.strip()
 
-    logging.info("Loading Train dataset...")
-    df = pd.read_excel(DATA_FILE, sheet_name='Train-Set')
-    
-    # Check if 'Assessment_url' column exists
-    if 'Assessment_url' not in df.columns:
-        logging.error("Column 'Assessment_url' not found in Train-Set")
+def load_eval_set(path=DATA_FILE, sheet="Train-Set"):
+    # One entry per distinct query with all of its relevant URLs. Accepts the
+    # Excel dataset, a CSV with Query/Assessment_url columns, or JSONL lines of
+    # {"query": ..., "relevant": [urls]}.
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xls"):
+        df = pd.read_excel(path, sheet_name=sheet)
+    elif ext == ".jsonl":
+        df = pd.read_json(path, lines=True)
+        df = df.explode("relevant").rename(columns={"query": "Query", "relevant": "Assessment_url"})
+    else:
+        df = pd.read_csv(path)
+
+    if 'Query' not in df.columns or 'Assessment_url' not in df.columns:
+        raise ValueError(f"{path} needs Query and Assessment_url columns")
+    df = df.dropna(subset=['Query', 'Assessment_url'])
+    df['url'] = normalize_urls(df['Assessment_url'])
+    grouped = df.groupby('Query', sort=False)['url'].agg(lambda urls: list(dict.fromkeys(urls)))
+    return list(grouped.index), list(grouped.values)
+
+def relevance_matrix(ranked, relevant, depth):
+    # (queries x depth) matrix with 1 where the result at that rank is relevant
+    rel = np.zeros((len(ranked), depth), dtype=np.float32)
+    for i, (urls, truth) in enumerate(zip(ranked, relevant)):
+        truth = set(truth)
+        hits = [rank for rank, url in enumerate(urls[:depth]) if url in truth]
+        rel[i, hits] = 1.0
+    return rel
+
+def ranking_metrics(rel, n_relevant, ks=EVAL_KS):
+    # recall@k is macro recall: the mean over queries of the share of each query's
+    # relevant URLs found. row_recall@k is the share of all labelled (query, URL)
+    # rows found, the Recall@10 the earlier per-row evaluation (and report.md) used.
+    total_relevant = max(float(np.sum(n_relevant)), 1.0)
+    n_relevant = np.maximum(np.asarray(n_relevant, dtype=np.float32), 1.0)
+    ranks = np.arange(1, rel.shape[1] + 1, dtype=np.float32)
+    discounts = 1.0 / np.log2(ranks + 1)
+    precision = np.cumsum(rel, axis=1) / ranks
+    first_hit = np.where(rel.any(axis=1), rel.argmax(axis=1) + 1, np.inf)
+
+    metrics = {"mrr": float(np.mean(1.0 / first_hit))}
+    for k in ks:
+        if k > rel.shape[1]:
+            continue
+        top = rel[:, :k]
+        ideal = np.minimum(n_relevant, k)
+        idcg = np.cumsum(discounts[:k])[ideal.astype(int) - 1]
+        metrics[f"recall@{k}"] = float(np.mean(top.sum(axis=1) / n_relevant))
+        metrics[f"row_recall@{k}"] = float(top.sum() / total_relevant)
+        metrics[f"hit_rate@{k}"] = float(np.mean(top.any(axis=1)))
+        metrics[f"ndcg@{k}"] = float(np.mean((top * discounts[:k]).sum(axis=1) / idcg))
+        metrics[f"map@{k}"] = float(np.mean((precision[:, :k] * top).sum(axis=1) / ideal))
+    return {name: round(value, 4) for name, value in metrics.items()}
+
+def latency_summary(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    if not len(samples):
+        return {"calls": 0}
+    return {
+        "calls": int(len(samples)),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+    }
+
+def evaluate(rec_system, queries, relevant, ks=EVAL_KS, batch_size=EVAL_BATCH_SIZE, rerank=True):
+    engine = rec_system.engine
+    # Loads the published index, or builds it from the scraped data like search_raw did
+    if not engine.ensure_index():
+        raise RuntimeError("No index loaded or built; run src/embeddings.py first")
+    depth = INITIAL_K
+    batch_size = batch_size or len(queries)
+    # Catalog URLs are normalized once, not per result
+    normalized = {}
+
+    def urls_of(results):
+        out = []
+        for r in results:
+            url = normalized.get(r['url'])
+            if url is None:
+                url = normalized[r['url']] = normalize_url(r['url'])
+            out.append(url)
+        return out
+
+    timings = {"encode": [], "search": [], "rerank": []}
+    retrieved, reranked = [], []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+
+        t0 = time.perf_counter()
+        query_vecs, chunks = engine.encode_chunked(batch)
+        t1 = time.perf_counter()
+        raw = engine.search_encoded(batch, query_vecs, k=depth, chunks=chunks)
+        t2 = time.perf_counter()
+        timings["encode"].append((t1 - t0) * 1000 / len(batch))
+        timings["search"].append((t2 - t1) * 1000 / len(batch))
+        retrieved.extend(urls_of(results) for results in raw)
+
+        if rerank:
+            # Reranks the candidates retrieved above, so both pipelines see the same set
+            t3 = time.perf_counter()
+            results = rec_system.rerank_candidates(batch, [list(r) for r in raw], k=depth)
+            timings["rerank"].append((time.perf_counter() - t3) * 1000 / len(batch))
+            reranked.extend(urls_of(r) for r in results)
+
+    n_relevant = [len(r) for r in relevant]
+    report = {
+        "queries": len(queries),
+        "relevant_per_query": round(float(np.mean(n_relevant)), 2) if n_relevant else 0.0,
+        "batch_size": batch_size,
+        "retrieval": ranking_metrics(relevance_matrix(retrieved, relevant, depth), n_relevant, ks),
+    }
+    if rerank:
+        report["reranked"] = ranking_metrics(relevance_matrix(reranked, relevant, depth), n_relevant, ks)
+    report["latency_per_query"] = {stage: latency_summary(samples) for stage, samples in timings.items() if samples}
+    return report
+
+def config_snapshot(rec_system):
+    import embeddings
+    import diversity
+    import long_query
+    import recommender
+    engine = rec_system.engine
+    return {
+        "model": embeddings.MODEL_NAME,
+        "reranker": recommender.RERANKER_MODEL_NAME,
+        "index_engine": engine.engine_config,
+        "hybrid": embeddings.HYBRID,
+        "rerank_mode": recommender.RERANK_MODE,
+        "long_query": {
+            "enabled": long_query.LONG_QUERY,
+            "chunk_words": long_query.QUERY_CHUNK_WORDS,
+            "aggregation": long_query.CHUNK_AGGREGATION,
+            "rerank_query_tokens": long_query.RERANK_QUERY_TOKENS,
+        },
+        "diversity": {
+            "enabled": diversity.DIVERSITY,
+            "mmr_lambda": diversity.MMR_LAMBDA,
+            "type_quota": diversity.TYPE_QUOTA,
+        },
+        "inference_backend": os.environ.get("SHL_INFERENCE_BACKEND", "torch"),
+        "index_version": engine.index_version,
+        "bundle": engine.bundle_version,
+    }
+
+def compare_reports(report, baseline):
+    # Metric and latency deltas against an earlier report (positive = higher now)
+    delta = {}
+    for section in ("retrieval", "reranked"):
+        if section in report and section in baseline:
+            delta[section] = {
+                name: round(value - baseline[section][name], 4)
+                for name, value in report[section].items() if name in baseline[section]
+            }
+    delta["latency_p50_ms"] = {
+        stage: round(stats["p50_ms"] - baseline["latency_per_query"][stage]["p50_ms"], 3)
+        for stage, stats in report.get("latency_per_query", {}).items()
+        if stage in baseline.get("latency_per_query", {}) and "p50_ms" in stats
+    }
+    return delta
+
+def evaluate_model(data_file=DATA_FILE, report_file=REPORT_FILE, batch_size=EVAL_BATCH_SIZE, rerank=True,
+                   baseline_file=None):
+    if not os.path.exists(data_file):
+        logging.error(f"Dataset not found at {data_file}")
         return 0.0
 
+    logging.info("Loading evaluation queries...")
+    queries, relevant = load_eval_set(data_file)
+
     logging.info("Initializing Recommender...")
     rec_system = RecommenderSystem()
-    
-    recall_at_10 = 0
-    recall_at_20 = 0
-    recall_at_50 = 0
-    total_queries = len(df)
-    
-    logging.info(f"Evaluating {total_queries} queries...")
-    
-    for _, row in df.iterrows():
-        query = row['Query']
-        target_url = normalize_url(str(row['Assessment_url']))
-        
-        # Fetch deep list
-        recommendations = rec_system.search_raw(query, k=50) # Use search_raw to bypass reranker for pure retrieval check
-        rec_urls = [normalize_url(r['url']) for r in recommendations]
-        
-        if target_url in rec_urls[:10]:
-            recall_at_10 += 1
-        if target_url in rec_urls[:20]:
-            recall_at_20 += 1
-        if target_url in rec_urls[:50]:
-            recall_at_50 += 1
-            
-    logging.info(f"Recall@10: {recall_at_10/total_queries:.2f}")
-    logging.info(f"Recall@20: {recall_at_20/total_queries:.2f}")
-    logging.info(f"Recall@50: {recall_at_50/total_queries:.2f}")
-    
-    print(f"FINAL_RECALL_10: {recall_at_10/total_queries:.2f}")
-    
+    # Measure cold retrieval and reranking, not cache hits from earlier runs
+    rec_system.cache = None
+    rec_system.engine.cache = None
+    rec_system.semantic_cache = None
+
+    logging.info(f"Evaluating {len(queries)} queries...")
+    started = time.time()
+    report = evaluate(rec_system, queries, relevant, batch_size=batch_size, rerank=rerank)
+    report["seconds"] = round(time.time() - started, 3)
+    report["dataset"] = data_file
+    report["created"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    report["config"] = config_snapshot(rec_system)
+    if baseline_file and os.path.exists(baseline_file):
+        with open(baseline_file, "r") as f:
+            report["delta"] = compare_reports(report, json.load(f))
+
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Evaluation report written to {report_file}")
+
+    for section in ("retrieval", "reranked"):
+        if section in report:
+            metrics = report[section]
+            logging.info(f"{section}: Macro recall@10 {metrics['recall@10']:.2f}  "
+                         f"Row recall@10 {metrics['row_recall@10']:.2f}  MRR {metrics['mrr']:.2f}  "
+                         f"nDCG@10 {metrics['ndcg@10']:.2f}  MAP@10 {metrics['map@10']:.2f}")
+    if "delta" in report:
+        logging.info(f"Change vs baseline: {report['delta']}")
+
+    retrieval = report["retrieval"]
+    # Macro recall is not comparable with the per-row Recall@10 in report.md; the
+    # row figure is printed next to it under its own name
+    print(f"FINAL_MACRO_RECALL_10: {retrieval['recall@10']:.2f}")
+    print(f"FINAL_ROW_RECALL_10: {retrieval['row_recall@10']:.2f}")
+
     with open("recall.txt", "w") as f:
-        f.write(f"R10: {recall_at_10/total_queries:.2f}\n")
-        f.write(f"R20: {recall_at_20/total_queries:.2f}\n")
-        f.write(f"R50: {recall_at_50/total_queries:.2f}\n")
-    
-    return recall_at_10 / total_queries
+        f.write("# MACRO: mean per-query recall; ROW: share of labelled (query, URL) rows, as in report.md\n")
+        for k in (10, 20, 50):
+            f.write(f"MACRO_R{k}: {retrieval[f'recall@{k}']:.2f}\n")
+            f.write(f"ROW_R{k}: {retrieval[f'row_recall@{k}']:.2f}\n")
+
+    return retrieval['recall@10']
 
 def generate_predictions():
     if not os.path.exists(DATA_FILE):
@@ -102,5 +285,15 @@ def generate_predictions():
     logging.info(f"Predictions saved to {output_path}")
 
 if __name__ == "__main__":
-    score = evaluate_model()
-    generate_predictions()
+    parser = argparse.ArgumentParser(description="Batch evaluation of retrieval and reranking")
+    parser.add_argument("--data", default=DATA_FILE, help="Excel dataset, CSV or JSONL of labeled queries")
+    parser.add_argument("--output", default=REPORT_FILE, help="JSON report path")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE)
+    parser.add_argument("--no-rerank", action="store_true", help="Evaluate retrieval only")
+    parser.add_argument("--skip-predictions", action="store_true")
+    args = parser.parse_args()
+
+    score = evaluate_model(args.data, args.output, args.batch_size, not args.no_rerank, args.baseline)
+    if not args.skip_predictions:
+        generate_predictions()
@@ -0,0 +1,158 @@
+import os
+import threading
+import logging
+import numpy as np
+import faiss
+from index_engines import search_parameters, supports_selector
+
+logging.basicConfig(level=logging.INFO)
+
+# Metadata filters for retrieval, e.g. {"type": "Technical"} or
+# {"type": ["Technical", "Cognitive"]}: values of one field are OR-ed, fields
+# are AND-ed. Fields listed in FILTER_PARTITIONS get one flat sub-index per
+# value, so a single-value filter only scans that partition's vectors; every
+# other filter is applied inside the main FAISS search with an ID-selector bitmap.
+# A partition holds a float32 copy of its vectors, so it is only built the first
+# time a query filters on that value; loading never copies the memory-mapped
+# vectors.
+FILTER_PARTITIONS = [f for f in os.environ.get("SHL_FILTER_PARTITIONS", "type").split(",") if f]
+
+
+class UnknownFilterError(ValueError):
+    pass
+
+
+def normalize_filters(filters):
+    # Canonical, hashable form: ((field, (value, ...)), ...) sorted, or None
+    if not filters:
+        return None
+    if isinstance(filters, tuple):
+        return filters
+    normalized = []
+    for field, values in filters.items():
+        if values is None:
+            continue
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        normalized.append((field, tuple(sorted(str(v) for v in values))))
+    return tuple(sorted(normalized)) or None
+
+
+def _column(assessments, field, i):
+    if hasattr(assessments, "value"):
+        # ColumnarMetadata: decode one column instead of the whole row
+        return assessments.value(field, i)
+    return assessments[i].get(field)
+
+
+class FilterIndex:
+    def __init__(self, assessments, vectors, labels, partition_fields=None):
+        self.assessments = assessments
+        self.vectors = vectors
+        # FAISS label of every storage position
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.count = len(self.labels)
+        if hasattr(assessments, "columns"):
+            self.fields = set(assessments.columns)
+        else:
+            self.fields = set(key for item in assessments for key in item)
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.partitions = {}
+        self.partition_fields = FILTER_PARTITIONS if partition_fields is None else partition_fields
+        # Postings are small position arrays, built up front so forked workers share them
+        for field in self.partition_fields:
+            if field in self.fields:
+                self._postings(field)
+
+    def _postings(self, field):
+        # value -> storage positions, built once per field
+        postings = self.postings.get(field)
+        if postings is None:
+            grouped = {}
+            for i in range(self.count):
+                value = _column(self.assessments, field, i)
+                grouped.setdefault(str(value) if value is not None else "", []).append(i)
+            postings = {value: np.array(rows, dtype=np.int64) for value, rows in grouped.items()}
+            with self.lock:
+                self.postings[field] = postings
+        return postings
+
+    def _partition(self, field, value):
+        key = (field, value)
+        partition = self.partitions.get(key)
+        if partition is None:
+            rows = self._postings(field).get(value, np.zeros(0, dtype=np.int64))
+            with self.lock:
+                # Another thread may have built it while this one waited
+                partition = self.partitions.get(key)
+                if partition is None:
+                    sub = faiss.IndexFlatIP(self.vectors.shape[1])
+                    if len(rows):
+                        sub.add(np.ascontiguousarray(self.vectors[rows], dtype=np.float32))
+                    partition = self.partitions[key] = (sub, rows)
+                    logging.info(f"Built filter partition {field}={value!r} ({len(rows)} vectors)")
+        return partition
+
+    def validate(self, filters):
+        unknown = [field for field, _ in (filters or ()) if field not in self.fields]
+        if unknown:
+            raise UnknownFilterError(f"Unknown filter field(s) {unknown}; available: {sorted(self.fields)}")
+
+    def mask(self, filters):
+        self.validate(filters)
+        mask = np.ones(self.count, dtype=bool)
+        for field, values in filters:
+            postings = self._postings(field)
+            field_mask = np.zeros(self.count, dtype=bool)
+            for value in values:
+                rows = postings.get(value)
+                if rows is not None:
+                    field_mask[rows] = True
+            mask &= field_mask
+        return mask
+
+    @staticmethod
+    def _search_selected(index, query_vecs, k, mask):
+        # The selector only points at the bitmap, so both stay referenced here for the search
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        return index.search(query_vecs, k, params=search_parameters(index, selector))
+
+    def _search_exact(self, query_vecs, k, mask):
+        # Brute force over the matching rows only
+        rows = np.flatnonzero(mask)
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query_vecs.T
+        top = np.argsort(-scores, axis=0, kind="stable")[:k].T
+        distances = np.full((len(query_vecs), k), -np.inf, dtype=np.float32)
+        labels = np.full((len(query_vecs), k), -1, dtype=np.int64)
+        distances[:, :top.shape[1]] = np.take_along_axis(scores.T, top, axis=1)
+        labels[:, :top.shape[1]] = self.labels[rows[top]]
+        return distances, labels
+
+    def search(self, index, query_vecs, k, filters, mask=None):
+        # Returns (distances, FAISS labels) like index.search, restricted to matching items
+        if mask is None:
+            mask = self.mask(filters)
+        matching = int(mask.sum())
+        if matching == 0:
+            return (np.full((len(query_vecs), k), -np.inf, dtype=np.float32),
+                    np.full((len(query_vecs), k), -1, dtype=np.int64))
+
+        partition = next(((f, v[0]) for f, v in filters if f in self.partition_fields and len(v) == 1), None)
+        if partition is not None:
+            sub, rows = self._partition(*partition)
+            if matching < len(rows):
+                distances, sub_ids = self._search_selected(sub, query_vecs, k, mask[rows])
+            else:
+                distances, sub_ids = sub.search(query_vecs, k)
+            labels = np.where(sub_ids >= 0, self.labels[rows[np.maximum(sub_ids, 0)]], -1)
+            return distances, labels
+
+        if not supports_selector(index):
+            return self._search_exact(query_vecs, k, mask)
+
+        # Bitmap over FAISS labels (IndexIDMap translates internal ids to labels)
+        label_mask = np.zeros(int(self.labels.max()) + 1, dtype=bool)
+        label_mask[self.labels[mask]] = True
+        return self._search_selected(index, query_vecs, k, label_mask)
@@ -0,0 +1,423 @@
+import argparse
+import json
+import math
+import os
+import time
+import logging
+import numpy as np
+import faiss
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# FAISS index engines for the catalog. "flat" is exact brute force; the others
+# trade a little recall for much less work per query on large catalogs:
+#   hnsw      graph search, tuned by efSearch
+#   ivf-flat  inverted lists of full vectors, tuned by nprobe
+#   ivf-pq    inverted lists of product-quantized codes, tuned by nprobe
+# Every engine is wrapped in IndexIDMap2 so labels stay stable across rebuilds.
+ENGINES = ("flat", "hnsw", "ivf-flat", "ivf-pq")
+INDEX_ENGINE = os.environ.get("SHL_INDEX_ENGINE", "flat")
+
+# How the index stores vectors: full float32, float16, 8-bit scalar quantized
+# or product-quantized codes (ivf-pq always uses PQ). Compressed indexes only
+# shortlist RESCORE_FACTOR * k candidates; those are re-scored exactly against
+# the float32 vectors.npy of the bundle, which stays memory-mapped on disk.
+STORAGES = ("float32", "fp16", "sq8", "pq")
+VECTOR_STORAGE = os.environ.get("SHL_VECTOR_STORAGE", "float32")
+RESCORE_FACTOR = int(os.environ.get("SHL_RESCORE_FACTOR", 4))
+HNSW_M = int(os.environ.get("SHL_HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("SHL_HNSW_EF_CONSTRUCTION", 200))
+# 0 = about 4 * sqrt(n) lists, capped so each list gets enough training points
+IVF_NLIST = int(os.environ.get("SHL_IVF_NLIST", 0))
+PQ_M = int(os.environ.get("SHL_PQ_M", 48))
+PQ_NBITS = int(os.environ.get("SHL_PQ_NBITS", 8))
+
+# Autotuning: the cheapest search setting whose recall@TUNE_K against flat
+# search reaches TARGET_RECALL on TUNE_QUERIES held-out queries. Those are real
+# queries when there are any: SHL_TUNE_QUERIES_FILE (one per line, or a labelled
+# CSV/XLSX/JSONL set with a Query column), else the labelled train set in
+# SHL_EVAL_FILE. Otherwise they are pseudo-queries taken from catalog
+# descriptions, and each one's own item is held out of the recall measurement.
+TARGET_RECALL = float(os.environ.get("SHL_TARGET_RECALL", 0.95))
+TUNE_K = int(os.environ.get("SHL_TUNE_K", 50))
+TUNE_QUERIES = int(os.environ.get("SHL_TUNE_QUERIES", 200))
+TUNE_QUERIES_FILE = os.environ.get("SHL_TUNE_QUERIES_FILE", "") or os.environ.get("SHL_EVAL_FILE", "")
+
+EF_SEARCH_VALUES = (16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 512)
+
+# faiss k-means wants at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _nlist(n):
+    nlist = IVF_NLIST or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_params(d, n):
+    m = PQ_M
+    while d % m:
+        m -= 1
+    nbits = max(1, min(PQ_NBITS, int(math.log2(max(n // MIN_POINTS_PER_CENTROID, 2)))))
+    return m, nbits
+
+
+def is_compressed(engine, storage):
+    return storage != "float32" or engine == "ivf-pq"
+
+
+def engine_config(engine, build, search=None):
+    # What the manifest records about the index: engine, build and search
+    # parameters, and the shortlist factor for exact re-scoring
+    storage = build.get("storage", "pq" if engine == "ivf-pq" else "float32")
+    return {
+        "engine": engine,
+        "build": build,
+        "search": search or {},
+        "rescore": RESCORE_FACTOR if is_compressed(engine, storage) else 1,
+    }
+
+
+def build_params(engine, d, n, storage="float32"):
+    params = {"storage": "pq" if engine == "ivf-pq" else storage}
+    if engine == "hnsw":
+        params.update(M=HNSW_M, efConstruction=HNSW_EF_CONSTRUCTION)
+    elif engine in ("ivf-flat", "ivf-pq"):
+        params["nlist"] = _nlist(n)
+    if params["storage"] == "pq":
+        params["pq_m"], params["pq_nbits"] = _pq_params(d, n)
+    return params
+
+
+def _factory_string(engine, params):
+    codes = {
+        "float32": "Flat",
+        "fp16": "SQfp16",
+        "sq8": "SQ8",
+        "pq": f"PQ{params.get('pq_m')}x{params.get('pq_nbits')}",
+    }[params["storage"]]
+    if engine == "hnsw":
+        return f"IDMap2,HNSW{params['M']},{codes}"
+    if engine in ("ivf-flat", "ivf-pq"):
+        return f"IDMap2,IVF{params['nlist']},{codes}"
+    return f"IDMap2,{codes}"
+
+
+def build_index(engine, vectors, labels, storage="float32"):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown index engine {engine!r}; choose from {ENGINES}")
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown vector storage {storage!r}; choose from {STORAGES}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    d = vectors.shape[1]
+    params = build_params(engine, d, len(vectors), storage)
+    index = faiss.index_factory(d, _factory_string(engine, params), faiss.METRIC_INNER_PRODUCT)
+    if engine == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = params["efConstruction"]
+    start = time.time()
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.asarray(labels, dtype=np.int64))
+    logging.info(f"Built {engine} index over {index.ntotal} vectors {params} in {time.time() - start:.2f}s")
+    return index, params
+
+
+def _inner(index):
+    return faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+
+
+def is_exact_flat(index):
+    return type(_inner(index)) in (faiss.IndexFlatIP, faiss.IndexFlat)
+
+
+def label_lookup(index):
+    # FAISS label -> storage position as an array (-1 for unused labels)
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return np.arange(index.ntotal, dtype=np.int64)
+    labels = faiss.vector_to_array(index.id_map)
+    lookup = np.full(int(labels.max()) + 1 if len(labels) else 0, -1, dtype=np.int64)
+    lookup[labels] = np.arange(len(labels), dtype=np.int64)
+    return lookup
+
+
+def rescore(query_vecs, labels, vectors, lookup, k):
+    # Exact inner products for a shortlist of labels, re-sorted and cut to k
+    distances = np.full((len(query_vecs), k), -np.inf, dtype=np.float32)
+    result = np.full((len(query_vecs), k), -1, dtype=np.int64)
+    for row, (query, row_labels) in enumerate(zip(query_vecs, labels)):
+        row_labels = row_labels[row_labels >= 0]
+        if not len(row_labels):
+            continue
+        positions = lookup[row_labels]
+        # Sorted positions read the memory-mapped file front to back
+        order = np.argsort(positions)
+        exact = np.asarray(vectors[positions[order]], dtype=np.float32) @ query
+        top = np.argsort(-exact, kind="stable")[:k]
+        distances[row, :len(top)] = exact[top]
+        result[row, :len(top)] = row_labels[order][top]
+    return distances, result
+
+
+def engine_of(index):
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf-pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf-flat"
+    return "flat"
+
+
+def set_search_params(index, params):
+    inner = _inner(index)
+    if "efSearch" in params and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = int(params["efSearch"])
+    if "nprobe" in params and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = int(params["nprobe"])
+
+
+def supports_selector(index):
+    # Flat PQ scans cannot skip codes by ID
+    return not isinstance(_inner(index), faiss.IndexPQ)
+
+
+def search_parameters(index, selector=None):
+    # Per-search parameters for the engine behind index, carrying its current
+    # efSearch/nprobe (IVF and HNSW reject a plain SearchParameters)
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = inner.hnsw.efSearch
+    elif isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = inner.nprobe
+    elif isinstance(inner, faiss.IndexPQ):
+        params = faiss.SearchParametersPQ()
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def _sweep_values(engine, build):
+    if engine == "hnsw":
+        return "efSearch", list(EF_SEARCH_VALUES)
+    nlist = build.get("nlist", 1)
+    values = sorted(set([2 ** i for i in range(int(math.log2(nlist)) + 1)] + [nlist]))
+    return "nprobe", values
+
+
+def hold_out(found, held_out, k):
+    # Drop each query's held-out label from its result row, keeping k columns
+    if held_out is None:
+        return found[:, :k]
+    kept = np.full((len(found), k), -1, dtype=np.int64)
+    for i, (row, label) in enumerate(zip(found, held_out)):
+        row = row[row != label] if label >= 0 else row
+        kept[i, :min(k, len(row))] = row[:k]
+    return kept
+
+
+def recall_at_k(approx, exact):
+    hits = 0
+    total = 0
+    for a, e in zip(approx, exact):
+        truth = set(int(x) for x in e if x >= 0)
+        hits += len(truth & set(int(x) for x in a if x >= 0))
+        total += len(truth)
+    return hits / total if total else 1.0
+
+
+def exact_labels(index, vectors, query_vecs, k):
+    exact_index = faiss.IndexFlatIP(vectors.shape[1])
+    exact_index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    _, exact_positions = exact_index.search(query_vecs, k)
+    labels = faiss.vector_to_array(index.id_map)
+    return np.where(exact_positions >= 0, labels[np.maximum(exact_positions, 0)], -1)
+
+
+def search_rescored(index, query_vecs, k, vectors=None, lookup=None, rescore_factor=1):
+    if rescore_factor <= 1 or vectors is None:
+        return index.search(query_vecs, k)
+    _, shortlist = index.search(query_vecs, min(k * rescore_factor, index.ntotal))
+    return rescore(query_vecs, shortlist, vectors, lookup, k)
+
+
+def autotune(index, engine, build, vectors, query_vecs, k=TUNE_K, target=TARGET_RECALL, rescore_factor=1,
+             held_out=None):
+    # Sweep the engine's search knob from cheapest to most expensive and keep
+    # the first value that reaches the target recall against exact search
+    # (after exact re-scoring when the index stores compressed vectors).
+    # held_out: per query, a label left out of both result lists (-1 for none)
+    if engine == "flat":
+        return {"search": {}, "recall": 1.0}
+
+    k = min(k, index.ntotal)
+    # One extra result, so rows still have k labels once the held-out one is dropped
+    depth = min(k + (held_out is not None), index.ntotal)
+    exact = hold_out(exact_labels(index, vectors, query_vecs, depth), held_out, k)
+    lookup = label_lookup(index)
+
+    knob, values = _sweep_values(engine, build)
+    sweep = []
+    chosen = None
+    for value in values:
+        set_search_params(index, {knob: value})
+        start = time.perf_counter()
+        _, approx = search_rescored(index, query_vecs, depth, vectors, lookup, rescore_factor)
+        approx = hold_out(approx, held_out, k)
+        ms_per_query = (time.perf_counter() - start) * 1000 / max(len(query_vecs), 1)
+        point = {knob: value, "recall": round(recall_at_k(approx, exact), 4), "ms_per_query": round(ms_per_query, 4)}
+        sweep.append(point)
+        if point["recall"] >= target:
+            chosen = point
+            break
+
+    if chosen is None:
+        chosen = max(sweep, key=lambda p: p["recall"])
+        logging.warning(f"{engine} never reached recall@{k} {target}; using {knob}={chosen[knob]} "
+                        f"(recall {chosen['recall']})")
+    set_search_params(index, {knob: chosen[knob]})
+    logging.info(f"Autotuned {engine}: {knob}={chosen[knob]} recall@{k}={chosen['recall']} "
+                 f"{chosen['ms_per_query']} ms/query")
+    return {
+        "search": {knob: chosen[knob]},
+        "recall": chosen["recall"],
+        "ms_per_query": chosen["ms_per_query"],
+        "target_recall": target,
+        "k": k,
+        "rescore_factor": rescore_factor,
+        "queries": len(query_vecs),
+        "sweep": sweep,
+    }
+
+
+def read_queries(path, n=TUNE_QUERIES):
+    # Query texts from a text file (one per line) or the Query column of a
+    # labelled set (the evaluation's Train-Set sheet, CSV or JSONL)
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xls", ".csv", ".jsonl"):
+        import pandas as pd
+        if ext == ".jsonl":
+            df = pd.read_json(path, lines=True).rename(columns={"query": "Query"})
+        elif ext == ".csv":
+            df = pd.read_csv(path)
+        else:
+            df = pd.read_excel(path, sheet_name="Train-Set")
+        queries = [str(q).strip() for q in df["Query"].dropna()]
+    else:
+        with open(path, "r") as f:
+            queries = [line.strip() for line in f]
+    return list(dict.fromkeys(q for q in queries if q))[:n]
+
+
+def tuning_queries(assessments, n=TUNE_QUERIES, path=TUNE_QUERIES_FILE, seed=0):
+    # (query texts, source rows). Real queries have no source rows (None);
+    # pseudo-queries come with the storage position of the item each was cut
+    # from, which autotune holds out, since a query trivially finds its own item
+    if path and os.path.exists(path):
+        queries = read_queries(path, n)
+        if queries:
+            return queries, None
+    rng = np.random.default_rng(seed)
+    queries, rows = [], []
+    for row in rng.permutation(len(assessments))[:n]:
+        item = assessments[int(row)]
+        query = (item.get('description') or item.get('name') or '').split(". ")[0][:200]
+        if query:
+            queries.append(query)
+            rows.append(int(row))
+    return queries, np.array(rows, dtype=np.int64)
+
+
+def compare_storage(vectors, query_vecs, engine="flat", storages=STORAGES, target=TARGET_RECALL,
+                    rescore_factor=RESCORE_FACTOR, held_out=None):
+    # Memory saved vs recall lost for each storage option of one engine, with
+    # and without exact re-scoring
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    labels = np.arange(len(vectors), dtype=np.int64)
+    k = min(TUNE_K, len(vectors))
+    depth = min(k + (held_out is not None), len(vectors))
+    report = []
+    baseline_bytes = None
+    for storage in storages:
+        index, build = build_index(engine, vectors, labels, storage)
+        factor = rescore_factor if is_compressed(engine, storage) else 1
+        tuning = autotune(index, engine, build, vectors, query_vecs, target=target, rescore_factor=factor,
+                          held_out=held_out)
+        exact = hold_out(exact_labels(index, vectors, query_vecs, depth), held_out, k)
+        lookup = label_lookup(index)
+        _, raw = index.search(query_vecs, depth)
+        start = time.perf_counter()
+        _, rescored = search_rescored(index, query_vecs, depth, vectors, lookup, factor)
+        ms_per_query = (time.perf_counter() - start) * 1000 / max(len(query_vecs), 1)
+        raw, rescored = hold_out(raw, held_out, k), hold_out(rescored, held_out, k)
+        index_bytes = len(faiss.serialize_index(index))
+        if baseline_bytes is None:
+            baseline_bytes = index_bytes
+        report.append({
+            "engine": engine,
+            "storage": build["storage"],
+            "search": tuning["search"],
+            "index_bytes": index_bytes,
+            "bytes_per_vector": round(index_bytes / max(len(vectors), 1), 1),
+            "memory_saved": round(1 - index_bytes / baseline_bytes, 4),
+            "recall": round(recall_at_k(raw, exact), 4),
+            "recall_rescored": round(recall_at_k(rescored, exact), 4),
+            "rescore_factor": factor,
+            "ms_per_query": round(ms_per_query, 4),
+        })
+    return report
+
+
+def compare_engines(vectors, query_vecs, engines=ENGINES, target=TARGET_RECALL, held_out=None):
+    # Build and tune every engine over the same vectors; one report row per engine
+    labels = np.arange(len(vectors), dtype=np.int64)
+    report = []
+    for engine in engines:
+        start = time.time()
+        index, build = build_index(engine, vectors, labels)
+        build_s = time.time() - start
+        tuning = autotune(index, engine, build, vectors, query_vecs, target=target, held_out=held_out)
+        start = time.perf_counter()
+        index.search(query_vecs, min(TUNE_K, index.ntotal))
+        report.append({
+            "engine": engine,
+            "build": build,
+            "search": tuning["search"],
+            "recall": tuning["recall"],
+            "ms_per_query": round((time.perf_counter() - start) * 1000 / max(len(query_vecs), 1), 4),
+            "build_s": round(build_s, 3),
+            "index_bytes": len(faiss.serialize_index(index)),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # Compare engines on the current index bundle:
+    #   python src/index_engines.py --target-recall 0.95
+    # or the memory/recall trade-off of the storage options for one engine:
+    #   python src/index_engines.py --storage --engines flat
+    parser = argparse.ArgumentParser(description="Compare FAISS index engines on the current catalog")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    parser.add_argument("--storage", action="store_true", help="Report memory vs recall per storage option")
+    args = parser.parse_args()
+
+    from embeddings import EmbeddingEngine
+
+    engine = EmbeddingEngine()
+    if not engine.ensure_index():
+        raise SystemExit("No index available")
+    queries, held_out = tuning_queries(engine.assessments)
+    query_vecs = engine.encode_queries(queries)
+    vectors = np.ascontiguousarray(engine.vectors, dtype=np.float32)
+    # The comparison indexes label vectors by position, like the source rows
+    if args.storage:
+        report = [row for name in args.engines.split(",")
+                  for row in compare_storage(vectors, query_vecs, name, target=args.target_recall, held_out=held_out)]
+    else:
+        report = compare_engines(vectors, query_vecs, args.engines.split(","), args.target_recall, held_out)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,152 @@
+import os
+import re
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# BM25 over assessment names (boosted), descriptions and types. Postings are
+# stored CSR-style in flat arrays so they can live in the index bundle and be
+# memory-mapped like the vectors.
+BM25_K1 = float(os.environ.get("SHL_BM25_K1", 1.2))
+BM25_B = float(os.environ.get("SHL_BM25_B", 0.75))
+NAME_BOOST = int(os.environ.get("SHL_BM25_NAME_BOOST", 3))
+
+# Exact-name short-circuit, off until evaluation.py shows recall holds. Only two
+# kinds of query count as product lookups: the full name of an assessment
+# ("Core Java (Advanced Level) (New)"), or at most SHORTCIRCUIT_MAX_TOKENS
+# tokens contained in a name and including a product code (letters mixed with
+# digits, e.g. "opq32r"). Job titles such as "Account Manager" never match.
+SHORTCIRCUIT = os.environ.get("SHL_LEXICAL_SHORTCIRCUIT", "0") != "0"
+SHORTCIRCUIT_MAX_TOKENS = int(os.environ.get("SHL_SHORTCIRCUIT_MAX_TOKENS", 4))
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[0-9]+)*")
+
+
+def tokenize(text):
+    # Keeps codes such as "opq32r", "g+", "c#", "c++" and versions like "7.1" whole
+    return TOKEN_RE.findall(text.lower())
+
+
+def is_code(token):
+    # "opq32r", "mq4"; not skills like "c++" or "c#", nor versions like "8" or "7.1"
+    return bool(re.search(r"[0-9]", token)) and bool(re.search(r"[a-z]", token))
+
+
+def _fields(item):
+    return (tokenize(item.get('name') or '') * NAME_BOOST + tokenize(item.get('description') or '')
+            + tokenize(item.get('type') or ''))
+
+
+class BM25Index:
+    def __init__(self, vocab, offsets, docs, tfs, doc_lengths, name_tokens):
+        self.vocab = vocab
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.count = len(doc_lengths)
+        avg = float(doc_lengths.mean()) if self.count else 1.0
+        # Per-document BM25 length normalization, precomputed once
+        self.norms = (BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(avg, 1e-9))).astype(np.float32)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(1 + (self.count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.name_tokens = name_tokens
+        # Full token sequence of each name -> rows, for exact full-name lookups
+        self.names = {}
+        for row, name in enumerate(name_tokens):
+            self.names.setdefault(tuple(name), []).append(row)
+
+    @classmethod
+    def build(cls, assessments):
+        postings = {}
+        doc_lengths = np.zeros(len(assessments), dtype=np.float32)
+        for row, item in enumerate(assessments):
+            tokens = _fields(item)
+            doc_lengths[row] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((row, tf))
+
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in vocab])
+        docs = np.fromiter((row for t in vocab for row, _ in postings[t]), dtype=np.int32, count=int(offsets[-1]))
+        tfs = np.fromiter((tf for t in vocab for _, tf in postings[t]), dtype=np.float32, count=int(offsets[-1]))
+        name_tokens = [tokenize(item.get('name', '')) for item in assessments]
+        return cls(vocab, offsets, docs, tfs, doc_lengths, name_tokens)
+
+    def to_arrays(self):
+        return {
+            "bm25_offsets": self.offsets,
+            "bm25_docs": self.docs,
+            "bm25_tfs": self.tfs,
+            "bm25_doc_lengths": self.doc_lengths,
+        }, {"bm25_vocab": self.vocab}
+
+    @classmethod
+    def from_arrays(cls, arrays, documents, assessments):
+        name_tokens = [tokenize(item.get('name', '')) for item in assessments]
+        return cls(documents["bm25_vocab"], arrays["bm25_offsets"], arrays["bm25_docs"],
+                   arrays["bm25_tfs"], arrays["bm25_doc_lengths"], name_tokens)
+
+    def scores(self, query, mask=None):
+        scores = np.zeros(self.count, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.term_ids.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.docs[start:end]
+            tf = self.tfs[start:end]
+            scores[docs] += self.idf[term] * tf * (BM25_K1 + 1) / (tf + self.norms[docs])
+        if mask is not None:
+            # Filtered-out documents never rank
+            scores[~mask] = 0
+        return scores
+
+    def term_weight(self, text):
+        # Sum of the IDFs of the distinct catalog terms in text: how much of it is
+        # vocabulary that can match assessments (used to condense long queries)
+        terms = [self.term_ids[t] for t in set(tokenize(text)) if t in self.term_ids]
+        return float(self.idf[terms].sum()) if terms else 0.0
+
+    def search(self, query, k, mask=None):
+        # Top-k (positions, scores) with a positive score, best first
+        scores = self.scores(query, mask)
+        k = min(k, self.count)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return top, scores[top]
+
+    def exact_matches(self, query, mask=None):
+        # Rows that a product lookup query names exactly, best first: full-name
+        # matches, then names containing the query's product code
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        rows = list(self.names.get(tuple(tokens), []))
+        if len(tokens) <= SHORTCIRCUIT_MAX_TOKENS and any(is_code(t) for t in tokens):
+            wanted = set(tokens)
+            # Fewest extra name tokens first ("OPQ32r" before "OPQ32r Candidate Report")
+            contained = sorted((len(name), row) for row, name in enumerate(self.name_tokens)
+                               if name and wanted.issubset(name))
+            rows += [row for _, row in contained if row not in rows]
+        if mask is not None:
+            rows = [row for row in rows if mask[row]]
+        return rows
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    # rankings: lists of keys, best first. Returns keys ordered by sum of 1 / (k + rank).
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
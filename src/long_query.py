@@ -0,0 +1,131 @@
+import os
+import re
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# Long queries (pasted job descriptions) on both sides of the pipeline:
+#   retrieval  the bi-encoder truncates at its max sequence length, so a long
+#              query is split into sentence-aligned chunks that are encoded in
+#              the same batch; one FAISS search covers every chunk and each
+#              query's chunk hits are aggregated (max or sum)
+#   reranking  instead of the full text in all 50 pairs, the cross-encoder gets
+#              a condensed query: the sentences carrying the most catalog
+#              vocabulary (BM25 IDF) that fit in RERANK_QUERY_TOKENS
+LONG_QUERY = os.environ.get("SHL_LONG_QUERY", "1") != "0"
+# Words per chunk; MiniLM keeps 256 word pieces, roughly 150-190 English words
+QUERY_CHUNK_WORDS = int(os.environ.get("SHL_QUERY_CHUNK_WORDS", 128))
+QUERY_MAX_CHUNKS = int(os.environ.get("SHL_QUERY_MAX_CHUNKS", 8))
+# "max": best chunk similarity; "sum": similarities added over chunks (divided by
+# the chunk count, so scores stay on the cosine scale)
+CHUNK_AGGREGATION = os.environ.get("SHL_CHUNK_AGGREGATION", "max")
+RERANK_QUERY_TOKENS = int(os.environ.get("SHL_RERANK_QUERY_TOKENS", 64))
+
+# Sentence ends, line breaks and bullet markers
+SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+|\s*\n\s*|\s+[•·*\-]\s+")
+
+
+def sentences(text, max_words=QUERY_CHUNK_WORDS):
+    parts = []
+    for sentence in SENTENCE_RE.split(text):
+        words = sentence.split()
+        # Run-on "sentences" (e.g. comma-separated skill lists) are cut into windows
+        for start in range(0, len(words), max_words):
+            parts.append(" ".join(words[start:start + max_words]))
+    return [p for p in parts if p]
+
+
+def is_long(text, chunk_words=QUERY_CHUNK_WORDS):
+    return len(text.split()) > chunk_words
+
+
+def chunk_query(text, weight=None, chunk_words=QUERY_CHUNK_WORDS, max_chunks=QUERY_MAX_CHUNKS):
+    # Consecutive sentences packed into chunks of at most chunk_words words.
+    # Beyond max_chunks, the chunks with the highest weight(chunk) are kept.
+    if not is_long(text, chunk_words):
+        return [text]
+    chunks = []
+    current = []
+    size = 0
+    for sentence in sentences(text, chunk_words):
+        words = len(sentence.split())
+        if current and size + words > chunk_words:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += words
+    if current:
+        chunks.append(" ".join(current))
+    if len(chunks) > max_chunks:
+        weight = weight or (lambda chunk: len(set(chunk.lower().split())))
+        keep = sorted(sorted(range(len(chunks)), key=lambda i: -weight(chunks[i]))[:max_chunks])
+        chunks = [chunks[i] for i in keep]
+    return chunks
+
+
+def aggregate(distances, labels, owners, count, k, how=CHUNK_AGGREGATION):
+    # distances/labels: one FAISS result row per chunk; owners[row] is the query
+    # the chunk belongs to. Returns (count, k) arrays, -1 padded like FAISS.
+    out_distances = np.full((count, k), -np.inf, dtype=np.float32)
+    out_labels = np.full((count, k), -1, dtype=np.int64)
+    owners = np.asarray(owners)
+    for query in range(count):
+        rows = np.flatnonzero(owners == query)
+        if len(rows) == 1:
+            width = min(k, labels.shape[1])
+            out_distances[query, :width] = distances[rows[0]][:width]
+            out_labels[query, :width] = labels[rows[0]][:width]
+            continue
+        scores = {}
+        for row in rows:
+            for distance, label in zip(distances[row], labels[row]):
+                if label < 0:
+                    continue
+                label = int(label)
+                if how == "sum":
+                    scores[label] = scores.get(label, 0.0) + float(distance) / len(rows)
+                else:
+                    scores[label] = max(scores.get(label, -np.inf), float(distance))
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        for j, (label, score) in enumerate(best):
+            out_labels[query, j] = label
+            out_distances[query, j] = score
+    return out_distances, out_labels
+
+
+def select_chunks(chunks, rows):
+    # The chunks of queries rows (in that order), renumbered 0..len(rows)-1
+    if chunks is None:
+        return None
+    chunk_vecs, owners = chunks
+    position = {query: j for j, query in enumerate(rows)}
+    keep = [i for i, owner in enumerate(owners) if int(owner) in position]
+    return chunk_vecs[keep], np.array([position[int(owners[i])] for i in keep], dtype=np.int64)
+
+
+def condense(text, budget=RERANK_QUERY_TOKENS, count_tokens=None, weight=None):
+    # The highest-weight sentences of text that fit in budget tokens, in their
+    # original order; text itself when it already fits
+    count_tokens = count_tokens or (lambda t: len(t.split()))
+    if budget <= 0 or count_tokens(text) <= budget:
+        return text
+    weight = weight or (lambda sentence: len(set(sentence.lower().split())))
+    # Repeated boilerplate only counts once
+    parts = list(dict.fromkeys(sentences(text)))
+    lengths = [max(1, count_tokens(p)) for p in parts]
+    weights = [weight(p) for p in parts]
+    # Weight per token, so one long sentence does not crowd out several dense ones
+    order = sorted(range(len(parts)), key=lambda i: -weights[i] / np.sqrt(lengths[i]))
+    chosen = []
+    used = 0
+    for i in order:
+        # Sentences without catalog vocabulary only cost reranker tokens
+        if weights[i] > 0 and used + lengths[i] <= budget:
+            chosen.append(i)
+            used += lengths[i]
+    if not chosen:
+        # Even the best sentence is over budget: keep its leading words
+        best = parts[order[0]].split()
+        return " ".join(best[:max(1, budget * len(best) // lengths[order[0]])])
+    return " ".join(parts[i] for i in sorted(chosen))
@@ -1,13 +1,29 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Optional, Union
+import asyncio
+import json
 import logging
+import math
+import os
+import time
 from fastapi.middleware.cors import CORSMiddleware
-from recommender import RecommenderSystem
+from scheduler import BatchScheduler, QueueFullError, DeadlineExceeded, create_inference_executor, INFERENCE_WORKERS
+from process_memory import memory_usage
+from metrics import REGISTRY, PROFILER, PROFILER_ENDPOINTS, TIMING_HEADER, server_timing
+from startup import Startup, warm_up
+from filters import normalize_filters, UnknownFilterError
+# recommender (models, index) is imported by the startup thread, so the server
+# binds its port and answers /livez before it loads
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 
+# Per-request deadline covering queueing and inference
+REQUEST_TIMEOUT_S = float(os.environ.get("SHL_REQUEST_TIMEOUT_S", 10))
+
 app = FastAPI(title="SHL Recommender API")
 
 # Allow CORS for frontend
@@ -20,21 +36,66 @@ app.add_middleware(
 )
 
 # Initialize Recommender
-# Global variable to hold the system
+# Global variables to hold the system and the micro-batching scheduler in front of it
 rec_system = None
+scheduler = None
+inference_pool = None
+# Load progress and readiness, served by /livez, /readyz and /health (see startup.py)
+startup = Startup()
+
+def initialize(startup):
+    global rec_system, scheduler, inference_pool
+    system = rec_system
+    if system is None:
+        startup.set_state("loading")
+        from recommender import RecommenderSystem
+        logging.info("Initializing Recommender System...")
+        system = RecommenderSystem()
+    else:
+        # Preloaded by serve.py in the parent process and inherited through fork
+        logging.info(f"Using preloaded Recommender System in worker {os.getpid()}")
+        startup.preloaded = True
+        if system.cache is not None:
+            system.cache.reopen()
+    # Inference runs on its own bounded pool, never on the request-handling threadpool
+    pool = create_inference_executor(INFERENCE_WORKERS)
+    # Warm up on the inference pool itself, so its threads are the ones made warm
+    startup.set_state("warming")
+    startup.warmup = pool.submit(warm_up, system).result()
+    rec_system, inference_pool = system, pool
+    scheduler = BatchScheduler(rec_system, executor=inference_pool, workers=INFERENCE_WORKERS).start()
+    logging.info("Recommender System initialized.")
 
 @app.on_event("startup")
 def startup_event():
-    global rec_system
-    try:
-        logging.info("Initializing Recommender System...")
-        rec_system = RecommenderSystem()
-        logging.info("Recommender System initialized.")
-    except Exception as e:
-        logging.error(f"Failed to initialize recommender: {e}")
+    startup.start(initialize)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if scheduler:
+        scheduler.stop()
+    if inference_pool:
+        inference_pool.shutdown(wait=False)
+
+def retry_after_seconds():
+    # Rough time for the current backlog to drain, based on recent batch latency
+    stats = scheduler.stats.snapshot()
+    per_batch_s = stats["latency_ms"]["p50"] / 1000.0
+    batches_waiting = scheduler.queue_depth() / max(stats["mean_batch_size"], 1.0)
+    return str(max(1, math.ceil(per_batch_s * batches_waiting)))
 
 class QueryRequest(BaseModel):
     query: str
+    # Optional time budget for retrieval + reranking; enables the rerank cascade
+    latency_budget_ms: Optional[float] = None
+    # Metadata filters, e.g. {"type": "Technical"} or {"type": ["Technical", "Cognitive"]}
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None
+    # MMR diversification of the reranked list; None follows SHL_DIVERSITY
+    diversity: Optional[bool] = None
+
+class StreamRequest(QueryRequest):
+    # Rerank in cascade chunks and stream the top-k after each chunk
+    incremental: bool = False
 
 class AssessmentResponse(BaseModel):
     name: str
@@ -43,18 +104,244 @@ class AssessmentResponse(BaseModel):
     type: str = "Unknown"
     score: Optional[float] = 0.0
 
+    @field_validator("description", "type", mode="before")
+    @classmethod
+    def null_to_default(cls, value, info):
+        # Bundles keep null fields as None; the API answers with the defaults
+        return cls.model_fields[info.field_name].default if value is None else value
+
+@app.get("/livez")
+async def liveness():
+    # The process and its event loop are up; says nothing about the models
+    return {"status": "alive", "pid": os.getpid(), "uptime_s": startup.status()["uptime_s"]}
+
+@app.get("/readyz")
+async def readiness():
+    # 200 once models, index and warm-up are done; 503 with load progress until then
+    status = startup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.get("/health")
-def health_check():
-    return {"status": "ok", "model_loaded": rec_system is not None}
+async def health_check():
+    status = "ok" if startup.ready else startup.status()["status"]
+    return JSONResponse({"status": status, "model_loaded": startup.ready, "error": startup.error},
+                        status_code=200 if startup.ready else 503)
+
+@app.get("/stats")
+def batching_stats():
+    if not scheduler:
+        raise HTTPException(status_code=503, detail=f"Model not loaded yet ({startup.state})")
+    stats = {
+        "batching": scheduler.stats.snapshot(),
+        "process": {"pid": os.getpid(), **memory_usage()},
+    }
+    if rec_system.cache is not None:
+        stats["cache"] = rec_system.cache.stats()
+    if rec_system.semantic_cache is not None:
+        stats["semantic_cache"] = rec_system.semantic_cache.stats()
+    if rec_system.pretokenized is not None:
+        stats["reranker_tokens"] = rec_system.pretokenized.stats()
+    return stats
+
+@REGISTRY.collector
+def serving_metrics():
+    # Gauges read from the scheduler, cache and reranker at scrape time
+    families = []
+    if scheduler is not None:
+        stats = scheduler.stats.snapshot()
+        families += [
+            ("shl_queue_depth", "gauge", "Requests waiting for a batch", [({}, scheduler.queue_depth())]),
+            ("shl_requests_total", "counter", "Requests completed by the batch scheduler", [({}, stats["requests"])]),
+            ("shl_batches_total", "counter", "Batches run by the batch scheduler", [({}, stats["batches"])]),
+            ("shl_rejected_total", "counter", "Requests rejected because the queue was full", [({}, stats["rejected"])]),
+            ("shl_expired_total", "counter", "Requests dropped after their deadline or cancellation", [({}, stats["expired"])]),
+        ]
+    if rec_system is not None and rec_system.cache is not None:
+        cache = rec_system.cache.stats()
+        samples = {"hits": [], "misses": [], "evictions": [], "size": []}
+        for tier, levels in cache.items():
+            if tier == "version":
+                continue
+            for level, values in levels.items():
+                for key in samples:
+                    samples[key].append(({"tier": tier, "level": level}, values[key]))
+        families += [
+            ("shl_cache_hits_total", "counter", "Query cache hits", samples["hits"]),
+            ("shl_cache_misses_total", "counter", "Query cache misses", samples["misses"]),
+            ("shl_cache_evictions_total", "counter", "Query cache evictions", samples["evictions"]),
+            ("shl_cache_entries", "gauge", "Query cache entries", samples["size"]),
+        ]
+    if rec_system is not None and rec_system.semantic_cache is not None:
+        semantic = rec_system.semantic_cache.stats()
+        families += [
+            ("shl_semantic_cache_hits_total", "counter", "Semantic cache hits", [({}, semantic["hits"])]),
+            ("shl_semantic_cache_misses_total", "counter", "Semantic cache misses", [({}, semantic["misses"])]),
+            ("shl_semantic_cache_evictions_total", "counter", "Semantic cache LRU evictions",
+             [({}, semantic["evictions"])]),
+            ("shl_semantic_cache_invalidations_total", "counter", "Semantic cache clears on index version change",
+             [({}, semantic["invalidations"])]),
+            ("shl_semantic_cache_entries", "gauge", "Semantic cache entries", [({}, semantic["size"])]),
+            ("shl_semantic_cache_hit_ratio", "gauge", "Semantic cache hits over lookups", [({}, semantic["hit_rate"])]),
+            ("shl_semantic_cache_audits_total", "counter", "Semantic cache hits recomputed to measure drift",
+             [({}, semantic["audits"])]),
+        ]
+        if semantic["mean_overlap"] is not None:
+            # Drift: share of the fresh top-k that audited cached answers contained
+            families.append(("shl_semantic_cache_overlap", "gauge", "Mean overlap@k of cached and fresh answers",
+                             [({"stat": "mean"}, semantic["mean_overlap"]), ({"stat": "p10"}, semantic["p10_overlap"])]))
+        if semantic["mean_similarity"] is not None:
+            families.append(("shl_semantic_cache_similarity", "gauge", "Mean query similarity of recent hits",
+                             [({}, semantic["mean_similarity"])]))
+    if rec_system is not None and rec_system.pretokenized is not None:
+        tokens = rec_system.pretokenized.stats()
+        families.append(("shl_reranker_padding_ratio", "gauge", "Share of reranker input tokens that are padding",
+                         [({}, tokens["padding_ratio"])]))
+    return families
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _require_profiler():
+    if not PROFILER_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Profiler endpoints are disabled; set SHL_PROFILER_ENDPOINTS=1 to enable them")
+
+@app.post("/debug/profiler/start")
+def start_profiler(interval_ms: Optional[float] = None):
+    _require_profiler()
+    PROFILER.start(interval_ms)
+    return PROFILER.status()
+
+@app.post("/debug/profiler/stop")
+def stop_profiler():
+    _require_profiler()
+    PROFILER.stop()
+    return PROFILER.status()
+
+@app.get("/debug/profiler")
+def profiler_report(limit: Optional[int] = None):
+    # Collapsed stacks ("frame;frame;frame count"), one per line, most frequent first
+    _require_profiler()
+    return PlainTextResponse(PROFILER.collapsed(limit))
+
+def request_options(request):
+    # Scheduler options for a request; requests with equal options can share a batch
+    options = {}
+    if request.latency_budget_ms is not None:
+        options["latency_budget_ms"] = request.latency_budget_ms
+    if request.diversity is not None:
+        options["diversity"] = request.diversity
+    filters = normalize_filters(request.filters)
+    if filters is not None:
+        if rec_system.engine.filter_index is None:
+            # Answering without the filters would silently widen the results
+            raise HTTPException(status_code=503, detail="Metadata filters are not available for the loaded index")
+        try:
+            rec_system.engine.filter_index.validate(filters)
+        except UnknownFilterError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Canonical form, so requests with the same filters share a batch
+        options["filters"] = filters
+    return options
+
+def submit(query, options, trace, listener=None):
+    try:
+        return scheduler.submit(query, timeout=REQUEST_TIMEOUT_S, trace=trace, listener=listener, **options)
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail="Too many requests in flight",
+                            headers={"Retry-After": retry_after_seconds()})
 
 @app.post("/recommend", response_model=List[AssessmentResponse])
-def get_recommendations(request: QueryRequest):
-    if not rec_system:
-        raise HTTPException(status_code=503, detail="Model not loaded yet")
+async def get_recommendations(request: QueryRequest, response: Response,
+                              x_timing: Optional[str] = Header(None)):
+    if not scheduler:
+        raise HTTPException(status_code=503, detail=f"Model not loaded yet ({startup.state})")
     
-    results = rec_system.recommend(request.query)
+    # Concurrent requests are coalesced into one batched encode/search/rerank
+    trace = {}
+    future = submit(request.query, request_options(request), trace)
+
+    try:
+        # Cancelling on timeout also drops the request if it is still queued
+        results = await asyncio.wait_for(asyncio.wrap_future(future), timeout=REQUEST_TIMEOUT_S)
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        raise HTTPException(status_code=503, detail="Request deadline exceeded",
+                            headers={"Retry-After": retry_after_seconds()})
+
+    # How deep the cross-encoder went for this request
+    response.headers["X-Reranked-Candidates"] = str(trace.get("reranked", 0))
+    response.headers["X-Rerank-Stop"] = str(trace.get("rerank_stop", ""))
+    if TIMING_HEADER or x_timing not in (None, "", "0"):
+        # Per-stage milliseconds; batched stages report the whole batch's time
+        response.headers["Server-Timing"] = server_timing(trace)
     return results
 
+def stream_event(event, started, results=None, **fields):
+    payload = {"event": event, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2), **fields}
+    if results is not None:
+        payload["results"] = jsonable_encoder([AssessmentResponse(**r) for r in results])
+    return payload
+
+@app.post("/recommend/stream")
+async def stream_recommendations(request: StreamRequest, accept: Optional[str] = Header(None)):
+    # Progressive results as NDJSON (or SSE with "Accept: text/event-stream"), one event per line:
+    #   candidates  retrieval top-k, as soon as encode + FAISS (+ BM25 fusion) are done
+    #   rerank      top-k after each cross-encoder chunk (cascade reranking or "incremental")
+    #   final       the same answer /recommend gives, plus rerank depth and stage timings
+    #   error       deadline exceeded or a failed batch; always the last event
+    # Exact-name queries answered by the lexical shortcut only send "final".
+    if not scheduler:
+        raise HTTPException(status_code=503, detail=f"Model not loaded yet ({startup.state})")
+    options = request_options(request)
+    if request.incremental:
+        options["rerank_mode"] = "cascade"
+    sse = "text/event-stream" in (accept or "")
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    started = time.perf_counter()
+
+    def listener(event, results):
+        # Called on the inference thread; serialized here because reranking goes
+        # on to modify the same result dicts
+        payload = stream_event(event, started, results)
+        loop.call_soon_threadsafe(events.put_nowait, payload)
+
+    trace = {}
+    future = submit(request.query, options, trace, listener)
+    # Queued after every listener event of the request, so it always arrives last
+    future.add_done_callback(lambda f: loop.call_soon_threadsafe(events.put_nowait, None))
+
+    def encode(payload):
+        data = json.dumps(payload)
+        return f"event: {payload['event']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    async def body():
+        try:
+            while True:
+                remaining = started + REQUEST_TIMEOUT_S - time.perf_counter()
+                payload = await asyncio.wait_for(events.get(), timeout=max(remaining, 0.001))
+                if payload is None:
+                    break
+                yield encode(payload)
+            try:
+                results = future.result()
+            except DeadlineExceeded:
+                yield encode(stream_event("error", started, status=503, detail="Request deadline exceeded"))
+                return
+            except Exception as e:
+                yield encode(stream_event("error", started, status=500, detail=str(e)))
+                return
+            summary = {key: trace.get(key) for key in ("candidates", "reranked", "rerank_stop")}
+            yield encode(stream_event("final", started, results, **summary, timings=trace.get("timings", {})))
+        except asyncio.TimeoutError:
+            yield encode(stream_event("error", started, status=503, detail="Request deadline exceeded"))
+        finally:
+            # Drops the request if it is still queued (deadline or client gone)
+            future.cancel()
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,292 @@
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO)
+
+# In-process instrumentation, exposed in Prometheus text format at /metrics:
+#   shl_stage_seconds{stage}      histogram per pipeline stage (encode, faiss_search, ...)
+#   shl_load_seconds{component}   model and index load times
+#   shl_request_seconds, shl_queue_wait_seconds, shl_batch_size
+# plus gauges collected on scrape (cache, batching, reranker tokens). Every
+# process keeps its own numbers; with serve.py workers, scrape each worker.
+#
+# Stage times are also added to the trace dicts bound with tracing(), which is
+# how /recommend builds its per-request Server-Timing header.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Always send Server-Timing; otherwise only when the request carries "X-Timing: 1"
+TIMING_HEADER = os.environ.get("SHL_TIMING_HEADER", "0") != "0"
+# The /debug/profiler endpoints are unauthenticated, so they are opt-in (and
+# sampling itself stays off until started)
+PROFILER_ENDPOINTS = os.environ.get("SHL_PROFILER_ENDPOINTS", "0") != "0"
+PROFILER_INTERVAL_MS = float(os.environ.get("SHL_PROFILER_INTERVAL_MS", 10))
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # label values -> [bucket counts..., sum, count]
+        self.series = {}
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted(self.series.items())
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labelnames=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in items]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Callables returning [(name, kind, help, [(labels dict, value), ...]), ...] at scrape time
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, *args, **kwargs):
+        metric = Gauge(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.gauge(*args, kind="counter", **kwargs)
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collect in self.collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                logging.warning(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("shl_stage_seconds", "Time spent in each pipeline stage per batch", ["stage"])
+LOAD_SECONDS = REGISTRY.gauge("shl_load_seconds", "Time taken to load each model and index component", ["component"])
+REQUEST_SECONDS = REGISTRY.histogram("shl_request_seconds", "Time from enqueue to result per request")
+QUEUE_SECONDS = REGISTRY.histogram("shl_queue_wait_seconds", "Time a request waited before its batch started")
+BATCH_SIZE = REGISTRY.histogram("shl_batch_size", "Requests per recommend_batch call", buckets=BATCH_BUCKETS)
+
+_local = threading.local()
+
+
+@contextmanager
+def tracing(traces):
+    # Stage times inside this block are also added to each trace dict
+    previous = getattr(_local, "traces", None)
+    _local.traces = [t for t in (traces or ()) if t is not None]
+    try:
+        yield
+    finally:
+        _local.traces = previous
+
+
+def add_timing(trace, name, ms):
+    timings = trace.setdefault("timings", {})
+    timings[name] = timings.get(name, 0.0) + ms
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, name)
+        for trace in getattr(_local, "traces", None) or ():
+            add_timing(trace, name, elapsed * 1000)
+
+
+# component -> {"state": loading|ready|failed|missing, "seconds", "error"}, in load order
+# (shown by /readyz; inherited by workers forked after a preload)
+_loads = {}
+_loads_lock = threading.Lock()
+
+
+def load_states():
+    with _loads_lock:
+        return {name: dict(state) for name, state in _loads.items()}
+
+
+def set_load_state(component, state, error=None):
+    # For outcomes load_timer cannot see, e.g. a load that found nothing to load
+    with _loads_lock:
+        _loads.setdefault(component, {"state": state, "seconds": None, "error": None}).update(state=state, error=error)
+
+
+@contextmanager
+def load_timer(component):
+    started = time.perf_counter()
+    with _loads_lock:
+        _loads[component] = {"state": "loading", "seconds": None, "error": None}
+    try:
+        yield
+    except BaseException as e:
+        with _loads_lock:
+            _loads[component].update(state="failed", seconds=round(time.perf_counter() - started, 4), error=str(e))
+        raise
+    elapsed = time.perf_counter() - started
+    LOAD_SECONDS.set(round(elapsed, 4), component)
+    with _loads_lock:
+        _loads[component].update(state="ready", seconds=round(elapsed, 4))
+    logging.info(f"Loaded {component} in {elapsed:.2f}s")
+
+
+def server_timing(trace):
+    # Server-Timing header value, e.g. "encode;dur=3.1, faiss_search;dur=0.4"
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in (trace or {}).get("timings", {}).items())
+
+
+class SamplingProfiler:
+    # Samples every thread's Python stack at a fixed interval and aggregates
+    # them as collapsed stacks ("root;caller;callee count"), ready for
+    # flamegraph.pl or speedscope. Started and stopped at runtime.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.interval_s = PROFILER_INTERVAL_MS / 1000.0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=None, reset=True):
+        with self.lock:
+            if self.running:
+                return False
+            if reset:
+                self.stacks = Counter()
+                self.samples = 0
+            if interval_ms:
+                self.interval_s = max(float(interval_ms), 1.0) / 1000.0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logging.info(f"Sampling profiler started ({self.interval_s * 1000:.0f} ms interval)")
+        return True
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return False
+        self._stop.set()
+        thread.join()
+        self._thread = None
+        logging.info(f"Sampling profiler stopped after {self.samples} samples")
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            collapsed = []
+            for thread_id, frame in frames.items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                collapsed.append(";".join(reversed(stack)))
+            with self.lock:
+                self.samples += 1
+                self.stacks.update(collapsed)
+
+    def status(self):
+        with self.lock:
+            return {
+                "running": self.running,
+                "interval_ms": self.interval_s * 1000,
+                "samples": self.samples,
+                "distinct_stacks": len(self.stacks),
+                "started_at": self.started_at,
+            }
+
+    def collapsed(self, limit=None):
+        with self.lock:
+            top = self.stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in top)
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,201 @@
+import argparse
+import glob
+import json
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import lxml.html
+from lxml import etree
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# HTML extraction for the scraper. Pages are parsed with lxml and only three
+# things are pulled out: catalog links, the meta description and the
+# main/article paragraphs. Parsing is CPU-bound, so the crawler hands raw bytes
+# to a process pool (PARSE_WORKERS) instead of parsing on its download path.
+PARSE_WORKERS = int(os.environ.get("SHL_PARSE_WORKERS", os.cpu_count() or 1))
+CATALOG_VIEW_PATHS = ("/solutions/products/product-catalog/view/", "/products/product-catalog/view/")
+MIN_PARAGRAPH_CHARS = 20
+
+# Comments and processing instructions never reach the tree
+_PARSER = lxml.html.HTMLParser(remove_comments=True, remove_pis=True)
+_CONTENT_XPATH = etree.XPath(
+    "(//main | //article | //div[contains(concat(' ', normalize-space(@class), ' '), ' content ')])")
+_META_XPATH = etree.XPath("//meta[@name='description']")
+
+TYPE_KEYWORDS = [
+    ('Technical', ['java', 'python', 'coding', 'developer', 'engineer', 'c++', 'sql', 'technical', 'react', 'node', 'aws']),
+    ('Behavioral/Personality', ['personality', 'behavior', 'preference', 'motivation', 'opq', 'cognitive', 'culture', 'sales', 'scenario']),
+    ('Cognitive', ['numerical', 'verbal', 'deductive', 'reasoning', 'ability', 'general ability']),
+]
+
+
+def _document(html):
+    try:
+        return lxml.html.document_fromstring(html, parser=_PARSER)
+    except (etree.ParserError, ValueError):
+        # Empty or undecodable body
+        return None
+
+
+def _text(element):
+    # Same as BeautifulSoup's get_text(strip=True): stripped text nodes, no separator
+    return "".join(s.strip() for s in element.itertext())
+
+
+def classify_type(name, description):
+    text_for_type = (name + " " + description).lower()
+    for label, keywords in TYPE_KEYWORDS:
+        if any(k in text_for_type for k in keywords):
+            return label
+    return 'General/Skills'
+
+
+def parse_catalog_page(html, base_url):
+    doc = _document(html)
+    if doc is None:
+        return []
+    page_assessments = []
+    for link in doc.iter('a'):
+        href = link.get('href')
+        if not href or not any(path in href for path in CATALOG_VIEW_PATHS):
+            continue
+        page_assessments.append({
+            "name": _text(link),
+            "url": base_url + href if href.startswith("/") else href,
+            "description": "",
+            "type": "Unknown"
+        })
+    return page_assessments
+
+
+def parse_details(assessment, html):
+    doc = _document(html)
+    if doc is None:
+        return assessment
+
+    meta = _META_XPATH(doc)
+    if meta:
+        assessment['description'] = (meta[0].get('content') or '').strip()
+
+    # First of main, article, div.content in that order of preference
+    content = _CONTENT_XPATH(doc)
+    main_content = next((el for tag in ('main', 'article', 'div') for el in content if el.tag == tag), None)
+    if main_content is not None:
+        paragraphs = (_text(p) for p in main_content.iter('p'))
+        text_content = " ".join(t for t in paragraphs if len(t) > MIN_PARAGRAPH_CHARS)
+        if text_content:
+            if len(assessment['description']) < 50:
+                assessment['description'] = text_content
+            else:
+                assessment['description'] += " " + text_content[:500]
+
+    assessment['type'] = classify_type(assessment['name'], assessment['description'])
+    return assessment
+
+
+def parse_pool(workers=PARSE_WORKERS):
+    # None means parse inline; callers then use a thread so the event loop stays free.
+    # Workers are spawned, not forked: the streaming pipeline has a model and an
+    # encoder thread in the parent by the time the first page is parsed.
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _reference_details(assessment, html):
+    # The previous BeautifulSoup/html.parser extraction, kept as the benchmark baseline
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    meta_desc = soup.find('meta', attrs={'name': 'description'})
+    if meta_desc:
+        assessment['description'] = meta_desc.get('content', '').strip()
+    main_content = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
+    if main_content:
+        texts = [p.get_text(strip=True) for p in main_content.find_all('p')]
+        text_content = " ".join(t for t in texts if len(t) > MIN_PARAGRAPH_CHARS)
+        if text_content:
+            if len(assessment['description']) < 50:
+                assessment['description'] = text_content
+            else:
+                assessment['description'] += " " + text_content[:500]
+    assessment['type'] = classify_type(assessment['name'], assessment['description'])
+    return assessment
+
+
+def _parse_fixture(path):
+    with open(path, "rb") as f:
+        html = f.read()
+    return parse_details({"name": "", "url": path, "description": "", "type": "Unknown"}, html)
+
+
+def load_fixtures(directory):
+    # Saved detail pages: *.html files, e.g. the crawler's HTTP cache directory
+    paths = sorted(glob.glob(os.path.join(directory, "*.html")))
+    fixtures = []
+    for path in paths:
+        meta_path = path[:-len(".html")] + ".json"
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                url = json.load(f).get("url", "")
+            if not any(p in url for p in CATALOG_VIEW_PATHS):
+                # Catalog listing pages are not detail pages
+                continue
+        fixtures.append(path)
+    return fixtures
+
+
+def benchmark(directory, workers=PARSE_WORKERS, repeat=3):
+    fixtures = load_fixtures(directory)
+    if not fixtures:
+        raise SystemExit(f"No HTML fixtures in {directory}")
+    pages = []
+    for path in fixtures:
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    total_bytes = sum(len(p) for p in pages)
+    blank = lambda: {"name": "", "url": "", "description": "", "type": "Unknown"}
+
+    def timed(label, run):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = run()
+            best = min(best, time.perf_counter() - started)
+        return label, best, results
+
+    runs = [
+        timed("bs4-html.parser", lambda: [_reference_details(blank(), p) for p in pages]),
+        timed("lxml", lambda: [parse_details(blank(), p) for p in pages]),
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(_parse_fixture, fixtures[:workers]))  # start the workers
+            runs.append(timed(f"lxml-pool-{workers}", lambda: list(pool.map(_parse_fixture, fixtures, chunksize=8))))
+
+    reference = runs[0][2]
+    report = {"pages": len(pages), "mb": round(total_bytes / 1e6, 3), "parsers": {}}
+    for label, seconds, results in runs:
+        report["parsers"][label] = {
+            "seconds": round(seconds, 4),
+            "pages_per_second": round(len(pages) / seconds, 1),
+            "mb_per_second": round(total_bytes / 1e6 / seconds, 2),
+            # Extraction differences against the html.parser baseline
+            "mismatches": sum((a["description"], a["type"]) != (b["description"], b["type"])
+                              for a, b in zip(reference, results)),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    from crawler import HTTP_CACHE_DIR
+
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction on saved pages")
+    parser.add_argument("--fixtures", default=HTTP_CACHE_DIR, help="Directory of saved *.html detail pages")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.fixtures, args.workers, args.repeat), indent=2))
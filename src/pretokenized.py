@@ -0,0 +1,166 @@
+import os
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# The document side of every (query, document) reranker pair is tokenized once
+# per index version and kept as one flat int32 array plus offsets. Per request
+# only the query is tokenized; pairs are assembled from token IDs, sorted by
+# length and split into batches that are each padded to their own longest pair.
+# Pairs are truncated exactly as CrossEncoder.predict does (longest_first at the
+# reranker's max_length), so scores match the untokenized path.
+PRETOKENIZE = os.environ.get("SHL_PRETOKENIZE", "1") != "0"
+RERANK_BATCH_SIZE = int(os.environ.get("SHL_RERANK_BATCH_SIZE", 32))
+
+
+def doc_text(item):
+    # Rich text representation of an assessment for the reranker
+    return f"{item.get('name') or ''}. {item.get('description') or ''}"
+
+
+def pair_template(tokenizer):
+    # Learn where the tokenizer puts special tokens around a (query, document)
+    # pair by encoding a probe pair, e.g. [CLS] q [SEP] d [SEP] for BERT.
+    query_ids = tokenizer("query", add_special_tokens=False)["input_ids"]
+    doc_ids = tokenizer("document", add_special_tokens=False)["input_ids"]
+    encoded = tokenizer("query", "document")
+    ids = list(encoded["input_ids"])
+    types = list(encoded.get("token_type_ids") or [0] * len(ids))
+
+    q = next(i for i in range(len(ids)) if ids[i:i + len(query_ids)] == query_ids)
+    d = next(i for i in range(q + len(query_ids), len(ids)) if ids[i:i + len(doc_ids)] == doc_ids)
+    q_end, d_end = q + len(query_ids), d + len(doc_ids)
+    return (
+        (ids[:q], types[:q]),
+        types[q],
+        (ids[q_end:d], types[q_end:d]),
+        types[d],
+        (ids[d_end:], types[d_end:]),
+    )
+
+
+def longest_first(query_len, doc_len, budget):
+    # Kept lengths under the fast tokenizers' longest_first strategy: the shorter
+    # side (the query on a tie) keeps up to half the budget, the longer the rest
+    if query_len + doc_len <= budget:
+        return query_len, doc_len
+    if query_len <= doc_len:
+        query_len = min(query_len, budget // 2)
+        return query_len, min(doc_len, budget - query_len)
+    doc_len = min(doc_len, budget // 2)
+    return min(query_len, budget - doc_len), doc_len
+
+
+class DocTokenStore:
+    def __init__(self, tokenizer, assessments, max_tokens):
+        texts = [doc_text(item) for item in assessments]
+        encoded = tokenizer(texts, add_special_tokens=False)["input_ids"] if texts else []
+        # Full lengths decide which side of a pair longest_first trims; only the
+        # first max_tokens IDs can survive truncation, so only those are kept
+        self.lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+        encoded = [ids[:max_tokens] for ids in encoded]
+        lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lengths)
+        self.ids = np.fromiter((t for ids in encoded for t in ids), dtype=np.int32, count=int(self.offsets[-1]))
+        self.rows = {item.get('url'): row for row, item in enumerate(assessments)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def nbytes(self):
+        return self.ids.nbytes + self.offsets.nbytes + self.lengths.nbytes
+
+    def get(self, url):
+        # (kept token IDs, full token count), or None for an unknown URL
+        row = self.rows.get(url)
+        if row is None:
+            return None
+        return self.ids[self.offsets[row]:self.offsets[row + 1]], int(self.lengths[row])
+
+
+class PretokenizedReranker:
+    def __init__(self, tokenizer, scorer, max_length):
+        self.tokenizer = tokenizer
+        self.scorer = scorer
+        self.max_length = max_length
+        self.input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids")
+                            if n in tokenizer.model_input_names]
+        self.template = pair_template(tokenizer)
+        self.store = None
+        self.version = None
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    @classmethod
+    def create(cls, reranker, scorer):
+        tokenizer = getattr(reranker, "tokenizer", None)
+        if scorer is None or tokenizer is None:
+            return None
+        max_length = getattr(reranker, "max_length", None) or min(tokenizer.model_max_length, 512)
+        return cls(tokenizer, scorer, int(max_length))
+
+    def build(self, assessments, version):
+        # No side of a pair can keep more than max_length tokens
+        self.store = DocTokenStore(self.tokenizer, assessments, self.max_length)
+        self.version = version
+        logging.info(f"Pre-tokenized {len(self.store)} reranker documents ({self.store.nbytes() / 1024:.0f} KB)")
+
+    def _pair(self, query_ids, doc_ids, doc_len):
+        prefix, query_type, middle, doc_type, suffix = self.template
+        # Leave room for the special tokens the tokenizer adds around a pair
+        special = len(prefix[0]) + len(middle[0]) + len(suffix[0])
+        query_len, doc_len = longest_first(len(query_ids), doc_len, max(0, self.max_length - special))
+        query_ids, doc_ids = query_ids[:query_len], doc_ids[:doc_len]
+        input_ids = prefix[0] + query_ids + middle[0] + doc_ids + suffix[0]
+        token_types = prefix[1] + [query_type] * len(query_ids) + middle[1] + [doc_type] * len(doc_ids) + suffix[1]
+        return input_ids, token_types
+
+    def predict(self, items):
+        # items: (query, assessment dict) pairs; returns one score per item
+        query_tokens = {}
+        for query, _ in items:
+            if query not in query_tokens:
+                query_tokens[query] = self.tokenizer(query, add_special_tokens=False)["input_ids"]
+
+        pairs = []
+        for query, res in items:
+            stored = self.store.get(res['url']) if self.store is not None else None
+            if stored is None:
+                doc_ids = self.tokenizer(doc_text(res), add_special_tokens=False)["input_ids"]
+                doc_len = len(doc_ids)
+            else:
+                doc_ids, doc_len = stored
+                doc_ids = doc_ids.tolist()
+            pairs.append(self._pair(query_tokens[query], doc_ids, doc_len))
+
+        # Length buckets: neighbours in sorted order have similar lengths, so
+        # each batch pads to little more than its real tokens
+        lengths = np.fromiter((len(ids) for ids, _ in pairs), dtype=np.int64, count=len(pairs))
+        order = np.argsort(lengths, kind="stable")
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        pad_id = self.tokenizer.pad_token_id or 0
+        for start in range(0, len(order), RERANK_BATCH_SIZE):
+            rows = order[start:start + RERANK_BATCH_SIZE]
+            width = int(lengths[rows].max())
+            input_ids = np.full((len(rows), width), pad_id, dtype=np.int64)
+            token_type_ids = np.zeros((len(rows), width), dtype=np.int64)
+            attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+            for j, row in enumerate(rows):
+                ids, types = pairs[row]
+                input_ids[j, :len(ids)] = ids
+                token_type_ids[j, :len(types)] = types
+                attention_mask[j, :len(ids)] = 1
+            features = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+            scores[rows] = self.scorer({name: features[name] for name in self.input_names})
+            self.real_tokens += int(lengths[rows].sum())
+            self.padded_tokens += len(rows) * width
+        return scores
+
+    def stats(self):
+        return {
+            "documents": len(self.store) if self.store is not None else 0,
+            "store_bytes": self.store.nbytes() if self.store is not None else 0,
+            "padding_ratio": 1 - self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0,
+        }
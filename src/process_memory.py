@@ -0,0 +1,39 @@
+import os
+
+
+def memory_usage(pid="self"):
+    # Resident, shared and private memory of a process in MB, from /proc (Linux).
+    # Pss splits shared pages between the processes mapping them, so summing
+    # Pss over workers gives the real total.
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return _statm_usage(pid)
+
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+        "private_mb": round(private / 1024, 1),
+    }
+
+
+def _statm_usage(pid):
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+    except OSError:
+        return {}
+    page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    return {
+        "rss_mb": round(resident * page_mb, 1),
+        "shared_mb": round(shared * page_mb, 1),
+        "private_mb": round((resident - shared) * page_mb, 1),
+    }
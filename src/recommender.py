@@ -1,71 +1,387 @@
 from embeddings import EmbeddingEngine
+from cache import create_query_cache, create_semantic_cache
 import logging
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 
-from sentence_transformers import CrossEncoder
+from backends import import_backend, load_cross_encoder, feature_scorer
+from pretokenized import PretokenizedReranker, PRETOKENIZE, doc_text
+from lexical import SHORTCIRCUIT
+from filters import normalize_filters
+from long_query import LONG_QUERY, RERANK_QUERY_TOKENS, condense, select_chunks
+from diversity import DIVERSITY, dedupe, diversify
+from metrics import stage, tracing, load_timer
+
+# Candidates fetched from FAISS per query before cross-encoder reranking
+INITIAL_K = 50
+
+# MS MARCO model is fine-tuned for passage retrieval relevance
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# Reranking cascade. "full" scores all INITIAL_K candidates at once; "cascade"
+# scores RERANK_CHUNK candidates per round, in FAISS order, up to an adaptive
+# depth: every candidate within CASCADE_SCORE_MARGIN of the best FAISS score,
+# but never fewer than max(k, CASCADE_MIN_DEPTH).
+RERANK_MODE = os.environ.get("SHL_RERANK_MODE", "full")
+RERANK_CHUNK = int(os.environ.get("SHL_RERANK_CHUNK", 10))
+CASCADE_MIN_DEPTH = int(os.environ.get("SHL_CASCADE_MIN_DEPTH", 20))
+CASCADE_SCORE_MARGIN = float(os.environ.get("SHL_CASCADE_SCORE_MARGIN", 0.15))
+
+# Load the index, the bi-encoder and the cross-encoder concurrently (0 = one after another)
+PARALLEL_LOAD = os.environ.get("SHL_PARALLEL_LOAD", "1") != "0"
+
+class _RerankState:
+    # Progress of one query through the rerank rounds
+    def __init__(self, query, candidates, k, cascade, diversity=False):
+        self.query = query
+        self.candidates = candidates
+        self.k = k
+        self.diversity = diversity
+        self.reranked = 0
+        self.stopped = None
+        self.last_top = None
+        if cascade:
+            self.chunk = RERANK_CHUNK
+            self.depth = self._adaptive_depth()
+        else:
+            self.chunk = len(candidates)
+            self.depth = len(candidates)
+        if self.depth == 0:
+            self.stopped = "exhausted"
+
+    def _adaptive_depth(self):
+        if not self.candidates:
+            return 0
+        # A peaked FAISS score distribution needs fewer candidates than a flat one
+        # (with hybrid retrieval the list is in fused order, so take the best score)
+        floor = max(c['score'] for c in self.candidates) - CASCADE_SCORE_MARGIN
+        confident = sum(1 for c in self.candidates if c['score'] >= floor)
+        return min(len(self.candidates), max(confident, self.k, CASCADE_MIN_DEPTH))
+
+    @property
+    def done(self):
+        return self.stopped is not None
+
+    def stop(self, reason):
+        self.stopped = reason
+
+    def next_chunk(self):
+        return self.candidates[self.reranked:min(self.reranked + self.chunk, self.depth)]
+
+    def advance(self, count):
+        self.reranked += count
+        if self.reranked >= self.depth:
+            self.stop("exhausted")
+            return
+        if self.reranked >= self.k:
+            # Stop once a round leaves the top-k membership unchanged
+            top = set(r['url'] for r in self.ordered()[:self.k])
+            if top == self.last_top:
+                self.stop("stable")
+            self.last_top = top
+
+    def ordered(self):
+        # Reranked candidates by cross-encoder score, then the rest in FAISS order
+        scored = sorted(self.candidates[:self.reranked], key=lambda x: x['rerank_score'], reverse=True)
+        return scored + self.candidates[self.reranked:]
+
+    def summary(self):
+        return {
+            "candidates": len(self.candidates),
+            "rerank_depth": self.depth,
+            "reranked": self.reranked,
+            "rerank_stop": self.stopped,
+        }
+
+def _notify(listeners, i, event, results):
+    listener = listeners[i] if listeners is not None else None
+    if listener is None:
+        return
+    try:
+        listener(event, results)
+    except Exception as e:
+        # A broken listener must not fail the rest of the batch
+        logging.warning(f"Result listener failed on {event!r}: {e}")
 
 class RecommenderSystem:
-    def __init__(self):
-        self.engine = EmbeddingEngine()
-        loaded = self.engine.load_index()
+    def __init__(self, parallel=PARALLEL_LOAD, build_missing=True):
+        # Shared by the engine (query vectors, FAISS candidates) and the reranker (pair scores)
+        self.cache = create_query_cache()
+        self.engine = EmbeddingEngine(cache=self.cache, load_model=False)
+        # Optional near-duplicate response cache (SHL_SEMANTIC_CACHE, see cache.py)
+        self.semantic_cache = create_semantic_cache()
+        self.reranker = None
+        # Observed seconds per cross-encoder pair, learned from previous calls
+        self.pair_cost_s = None
+
+        if parallel:
+            # The index is memory-mapped while the backend imports, then both models
+            # load side by side; model loading is mostly file reads and torch calls
+            # that release the GIL
+            with ThreadPoolExecutor(max_workers=3, thread_name_prefix="load") as pool:
+                index = pool.submit(self.engine.load_index)
+                with load_timer("imports"):
+                    import_backend()
+                models = [pool.submit(self.engine.load_model), pool.submit(self._load_reranker)]
+                loaded = index.result()
+                for future in models:
+                    future.result()
+        else:
+            loaded = self.engine.load_index()
+            with load_timer("imports"):
+                import_backend()
+            self.engine.load_model()
+            self._load_reranker()
         if not loaded:
-            logging.warning("Index not found. Please run individual embeddings.py first to generate.")
-            
-        # Initialize Cross-Encoder for Reranking
-        # MS MARCO model is fine-tuned for passage retrieval relevance
+            if not build_missing:
+                raise RuntimeError("No loadable index bundle; run src/embeddings.py before serving")
+            # Build it now rather than on the first request, so readiness means an index exists
+            logging.warning("Index not found; building it from the scraped data before serving.")
+            with load_timer("index"):
+                if not self.engine.load_data() or self.engine.create_index() is None:
+                    raise RuntimeError("No index and no scraped data to build one; run src/scraper.py, then src/embeddings.py")
+            loaded = True
+
+        # Document-side reranker tokens, built once per index version
+        self.pretokenized = PretokenizedReranker.create(self.reranker, feature_scorer(self.reranker)) if PRETOKENIZE else None
+        if self.pretokenized is not None and loaded:
+            with load_timer("pretokenize"):
+                self.pretokenized.build(self.engine.assessments, self.engine.index_version)
+
+    def _load_reranker(self):
+        # Initialize Cross-Encoder for Reranking (backend selected by SHL_INFERENCE_BACKEND)
         logging.info("Loading Cross-Encoder model...")
-        self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+        with load_timer("cross_encoder"):
+            self.reranker = load_cross_encoder(RERANKER_MODEL_NAME)
+        return self.reranker
+
+    def rerank_query(self, query):
+        # The query text the cross-encoder sees: unchanged unless it is over
+        # RERANK_QUERY_TOKENS reranker tokens (see long_query.py)
+        if not LONG_QUERY:
+            return query
+        tokenizer = getattr(self.reranker, "tokenizer", None)
+        count_tokens = (lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])) if tokenizer else None
+        weight = self.engine.lexical.term_weight if self.engine.lexical is not None else None
+        return condense(query, RERANK_QUERY_TOKENS, count_tokens, weight)
+
+    def _predict(self, items):
+        if self.pretokenized is None:
+            return self.reranker.predict([[query, doc_text(res)] for query, res in items])
+        if self.pretokenized.version != self.engine.index_version:
+            # The index was (re)built after startup
+            self.pretokenized.build(self.engine.assessments, self.engine.index_version)
+        return self.pretokenized.predict(items)
+
+    def recommend(self, query: str, k: int = 10, latency_budget_ms=None, trace=None, filters=None):
+        traces = [trace] if trace is not None else None
+        return self.recommend_batch([query], k=k, latency_budget_ms=latency_budget_ms, traces=traces, filters=filters)[0]
+
+    def recommend_batch(self, queries, k: int = 10, latency_budget_ms=None, traces=None, filters=None,
+                        rerank_mode=None, listeners=None, diversity=None):
+        # Stage timings land in the metrics histograms and in each request's trace.
+        # listeners[i](event, results), if given, sees query i's intermediate results:
+        # "candidates" once retrieval is done, then "rerank" after every cascade
+        # round that is not the last one. The return value is the final answer.
+        # diversity turns MMR diversification on or off (None: SHL_DIVERSITY).
+        with tracing(traces):
+            return self._recommend_batch(queries, k, latency_budget_ms, traces, filters, rerank_mode, listeners,
+                                         diversity)
+
+    def _recommend_batch(self, queries, k, latency_budget_ms, traces, filters, rerank_mode=None, listeners=None,
+                         diversity=None):
+        started = time.perf_counter()
+        # e.g. {"type": "Technical"}; retrieval only searches matching vectors (see filters.py)
+        filters = normalize_filters(filters)
+
+        # 0. Exact product names and codes ("OPQ32r") are answered from the BM25
+        # index, topped up to k from dense retrieval, without the cross-encoder
+        with stage("lexical_shortcut"):
+            results = [self.engine.lexical_matches(q, k, filters) if SHORTCIRCUIT else None for q in queries]
+        rest = [i for i, r in enumerate(results) if r is None]
+        short = [i for i, r in enumerate(results) if r is not None and len(r) < k]
+        if short:
+            self._fill_lexical([queries[i] for i in short], [results[i] for i in short], k, filters)
+        for i, r in enumerate(results):
+            if r is not None and traces is not None and traces[i] is not None:
+                traces[i].update({"candidates": len(r), "rerank_depth": 0, "reranked": 0, "rerank_stop": "lexical"})
+        if rest:
+            rest_traces = [traces[i] for i in rest] if traces is not None else None
+            rest_listeners = [listeners[i] for i in rest] if listeners is not None else None
+            dense = self._recommend_dense([queries[i] for i in rest], k, started, latency_budget_ms, rest_traces, filters,
+                                          rerank_mode, rest_listeners, diversity)
+            for i, r in zip(rest, dense):
+                results[i] = r
+        return results
+
+    def _fill_lexical(self, queries, batches, k, filters):
+        # Exact matches stay first; the rest of each list comes from FAISS/BM25
+        # fusion in retrieval order (one bi-encoder pass and one FAISS search)
+        query_vecs, chunks = self.engine.encode_chunked(queries)
+        raw_batches = self.engine.search_encoded(queries, query_vecs, k=k, filters=filters, chunks=chunks)
+        for results, raw_results in zip(batches, raw_batches):
+            seen = {r['url'] for r in results}
+            results += [r for r in raw_results if r['url'] not in seen][:k - len(results)]
+
+    def _recommend_dense(self, queries, k, started, latency_budget_ms, traces, filters, rerank_mode=None, listeners=None,
+                         diversity=None):
+        diversity = DIVERSITY if diversity is None else diversity
+        if not self.engine.ensure_index():
+            return [[] for _ in queries]
+        # A single bi-encoder pass covers every query in the batch, long ones as several chunks
+        query_vecs, chunks = self.engine.encode_chunked(queries)
+        if chunks is not None and traces is not None:
+            for i, count in enumerate(np.bincount(chunks[1], minlength=len(queries))):
+                if count > 1 and traces[i] is not None:
+                    traces[i]["query_chunks"] = int(count)
+        results = [None] * len(queries)
+
+        # Near-duplicates of a recently served query reuse its reranked list and
+        # skip FAISS and the cross-encoder. Budget-limited answers depend on load,
+        # so those requests neither read nor fill the cache.
+        semantic = self.semantic_cache if latency_budget_ms is None else None
+        audited = {}
+        if semantic is not None:
+            options = semantic.options_key(k=k, filters=filters, rerank_mode=rerank_mode or RERANK_MODE,
+                                           diversity=diversity)
+            with stage("semantic_cache"):
+                found = semantic.lookup(query_vecs, options, self.engine.index_version)
+            for i, hit in enumerate(found):
+                if hit is None:
+                    continue
+                cached, similarity, audit = hit
+                if audit:
+                    # Recomputed below to measure drift
+                    audited[i] = cached
+                    continue
+                results[i] = cached
+                if traces is not None and traces[i] is not None:
+                    traces[i].update({"candidates": len(cached), "rerank_depth": 0, "reranked": 0,
+                                      "rerank_stop": "semantic", "semantic_similarity": round(similarity, 4)})
+
+        todo = [i for i, r in enumerate(results) if r is None]
+        if not todo:
+            return results
+        todo_queries = [queries[i] for i in todo]
+        todo_traces = [traces[i] for i in todo] if traces is not None else None
+        todo_listeners = [listeners[i] for i in todo] if listeners is not None else None
 
-    def recommend(self, query: str, k: int = 10):
         # 1. Retrieval (High Recall)
         # Fetch top 50 candidates to cast a wide net (Recall@50 was 0.34 vs Recall@10 0.15)
-        initial_k = 50
-        raw_results = self.engine.search(query, k=initial_k)
-        
-        if not raw_results:
-            return []
+        # A single FAISS search covers every query in the batch
+        raw_batches = self.engine.search_encoded(todo_queries, query_vecs[todo], k=INITIAL_K, filters=filters,
+                                                 chunks=select_chunks(chunks, todo))
+        for j, raw_results in enumerate(raw_batches):
+            # Retrieval order, before the cross-encoder has seen them
+            _notify(todo_listeners, j, "candidates", raw_results[:k])
+        fresh = self.rerank_candidates(todo_queries, raw_batches, k, started, latency_budget_ms, todo_traces,
+                                       rerank_mode, todo_listeners, diversity)
+        for j, i in enumerate(todo):
+            results[i] = fresh[j]
+            if semantic is not None:
+                semantic.put(queries[i], query_vecs[i], options, fresh[j], self.engine.index_version,
+                             cached=audited.get(i))
+        return results
 
+    def rerank_candidates(self, queries, raw_batches, k, started=None, latency_budget_ms=None, traces=None,
+                          rerank_mode=None, listeners=None, diversity=None):
         # 2. Reranking (High Precision)
-        # Create pairs of (Query, Document Text)
+        # Full mode scores every candidate in one round. Cascade mode (or any request
+        # with a latency budget) scores chunks and stops once the top-k is stable,
+        # the adaptive depth is reached or the budget runs out.
+        started = time.perf_counter() if started is None else started
+        cascade = (rerank_mode or RERANK_MODE) == "cascade" or latency_budget_ms is not None
+        with stage("query_condense"):
+            # Long queries are scored in a token-budgeted condensed form
+            rerank_queries = [self.rerank_query(query) for query in queries]
+        diversity = DIVERSITY if diversity is None else diversity
+        states = [_RerankState(query, raw_results, k, cascade, diversity)
+                  for query, raw_results in zip(rerank_queries, raw_batches)]
+        self._rerank(states, started, latency_budget_ms, listeners)
+
+        batch_results = []
+        with stage("sort_dedupe"):
+            for i, state in enumerate(states):
+                if traces is not None and traces[i] is not None:
+                    traces[i].update(state.summary())
+                batch_results.append(self._finalize(state.ordered(), k, state.diversity))
+        return batch_results
+
+    def _rerank(self, states, started, latency_budget_ms, listeners=None):
+        budget_s = latency_budget_ms / 1000.0 if latency_budget_ms is not None else None
+        while True:
+            active = [state for state in states if not state.done]
+            if not active:
+                return
+
+            chunks = [(state, state.next_chunk()) for state in active]
+            if budget_s is not None:
+                remaining = budget_s - (time.perf_counter() - started)
+                pending = sum(len(chunk) for _, chunk in chunks)
+                # Stop before a round that would overrun the budget at the observed per-pair cost
+                if remaining <= 0 or (self.pair_cost_s is not None and pending * self.pair_cost_s > remaining):
+                    for state in active:
+                        state.stop("budget")
+                    return
+
+            # One cross-encoder call covers this round's chunk of every active query
+            self._score([(state.query, res) for state, chunk in chunks for res in chunk])
+            for state, chunk in chunks:
+                state.advance(len(chunk))
+            if listeners is not None:
+                for i, state in enumerate(states):
+                    if not state.done:
+                        # Ordering so far; the final one is the return value
+                        _notify(listeners, i, "rerank", self._finalize(state.ordered(), state.k, state.diversity))
+
+    def _score(self, items):
+        # Create (Query, Document) pairs, reusing cached scores and scoring duplicates once
         pairs = []
-        for res in raw_results:
-            # Construct a rich text representation for the reranker
-            doc_text = f"{res.get('name', '')}. {res.get('description', '')}"
-            pairs.append([query, doc_text])
-            
-        # Score pairs
-        scores = self.reranker.predict(pairs)
-        
-        # Attach scores and sort
-        for i, res in enumerate(raw_results):
-            res['rerank_score'] = float(scores[i])
-            
-        # Sort by rerank score descending
-        reranked_results = sorted(raw_results, key=lambda x: x['rerank_score'], reverse=True)
-        
-        # 3. Apply Heuristic Balancing (Optional, but Reranker usually knows best)
-        # We will keep the balancing logic simple: Trust the Reranker first, 
-        # but ensure we don't return *only* one type if the user asked for mixed?
-        # Actually, let's trust the Reranker for the assignment as it demonstrates ML rigor.
-        # But we will re-apply the "Technical vs Behavioral" tag *after* reranking for display if needed.
-        
-        # Let's inspect the top 2*k from reranker for diversity if needed?
-        # For now, return top k from reranker.
-        final_results = reranked_results[:k]
-        
-        # Deduplication (re-check just in case)
-        seen_urls = set()
-        unique_results = []
-        for r in final_results:
-            if r['url'] not in seen_urls:
-                unique_results.append(r)
-                seen_urls.add(r['url'])
-                
-        return unique_results
-
-    def search_raw(self, query: str, k: int = 50):
-        return self.engine.search(query, k=k)
+        owners = {}
+        with stage("pair_construction"):
+            for query, res in items:
+                score = self.cache.get("scores", query, res['url']) if self.cache is not None else None
+                if score is not None:
+                    res['rerank_score'] = score
+                    continue
+                key = (query, res['url'])
+                if key not in owners:
+                    pairs.append((query, res))
+                    owners[key] = []
+                owners[key].append(res)
+
+        if not pairs:
+            return
+
+        predict_started = time.perf_counter()
+        with stage("cross_encoder"):
+            scores = self._predict(pairs)
+        cost = (time.perf_counter() - predict_started) / len(pairs)
+        # Smoothed per-pair cost drives the latency-budget checks
+        self.pair_cost_s = cost if self.pair_cost_s is None else 0.8 * self.pair_cost_s + 0.2 * cost
+
+        # Attach scores back to every result that owns each (deduplicated) pair
+        for (key, results), score in zip(owners.items(), scores):
+            for res in results:
+                res['rerank_score'] = float(score)
+            if self.cache is not None:
+                self.cache.put("scores", float(score), *key)
+
+    def _finalize(self, reranked_results, k, diversity=False):
+        # 3. Intent balancing: deduplicate first, so k unique results come back
+        # whenever there are k, then optionally diversify the reranked order with
+        # MMR over the stored index vectors (see diversity.py)
+        unique_results = dedupe(reranked_results)
+        if not diversity:
+            return unique_results[:k]
+        return diversify(unique_results, self.engine.vectors, self.engine.url_positions, k)
+
+    def search_raw(self, query: str, k: int = 50, filters=None):
+        return self.engine.search(query, k=k, filters=filters)
 
 if __name__ == "__main__":
     # Test
@@ -0,0 +1,291 @@
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from metrics import BATCH_SIZE, QUEUE_SECONDS, REQUEST_SECONDS, add_timing
+
+logging.basicConfig(level=logging.INFO)
+
+# Micro-batching window: a batch is dispatched once it is full or the oldest
+# request has waited MAX_WAIT_MS, whichever comes first.
+BATCH_MAX_SIZE = int(os.environ.get("SHL_BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("SHL_BATCH_MAX_WAIT_MS", 5))
+
+# Admission control: requests beyond MAX_QUEUE waiting requests are rejected
+MAX_QUEUE = int(os.environ.get("SHL_MAX_QUEUE", 64))
+
+# Dedicated inference pool. Each worker runs a whole batch; torch/FAISS intra-op
+# threads default to an even share of the cores so workers do not oversubscribe.
+INFERENCE_WORKERS = int(os.environ.get("SHL_INFERENCE_WORKERS", 1))
+INFERENCE_THREADS = int(os.environ.get("SHL_INFERENCE_THREADS", 0))
+
+# Number of recent requests kept for latency percentiles
+STATS_WINDOW = 1000
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def _configure_inference_thread(num_threads):
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def create_inference_executor(workers=INFERENCE_WORKERS, threads=INFERENCE_THREADS):
+    workers = max(1, int(workers))
+    threads = int(threads) or max(1, (os.cpu_count() or 1) // workers)
+    logging.info(f"Inference pool: {workers} worker(s) x {threads} torch/FAISS thread(s)")
+    return ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix="inference",
+        initializer=_configure_inference_thread,
+        initargs=(threads,),
+    )
+
+
+class BatchStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.rejected = 0
+        self.expired = 0
+        self.batch_sizes = Counter()
+        self.queue_ms = deque(maxlen=window)
+        self.latency_ms = deque(maxlen=window)
+
+    def record_batch(self, size):
+        with self.lock:
+            self.batches += 1
+            self.batch_sizes[size] += 1
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def record_expired(self, count=1):
+        with self.lock:
+            self.expired += count
+
+    def record_request(self, queue_ms, latency_ms):
+        with self.lock:
+            self.requests += 1
+            self.queue_ms.append(queue_ms)
+            self.latency_ms.append(latency_ms)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        p50, p95, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95, 99])
+        return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+    def snapshot(self):
+        with self.lock:
+            mean_size = self.requests / self.batches if self.batches else 0.0
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "mean_batch_size": mean_size,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "queue_ms": self._percentiles(self.queue_ms),
+                "latency_ms": self._percentiles(self.latency_ms),
+            }
+
+
+class _PendingRequest:
+    __slots__ = ("query", "options", "trace", "listener", "future", "enqueued_at", "deadline")
+
+    def __init__(self, query, options, timeout=None, trace=None, listener=None):
+        self.query = query
+        self.options = options
+        # Caller-owned dict that recommend_batch fills with per-request details
+        self.trace = trace
+        # Optional callback for intermediate results, called on the inference thread
+        self.listener = listener
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.deadline = self.enqueued_at + timeout if timeout else None
+
+    def expired(self, now):
+        return self.deadline is not None and now >= self.deadline
+
+    @property
+    def group_key(self):
+        # Only requests with identical options can share one recommend_batch call
+        return json.dumps(self.options, sort_keys=True, default=str)
+
+
+class BatchScheduler:
+    def __init__(self, rec_system, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 max_queue=MAX_QUEUE, executor=None, workers=1):
+        self.rec_system = rec_system
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        # Sentinel used by stop() needs one extra slot beyond the admission limit
+        self.max_queue = max(1, int(max_queue))
+        self.queue = queue.Queue(maxsize=self.max_queue + 1)
+        self.stats = BatchStats()
+        # Without an executor batches run on the scheduler thread itself. With one,
+        # at most `workers` batches (the executor's pool size) are in flight; the
+        # rest keep queueing (and therefore batching) until a worker frees up.
+        self.executor = executor
+        self.workers = max(1, int(workers)) if executor is not None else 1
+        self._slots = threading.Semaphore(self.workers)
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._thread.start()
+            logging.info(f"Batch scheduler started (max_batch_size={self.max_batch_size}, "
+                         f"max_wait_ms={self.max_wait * 1000:.1f})")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def submit(self, query, timeout=None, trace=None, listener=None, **options):
+        # timeout is a per-request deadline: work still queued when it passes is dropped
+        if self.queue.qsize() >= self.max_queue:
+            self.stats.record_rejected()
+            raise QueueFullError(f"Inference queue full ({self.max_queue} waiting)")
+        request = _PendingRequest(query, options, timeout=timeout, trace=trace, listener=listener)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            self.stats.record_rejected()
+            raise QueueFullError(f"Inference queue full ({self.max_queue} waiting)")
+        return request.future
+
+    def recommend(self, query, timeout=None, trace=None, **options):
+        return self.submit(query, timeout=timeout, trace=trace, **options).result(timeout=timeout)
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # Wait for a free inference worker before forming the next batch
+            self._slots.acquire()
+            batch = self._collect()
+            if not batch:
+                self._slots.release()
+                continue
+            if self.executor is None:
+                self._process_and_release(batch)
+            else:
+                self.executor.submit(self._process_and_release, batch)
+
+        # Fail anything still queued so callers do not hang on shutdown
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item.future.set_running_or_notify_cancel():
+                item.future.set_exception(RuntimeError("Batch scheduler stopped"))
+
+    def _process_and_release(self, batch):
+        try:
+            self._process(batch)
+        finally:
+            self._slots.release()
+
+    def _admit(self, batch):
+        # Drop requests whose caller gave up (cancelled) or whose deadline passed
+        now = time.perf_counter()
+        admitted = []
+        expired = 0
+        for request in batch:
+            if request.expired(now):
+                if request.future.set_running_or_notify_cancel():
+                    request.future.set_exception(DeadlineExceeded("Request deadline exceeded in queue"))
+                expired += 1
+            elif request.future.set_running_or_notify_cancel():
+                admitted.append(request)
+            else:
+                expired += 1
+        if expired:
+            self.stats.record_expired(expired)
+        return admitted
+
+    def _process(self, batch):
+        groups = {}
+        for request in self._admit(batch):
+            groups.setdefault(request.group_key, []).append(request)
+
+        for requests in groups.values():
+            started = time.perf_counter()
+            listeners = [r.listener for r in requests]
+            if not any(listeners):
+                listeners = None
+            try:
+                results = self.rec_system.recommend_batch(
+                    [r.query for r in requests], traces=[r.trace for r in requests], listeners=listeners,
+                    **requests[0].options
+                )
+            except Exception as e:
+                logging.error(f"Batch of {len(requests)} failed: {e}")
+                for r in requests:
+                    r.future.set_exception(e)
+                continue
+
+            self.stats.record_batch(len(requests))
+            BATCH_SIZE.observe(len(requests))
+            finished = time.perf_counter()
+            for r, result in zip(requests, results):
+                self.stats.record_request(
+                    (started - r.enqueued_at) * 1000, (finished - r.enqueued_at) * 1000
+                )
+                QUEUE_SECONDS.observe(started - r.enqueued_at)
+                REQUEST_SECONDS.observe(finished - r.enqueued_at)
+                if r.trace is not None:
+                    add_timing(r.trace, "queue", (started - r.enqueued_at) * 1000)
+                r.future.set_result(result)
@@ -1,70 +1,39 @@
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import asyncio
 import json
 import time
 import os
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import urllib3
+from crawler import Crawler, HTTP_CACHE_DIR, VERIFY_TLS
+from parsing import parse_catalog_page, parse_details, parse_pool, PARSE_WORKERS
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-BASE_URL = "https://www.shl.com"
-START_URL = "https://www.shl.com/solutions/products/product-catalog/"
+# Point SHL_SCRAPE_BASE_URL at a local stub server to test the crawl offline
+BASE_URL = os.environ.get("SHL_SCRAPE_BASE_URL", "https://www.shl.com").rstrip("/")
+START_URL = f"{BASE_URL}/solutions/products/product-catalog/"
 DATA_DIR = "data/raw"
 CATALOG_FILE = os.path.join(DATA_DIR, "catalog_links.json")
 OUTPUT_FILE = os.path.join(DATA_DIR, "assessments.json")
 INTERMEDIATE_FILE = os.path.join(DATA_DIR, "assessments_partial.jsonl")
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-    "Accept-Language": "en-US,en;q=0.5"
-}
+async def parse(pool, fn, *args):
+    # Parsing runs in the process pool (or a thread), never on the event loop
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
 
-def get_soup(session, url):
-    for attempt in range(4):
-        try:
-            response = session.get(url, headers=HEADERS, timeout=60, verify=False)
-            response.raise_for_status()
-            return BeautifulSoup(response.content, 'html.parser')
-        except Exception as e:
-            logging.warning(f"Attempt {attempt+1} failed for {url}: {e}")
-            time.sleep(5 * (attempt + 1))
-    logging.error(f"Failed to fetch {url} after retries")
-    return None
-
-def fetch_catalog_page(session, start):
+async def fetch_catalog_page(crawler, start, pool=None):
     current_url = f"{START_URL}?start={start}"
-    logging.info(f"Scraping catalog offset {start}") 
-    soup = get_soup(session, current_url)
-    if not soup:
+    logging.info(f"Scraping catalog offset {start}")
+    result = await crawler.fetch(current_url)
+    if not result.ok:
         return []
+    return await parse(pool, parse_catalog_page, result.body, BASE_URL)
 
-    links = soup.find_all('a', href=True)
-    page_assessments = []
-    
-    for link in links:
-        href = link['href']
-        if "/solutions/products/product-catalog/view/" in href or "/products/product-catalog/view/" in href:
-            full_url = BASE_URL + href if href.startswith("/") else href
-            
-            title = link.get_text(strip=True)
-            if not title:
-                title = " ".join([c.get_text(strip=True) for c in link.find_all(recursive=False)])
-            
-            page_assessments.append({
-                "name": title,
-                "url": full_url,
-                "description": "",
-                "type": "Unknown"
-            })
-    return page_assessments
-
-def scrape_catalog():
-    if os.path.exists(CATALOG_FILE):
+async def scrape_catalog(crawler, refresh=False, pool=None):
+    if os.path.exists(CATALOG_FILE) and not refresh:
         logging.info("Loading existing catalog links...")
         try:
             with open(CATALOG_FILE, 'r') as f:
@@ -72,123 +41,165 @@ def scrape_catalog():
         except:
             logging.warning("Failed to load catalog file, rescraping.")
 
-    assessments = []
-    session = requests.Session()
-    
     # Loop from start=0 up to 450 with step 12
     offsets = range(0, 450, 12)
-    
-    logging.info("Fetching catalog pages in parallel...")
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_offset = {executor.submit(fetch_catalog_page, session, start): start for start in offsets}
-        for future in as_completed(future_to_offset):
-            try:
-                data = future.result()
-                assessments.extend(data)
-            except Exception as e:
-                logging.error(f"Page failed: {e}")
 
-    session.close()
-    
+    logging.info("Fetching catalog pages...")
+    assessments = []
+    for data in await asyncio.gather(*(fetch_catalog_page(crawler, start, pool) for start in offsets)):
+        assessments.extend(data)
+
     # Deduplicate
     unique_assessments = {a['url']: a for a in assessments}.values()
     assessments = list(unique_assessments)
-    
+
     # Save intermediate
     with open(CATALOG_FILE, 'w') as f:
         json.dump(assessments, f, indent=2)
-        
+
     return assessments
 
-def scrape_details(assessment):
-    url = assessment['url']
-    session = requests.Session()
-    soup = get_soup(session, url)
-    if not soup:
+async def scrape_details(crawler, assessment, previous=None, pool=None):
+    result = await crawler.fetch(assessment['url'])
+    if not result.ok:
         return assessment
-
-    meta_desc = soup.find('meta', attrs={'name': 'description'})
-    if meta_desc:
-        assessment['description'] = meta_desc.get('content', '').strip()
-    
-    main_content = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
-    if main_content:
-        paragraphs = main_content.find_all('p')
-        text_content = " ".join([p.get_text(strip=True) for p in paragraphs if len(p.get_text(strip=True)) > 20])
-        if text_content:
-            if len(assessment['description']) < 50:
-                 assessment['description'] = text_content
-            else:
-                 assessment['description'] += " " + text_content[:500]
-    
-    text_for_type = (assessment['name'] + " " + assessment['description']).lower()
-    
-    if any(k in text_for_type for k in ['java', 'python', 'coding', 'developer', 'engineer', 'c++', 'sql', 'technical', 'react', 'node', 'aws']):
-        assessment['type'] = 'Technical'
-    elif any(k in text_for_type for k in ['personality', 'behavior', 'preference', 'motivation', 'opq', 'cognitive', 'culture', 'sales', 'scenario']):
-        assessment['type'] = 'Behavioral/Personality'
-    elif any(k in text_for_type for k in ['numerical', 'verbal', 'deductive', 'reasoning', 'ability', 'general ability']):
-         assessment['type'] = 'Cognitive'
-    else:
-        assessment['type'] = 'General/Skills'
-
-    return assessment
-
-def main():
+    if result.not_modified and previous is not None:
+        # 304: the page is unchanged, keep the record parsed last time
+        return previous
+    return await parse(pool, parse_details, assessment, result.body)
+
+def load_previous():
+    # url -> record from the last completed run, reused for unchanged pages
+    if not os.path.exists(OUTPUT_FILE):
+        return {}
+    try:
+        with open(OUTPUT_FILE, 'r') as f:
+            return {item['url']: item for item in json.load(f)}
+    except Exception as e:
+        logging.warning(f"Could not read previous output: {e}")
+        return {}
+
+async def crawl(refresh=False, crawler=None, pool=None, sink=None):
+    crawler = crawler or Crawler()
+    started = time.time()
+    async with crawler:
+        assessments = await scrape_catalog(crawler, refresh, pool)
+        logging.info(f"Unique assessments: {len(assessments)}")
+
+        assessments.sort(key=lambda x: x['url'])
+
+        if refresh and os.path.exists(INTERMEDIATE_FILE):
+            # A refresh re-checks every page; conditional GETs keep that cheap
+            os.remove(INTERMEDIATE_FILE)
+
+        # Check for existing work
+        processed_urls = set()
+        if os.path.exists(INTERMEDIATE_FILE):
+             with open(INTERMEDIATE_FILE, 'r') as f:
+                 for line in f:
+                     try:
+                         item = json.loads(line)
+                         processed_urls.add(item['url'])
+                     except: pass
+        logging.info(f"Resuming... {len(processed_urls)} already processed.")
+
+        remaining_assessments = [a for a in assessments if a['url'] not in processed_urls]
+        previous = load_previous()
+
+        logging.info(f"Starting Details Scrape for {len(remaining_assessments)} items...")
+
+        # Open file in append mode
+        tasks = [asyncio.ensure_future(scrape_details(crawler, a.copy(), previous.get(a['url']), pool))
+                 for a in remaining_assessments]
+        with open(INTERMEDIATE_FILE, 'a') as f_out:
+            try:
+                for i, task in enumerate(asyncio.as_completed(tasks)):
+                    try:
+                        data = await task
+                        # Write immediately
+                        f_out.write(json.dumps(data) + "\n")
+                        f_out.flush() # Ensure it hits disk
+                        if sink is not None:
+                            # May block while the indexer catches up
+                            await asyncio.to_thread(sink, data)
+
+                        if i > 0 and i % 10 == 0:
+                            logging.info(f"Processed +{i}")
+                    except Exception as e:
+                        logging.error(f"Error processing item: {e}")
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    logging.info(f"Crawl finished in {time.time() - started:.1f}s: {crawler.stats}")
+
+def compile_output():
+    # JSONL -> JSON array one record at a time, without loading the whole file
+    count = 0
+    with open(OUTPUT_FILE + ".tmp", 'w') as f:
+        f.write("[")
+        if os.path.exists(INTERMEDIATE_FILE):
+            with open(INTERMEDIATE_FILE, 'r') as f_in:
+                for line in f_in:
+                    try:
+                        item = json.loads(line)
+                    except: continue
+                    f.write(("," if count else "") + "\n" + json.dumps(item, indent=2))
+                    count += 1
+        f.write("\n]\n")
+    os.replace(OUTPUT_FILE + ".tmp", OUTPUT_FILE)
+    return count
+
+def main(refresh=False, crawler=None, parse_workers=PARSE_WORKERS, stream=False):
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
+    indexer = None
+    if stream:
+        # Embedding overlaps with the crawl; shards are merged into a bundle at the end
+        from embeddings import EmbeddingEngine
+        from stream_index import StreamingIndexer, publish
+
+        engine = EmbeddingEngine()
+        indexer = StreamingIndexer(engine, resume=not refresh)
+        if not refresh:
+            indexer.catch_up(INTERMEDIATE_FILE)
+
     logging.info("Starting Scraper Loop...")
-    assessments = scrape_catalog()
-    logging.info(f"Unique assessments: {len(assessments)}")
-
-    assessments.sort(key=lambda x: x['url'])
-    
-    # Check for existing work
-    processed_urls = set()
-    if os.path.exists(INTERMEDIATE_FILE):
-         with open(INTERMEDIATE_FILE, 'r') as f:
-             for line in f:
-                 try:
-                     item = json.loads(line)
-                     processed_urls.add(item['url'])
-                 except: pass
-    logging.info(f"Resuming... {len(processed_urls)} already processed.")
-
-    remaining_assessments = [a for a in assessments if a['url'] not in processed_urls]
-    
-    logging.info(f"Starting Details Scrape for {len(remaining_assessments)} items...")
-    
-    # Open file in append mode 
-    with open(INTERMEDIATE_FILE, 'a') as f_out:
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_assessment = {executor.submit(scrape_details, a.copy()): a for a in remaining_assessments}
-            for i, future in enumerate(as_completed(future_to_assessment)):
-                try:
-                    data = future.result()
-                    # Write immediately
-                    f_out.write(json.dumps(data) + "\n")
-                    f_out.flush() # Ensure it hits disk
-                    
-                    if i > 0 and i % 10 == 0:
-                        logging.info(f"Processed +{i}")
-                except Exception as e:
-                    logging.error(f"Error processing item: {e}")
-    
+    # Fetching stays on the event loop; parsing goes to worker processes
+    pool = parse_pool(parse_workers)
+    try:
+        asyncio.run(crawl(refresh, crawler, pool, indexer.put if indexer is not None else None))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
     # Finalize: Compile JSONL to JSON
     logging.info("Compiling final JSON...")
-    final_data = []
-    if os.path.exists(INTERMEDIATE_FILE):
-        with open(INTERMEDIATE_FILE, 'r') as f:
-            for line in f:
-                try:
-                    final_data.append(json.loads(line))
-                except: pass
-    
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(final_data, f, indent=2)
-    
-    logging.info(f"Complete. Saved {len(final_data)} items to {OUTPUT_FILE}")
+    count = compile_output()
+    logging.info(f"Complete. Saved {count} items to {OUTPUT_FILE}")
+
+    if indexer is not None:
+        indexer.close()
+        report = publish(engine)
+        logging.info(f"Streaming index published: {report}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape the SHL product catalog")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Re-check every catalog and detail page (unchanged pages answer 304 from the cache)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Total connections in the shared pool")
+    parser.add_argument("--per-host", type=int, default=None, help="Concurrent requests per host")
+    parser.add_argument("--rate", type=float, default=None, help="Requests per second per host (0 = unlimited)")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="Processes that parse HTML (1 parses in a thread)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Embed items while crawling and publish an index bundle at the end")
+    parser.add_argument("--cache-dir", default=HTTP_CACHE_DIR, help="On-disk HTTP cache ('' disables it)")
+    parser.add_argument("--insecure", action="store_true",
+                        help="Skip TLS certificate verification (same as SHL_CRAWL_VERIFY_TLS=0)")
+    args = parser.parse_args()
+    options = {name: value for name, value in (("concurrency", args.concurrency), ("per_host", args.per_host),
+                                               ("rate", args.rate)) if value is not None}
+    crawler = Crawler(cache_dir=args.cache_dir, verify=VERIFY_TLS and not args.insecure, **options)
+    main(args.refresh, crawler, args.parse_workers, args.stream)
@@ -0,0 +1,165 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Preload/fork serving: the parent loads both models and the index once, then
+# forks workers that share those pages copy-on-write (the index bundle is also
+# memory-mapped, so it is shared through the page cache).
+#
+#   python src/serve.py --workers 4 --port 8000
+
+# Seconds between per-worker memory reports in the parent log
+MEMORY_REPORT_S = float(os.environ.get("SHL_MEMORY_REPORT_S", 60))
+
+
+def configure_threads(workers):
+    # Split the cores between workers so torch/OpenMP pools do not oversubscribe.
+    # This has to happen before torch is imported.
+    inference_workers = int(os.environ.get("SHL_INFERENCE_WORKERS", 1))
+    threads = max(1, (os.cpu_count() or 1) // (workers * max(1, inference_workers)))
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault("SHL_INFERENCE_THREADS", str(threads))
+    # Tokenizers' Rust thread pool does not survive fork
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    return threads
+
+
+def has_index():
+    import embeddings
+    from bundle import current_bundle_path
+
+    return (current_bundle_path(embeddings.PROCESSED_DIR) is not None
+            or (os.path.exists(embeddings.INDEX_FILE) and os.path.exists(embeddings.MAPPING_FILE)))
+
+
+def ensure_index():
+    # The parent must not build a missing index itself: encoding the catalog runs
+    # torch (and its OpenMP pool) in the process the workers fork from, which can
+    # deadlock them. It is built by a child process that exits before the preload.
+    if has_index():
+        return
+    logging.warning("No published index bundle; building one in a subprocess before preloading")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embeddings.py")
+    result = subprocess.run([sys.executable, script])
+    if result.returncode != 0 or not has_index():
+        sys.exit("No index bundle and building one failed; run src/scraper.py, then src/embeddings.py")
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, host, port):
+    import uvicorn
+    import main
+
+    config = uvicorn.Config(main.app, host=host, port=port, log_level="info")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(sock, host, port):
+    pid = os.fork()
+    if pid == 0:
+        # Child: default signal handling, then serve until told to stop
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            run_worker(sock, host, port)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def report_memory(pids):
+    from process_memory import memory_usage
+
+    total_pss = 0.0
+    for pid in [os.getpid()] + list(pids):
+        usage = memory_usage(pid)
+        total_pss += usage.get("pss_mb", 0.0)
+        role = "parent" if pid == os.getpid() else "worker"
+        logging.info(f"[memory] {role} {pid}: {usage}")
+    logging.info(f"[memory] total PSS {total_pss:.1f} MB across {len(pids) + 1} processes")
+
+
+def main_loop(args):
+    threads = configure_threads(args.workers)
+    ensure_index()
+
+    import main
+    from recommender import RecommenderSystem
+
+    logging.info(f"Preloading models and index in parent {os.getpid()} "
+                 f"({args.workers} workers x {threads} threads)")
+    # An index that still fails to load (e.g. built for another model) stops the
+    # server rather than being rebuilt here
+    main.rec_system = RecommenderSystem(build_missing=False)
+    # No warm-up here: each worker warms up after the fork (see startup.py), since
+    # torch/OpenMP thread pools used before a fork are not safe to use in the children
+    # Move everything loaded so far out of the GC's reach: collections would
+    # otherwise touch every object header and un-share the pages.
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    workers = {spawn_worker(sock, args.host, args.port) for _ in range(args.workers)}
+    logging.info(f"Serving on http://{args.host}:{args.port} with workers {sorted(workers)}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    next_report = time.time() + min(MEMORY_REPORT_S, 10)
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.discard(pid)
+            if not stopping:
+                logging.warning(f"Worker {pid} exited with status {status}; restarting")
+                workers.add(spawn_worker(sock, args.host, args.port))
+            continue
+        if MEMORY_REPORT_S > 0 and time.time() >= next_report:
+            report_memory(workers)
+            next_report = time.time() + MEMORY_REPORT_S
+        time.sleep(0.5)
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preload models once and fork API workers")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SHL_WORKERS", 2)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        sys.exit("Preload/fork serving needs a platform with os.fork")
+    main_loop(args)
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+import logging
+from metrics import REGISTRY, load_states, load_timer
+
+logging.basicConfig(level=logging.INFO)
+
+# Serving startup, kept off the request path:
+#   starting -> loading -> warming -> ready
+#                     \---------\--> failed
+# The API accepts connections straight away (liveness) while a background thread
+# loads the models and the index (see RecommenderSystem, which loads them in
+# parallel) and then pushes a warm-up batch through every stage: lexical
+# shortcut, encode, FAISS (plain and bitmap-filtered), fusion, cross-encoder and sort.
+# That pays for the one-off costs of a cold process (lazy kernel and allocator
+# set-up, tokenizer caches, FAISS buffers, filter bitmaps) before readiness
+# turns on, instead of on the first real request.
+#
+# Run startup on a background thread (0 = block the server until ready, as before)
+STARTUP_BACKGROUND = os.environ.get("SHL_STARTUP_BACKGROUND", "1") != "0"
+# Queries per warm-up batch (0 disables warm-up) and how many times it runs
+WARMUP_BATCH = int(os.environ.get("SHL_WARMUP_BATCH", 8))
+WARMUP_ROUNDS = int(os.environ.get("SHL_WARMUP_ROUNDS", 2))
+# Optional text file with one warm-up query per line, instead of the built-in ones
+WARMUP_QUERIES = os.environ.get("SHL_WARMUP_QUERIES", "")
+
+DEFAULT_WARMUP_QUERIES = [
+    "Java developer who can collaborate with business teams",
+    "Entry level sales role with strong communication skills",
+    "Numerical and verbal reasoning for graduate analysts",
+    "Python and SQL data engineer, 40 minute assessment",
+    "Personality assessment for customer service managers",
+    "Bank administrative assistant with attention to detail",
+    "Senior leadership role, cognitive ability and motivation",
+    "QA engineer with Selenium, JavaScript and manual testing experience",
+]
+
+# Load components reported by /readyz before they have started
+COMPONENTS = ("imports", "index", "bi_encoder", "cross_encoder", "warmup")
+
+READY = REGISTRY.gauge("shl_ready", "1 once models, index and warm-up are done, else 0")
+STARTUP_SECONDS = REGISTRY.gauge("shl_startup_seconds", "Seconds from the startup event until ready")
+
+
+def warmup_queries(count=WARMUP_BATCH, path=WARMUP_QUERIES):
+    queries = DEFAULT_WARMUP_QUERIES
+    if path:
+        with open(path, "r") as f:
+            queries = [line.strip() for line in f if line.strip()] or DEFAULT_WARMUP_QUERIES
+    # Repeat the list to fill the batch, varying the text so the tokenizer sees new inputs
+    return [queries[i % len(queries)] + ("" if i < len(queries) else f" ({i})") for i in range(count)]
+
+
+def _warmup_filters(engine):
+    # One multi-value filter per partition field (bitmap search). Single-value
+    # filters would build partitions, which copy vectors and are left to the
+    # first real query that needs them.
+    filter_index = engine.filter_index
+    if filter_index is None:
+        return []
+    filters = []
+    for field in filter_index.partition_fields:
+        # Partition fields' postings are built with the FilterIndex
+        values = sorted(filter_index.postings.get(field, {}).items(), key=lambda item: -len(item[1]))
+        values = [value for value, rows in values if value]
+        if len(values) > 1:
+            filters.append({field: values[:2]})
+    return filters
+
+
+def warm_up(rec_system, batch_size=WARMUP_BATCH, rounds=WARMUP_ROUNDS):
+    # Full recommend_batch calls at the largest and smallest batch shapes, with
+    # the query cache bypassed so every stage runs and nothing is left cached
+    if batch_size <= 0 or rounds <= 0:
+        return {"skipped": "disabled"}
+    queries = warmup_queries(batch_size)
+    report = {"queries": len(queries), "rounds": rounds, "batch_ms": []}
+    cache, semantic_cache = rec_system.cache, rec_system.semantic_cache
+    rec_system.cache = rec_system.engine.cache = rec_system.semantic_cache = None
+    try:
+        with load_timer("warmup"):
+            for _ in range(rounds):
+                started = time.perf_counter()
+                rec_system.recommend_batch(queries)
+                rec_system.recommend_batch(queries[:1])
+                for filters in _warmup_filters(rec_system.engine):
+                    rec_system.recommend_batch(queries[:2], filters=filters)
+                report["batch_ms"].append(round((time.perf_counter() - started) * 1000, 2))
+    finally:
+        rec_system.cache = rec_system.engine.cache = cache
+        rec_system.semantic_cache = semantic_cache
+        if cache is not None and rec_system.engine.index_version:
+            # In case the warm-up had to build the index
+            cache.set_version(rec_system.engine.index_version)
+    if rec_system.engine.index is None:
+        raise RuntimeError("No index loaded or built; run src/embeddings.py first")
+    logging.info(f"Warm-up finished: {report}")
+    return report
+
+
+class Startup:
+    # Startup state shared by the liveness, readiness and health endpoints
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = "starting"
+        self.error = None
+        self.preloaded = False
+        self.warmup = None
+        self.started_at = time.time()
+        self.ready_at = None
+        self._thread = None
+        READY.set(0)
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def set_state(self, state):
+        with self.lock:
+            self.state = state
+        logging.info(f"Startup: {state}")
+
+    def start(self, initialize, background=STARTUP_BACKGROUND):
+        # initialize(startup) loads and warms the system; it runs once per process
+        self.started_at = time.time()
+        if not background:
+            self._run(initialize)
+            return self
+        self._thread = threading.Thread(target=self._run, args=(initialize,), name="startup", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def _run(self, initialize):
+        try:
+            initialize(self)
+        except Exception as e:
+            with self.lock:
+                self.state = "failed"
+                self.error = f"{type(e).__name__}: {e}"
+            logging.error(f"Startup failed: {self.error}")
+            return
+        with self.lock:
+            self.state = "ready"
+            self.ready_at = time.time()
+        READY.set(1)
+        STARTUP_SECONDS.set(round(self.ready_at - self.started_at, 3))
+        logging.info(f"Ready in {self.ready_at - self.started_at:.2f}s")
+
+    def status(self):
+        components = {name: {"state": "pending", "seconds": None, "error": None} for name in COMPONENTS}
+        components.update(load_states())
+        if self.warmup is not None and "skipped" in self.warmup:
+            components["warmup"]["state"] = "skipped"
+        done = sum(1 for c in components.values() if c["state"] in ("ready", "skipped"))
+        with self.lock:
+            return {
+                "status": self.state,
+                "ready": self.state == "ready",
+                "error": self.error,
+                "pid": os.getpid(),
+                # Components loaded by the serve.py parent before this worker forked
+                "preloaded": self.preloaded,
+                "progress": round(done / len(components), 3),
+                "components": components,
+                "warmup": self.warmup,
+                "uptime_s": round(time.time() - self.started_at, 3),
+                "time_to_ready_s": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            }
@@ -0,0 +1,300 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import logging
+import numpy as np
+from bundle import ColumnarMetadata, BundleMismatchError, column_kind, current_bundle_path, encode_field, load_bundle
+from embedding_store import text_hash
+from embeddings import EmbeddingEngine, PROCESSED_DIR, DATA_DIR, MODEL_NAME, corpus_text
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Streaming scrape-to-index: items are embedded in batches as they arrive and
+# each batch is written as an immutable shard under SHARD_DIR:
+#   shard-000001.npy     normalized float32 vectors of the batch
+#   shard-000001.jsonl   the batch's records, one per line (written last, so a
+#                        shard without it never counts)
+# When the crawl ends the shards are merged into a bundle. Duplicate URLs keep
+# the last record written, and the merge streams shard by shard into
+# memory-mapped staging files, so neither the corpus text nor its vectors are
+# ever held in memory at once. Publishing the merged files is not constant
+# memory: publish_vectors builds the FAISS index (a float32 flat index holds
+# every vector; compressed storage holds codes), the BM25 postings and the
+# filter postings in RAM, all proportional to the catalog.
+STREAM_BATCH = int(os.environ.get("SHL_STREAM_BATCH", 256))
+# A partial batch is embedded after this many idle seconds
+STREAM_FLUSH_S = float(os.environ.get("SHL_STREAM_FLUSH_S", 2))
+SHARD_DIR = os.path.join(PROCESSED_DIR, "shards")
+STREAM_INPUT = os.path.join(DATA_DIR, "assessments_partial.jsonl")
+# Bytes per copy when turning staged metadata into .npy files
+COPY_CHUNK = 16 << 20
+
+
+def list_shards(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".jsonl")] for name in os.listdir(directory)
+                  if name.startswith("shard-") and name.endswith(".jsonl"))
+
+
+def _records(directory, shard):
+    with open(os.path.join(directory, shard + ".jsonl"), "r") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def shard_urls(directory):
+    return {record['url'] for shard in list_shards(directory) for record in _records(directory, shard)}
+
+
+class ShardWriter:
+    def __init__(self, directory=SHARD_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        existing = list_shards(directory)
+        self.next = int(existing[-1].split("-")[1]) + 1 if existing else 1
+
+    def write(self, records, vectors):
+        name = f"shard-{self.next:06d}"
+        path = os.path.join(self.directory, name)
+        np.save(path + ".tmp.npy", np.ascontiguousarray(vectors, dtype=np.float32))
+        os.replace(path + ".tmp.npy", path + ".npy")
+        with open(path + ".jsonl.tmp", "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".jsonl.tmp", path + ".jsonl")
+        self.next += 1
+        return name
+
+
+class StreamingIndexer:
+    # Embeds items on a background thread while the producer (the crawler) keeps going
+    def __init__(self, engine, shard_dir=SHARD_DIR, batch_size=STREAM_BATCH, flush_s=STREAM_FLUSH_S, resume=True):
+        if not resume:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        self.engine = engine
+        self.shard_dir = shard_dir
+        self.writer = ShardWriter(shard_dir)
+        self.batch_size = batch_size
+        self.flush_s = flush_s
+        self.dimension = engine.model.get_sentence_embedding_dimension()
+        self.previous = self._previous_vectors()
+        # Bounded, so a slow encoder pushes back on the crawl instead of buffering it
+        self.queue = queue.Queue(maxsize=batch_size * 4)
+        self.error = None
+        self.stats = {"items": 0, "encoded": 0, "reused": 0, "shards": 0}
+        self.thread = threading.Thread(target=self._run, name="stream-indexer", daemon=True)
+        self.thread.start()
+
+    def _previous_vectors(self):
+        # text hash -> row of the published bundle, so unchanged texts skip the model
+        path = current_bundle_path(PROCESSED_DIR)
+        if path is None:
+            return None
+        try:
+            bundle = load_bundle(path, model_name=MODEL_NAME, mmap=True)
+        except BundleMismatchError as e:
+            logging.warning(f"Not reusing vectors from {path}: {e}")
+            return None
+        rows = {text_hash(corpus_text(item)): row for row, item in enumerate(bundle.metadata)}
+        return rows, bundle.vectors
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def catch_up(self, path):
+        # Items a crash left in the JSONL but not yet in a shard
+        if not os.path.exists(path):
+            return 0
+        done = shard_urls(self.shard_dir)
+        count = 0
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if item.get('url') and item['url'] not in done:
+                    self.put(item)
+                    count += 1
+        if count:
+            logging.info(f"Re-queued {count} items from {path} that were not in a shard yet")
+        return count
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        logging.info(f"Streaming indexer finished: {self.stats}")
+        return self.stats
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_s)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item is not False:
+                batch.append(item)
+            if batch and (item is False or len(batch) >= self.batch_size):
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if self.error is not None:
+            # Keep draining so the producer never blocks on a dead consumer
+            return
+        try:
+            texts = [corpus_text(item) for item in batch]
+            vectors = np.zeros((len(batch), self.dimension), dtype=np.float32)
+            todo = []
+            for i, text in enumerate(texts):
+                row = self.previous[0].get(text_hash(text)) if self.previous is not None else None
+                if row is None:
+                    todo.append(i)
+                else:
+                    vectors[i] = self.previous[1][row]
+            if todo:
+                vectors[todo] = self.engine.encode_texts([texts[i] for i in todo])
+            self.writer.write(batch, vectors)
+            self.stats["items"] += len(batch)
+            self.stats["encoded"] += len(todo)
+            self.stats["reused"] += len(batch) - len(todo)
+            self.stats["shards"] += 1
+        except Exception as e:
+            logging.error(f"Streaming indexer failed: {e}")
+            self.error = e
+
+
+def merge_shards(shard_dir, staging_dir):
+    # Returns (ColumnarMetadata, vectors), both memory-mapped from staging_dir,
+    # holding the last record written for every URL in shard order
+    shards = list_shards(shard_dir)
+    if not shards:
+        raise ValueError(f"No shards in {shard_dir}")
+
+    # Pass 1: winning (shard, row) per URL, plus the column names and kinds
+    winners = {}
+    columns = {}
+    lines = 0
+    for s, shard in enumerate(shards):
+        for row, record in enumerate(_records(shard_dir, shard)):
+            winners[record['url']] = (s, row)
+            lines += 1
+            for key, value in record.items():
+                columns[key] = column_kind(columns.get(key), value)
+    keep = {}
+    for s, row in sorted(winners.values()):
+        keep.setdefault(s, []).append(row)
+    count = len(winners)
+    del winners
+
+    # Pass 2: copy the winning rows, one shard at a time
+    os.makedirs(staging_dir, exist_ok=True)
+    dimension = np.load(os.path.join(shard_dir, shards[0] + ".npy"), mmap_mode="r").shape[1]
+    vectors = np.lib.format.open_memmap(os.path.join(staging_dir, "vectors.npy"), mode="w+",
+                                        dtype=np.float32, shape=(count, dimension))
+    offsets = {name: np.lib.format.open_memmap(os.path.join(staging_dir, f"{name}.offsets.npy"), mode="w+",
+                                               dtype=np.int64, shape=(count + 1,)) for name in columns}
+    nulls = {name: np.lib.format.open_memmap(os.path.join(staging_dir, f"{name}.nulls.npy"), mode="w+",
+                                             dtype=np.uint8, shape=(count,)) for name in columns}
+    raw = {name: open(os.path.join(staging_dir, f"{name}.data.raw"), "wb") for name in columns}
+    sizes = dict.fromkeys(columns, 0)
+    position = 0
+    for s, shard in enumerate(shards):
+        rows = keep.get(s)
+        if not rows:
+            continue
+        shard_vectors = np.load(os.path.join(shard_dir, shard + ".npy"), mmap_mode="r")
+        vectors[position:position + len(rows)] = shard_vectors[rows]
+        wanted = iter(rows)
+        next_row = next(wanted)
+        for row, record in enumerate(_records(shard_dir, shard)):
+            if row != next_row:
+                continue
+            for name, kind in columns.items():
+                encoded, nulls[name][position] = encode_field(record, name, kind)
+                raw[name].write(encoded)
+                sizes[name] += len(encoded)
+                offsets[name][position + 1] = sizes[name]
+            position += 1
+            next_row = next(wanted, None)
+            if next_row is None:
+                break
+    vectors.flush()
+    del vectors
+
+    for name in columns:
+        raw[name].close()
+        offsets[name].flush()
+        nulls[name].flush()
+        raw_path = os.path.join(staging_dir, f"{name}.data.raw")
+        data = np.lib.format.open_memmap(os.path.join(staging_dir, f"{name}.data.npy"), mode="w+",
+                                         dtype=np.uint8, shape=(sizes[name],))
+        with open(raw_path, "rb") as f:
+            done = 0
+            while done < sizes[name]:
+                chunk = np.frombuffer(f.read(COPY_CHUNK), dtype=np.uint8)
+                data[done:done + len(chunk)] = chunk
+                done += len(chunk)
+        data.flush()
+        del data
+        os.remove(raw_path)
+    del offsets, nulls
+
+    metadata = ColumnarMetadata.load(staging_dir, list(columns), columns, mmap=True, null_columns=list(columns))
+    merged = np.load(os.path.join(staging_dir, "vectors.npy"), mmap_mode="r")
+    logging.info(f"Merged {len(shards)} shards: {lines} records, {count} unique URLs")
+    return metadata, merged, {"shards": len(shards), "records": lines, "unique": count,
+                              "duplicates": lines - count}
+
+
+def publish(engine, shard_dir=SHARD_DIR):
+    # Merge the shards into a new bundle, then drop them
+    staging_dir = os.path.join(shard_dir, ".merge")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    metadata, vectors, report = merge_shards(shard_dir, staging_dir)
+    report.update(engine.publish_vectors(metadata, vectors))
+    # Serve from the published bundle, not from the staging files about to be removed
+    engine.load_index()
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return report
+
+
+def index_file(path=STREAM_INPUT, batch_size=STREAM_BATCH, shard_dir=SHARD_DIR):
+    # Stream an existing JSONL file through the same shard pipeline
+    started = time.time()
+    engine = EmbeddingEngine()
+    indexer = StreamingIndexer(engine, shard_dir, batch_size, resume=False)
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                indexer.put(json.loads(line))
+            except ValueError:
+                continue
+    report = {"indexer": indexer.close()}
+    report.update(publish(engine, shard_dir))
+    report["seconds"] = round(time.time() - started, 3)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed a JSONL catalog in shards and publish it as an index bundle")
+    parser.add_argument("--input", default=STREAM_INPUT, help="JSONL file with one assessment per line")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH)
+    args = parser.parse_args()
+    print(json.dumps(index_file(args.input, args.batch_size), indent=2))
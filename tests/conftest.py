@@ -0,0 +1,100 @@
+import hashlib
+import os
+import re
+import sys
+
+import numpy as np
+import pytest
+
+# The modules in src/ import each other by flat name, as they do when run from src/
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+CATALOG = [
+    {"url": "/java-8", "name": "Java 8 (New)", "type": "Knowledge & Skills",
+     "description": "Multi-choice test of Java class design, collections and exceptions."},
+    {"url": "/core-java", "name": "Core Java (Advanced Level) (New)", "type": "Knowledge & Skills",
+     "description": "Advanced Java test covering concurrency, generics and the JVM."},
+    {"url": "/python", "name": "Python (New)", "type": "Knowledge & Skills",
+     "description": "Test of Python programming, data structures and libraries."},
+    {"url": "/sql", "name": "SQL Server (New)", "type": "Knowledge & Skills",
+     "description": "Measures knowledge of SQL queries, joins and database design."},
+    {"url": "/opq32r", "name": "Occupational Personality Questionnaire OPQ32r", "type": "Personality & Behavior",
+     "description": "Personality questionnaire describing workplace behaviour and preferred style."},
+    {"url": "/opq32r-report", "name": "OPQ32r Candidate Report", "type": "Personality & Behavior",
+     "description": "Candidate feedback report built from OPQ32r personality results."},
+    {"url": "/sales", "name": "Sales Representative Solution", "type": "Simulations",
+     "description": "Simulation of sales calls, negotiation and customer relationship management."},
+    {"url": "/verify-numerical", "name": "Verify Numerical Reasoning", "type": "Ability & Aptitude",
+     "description": "Numerical reasoning test with tables, charts and percentages."},
+]
+
+
+class FakeEncoder:
+    # Stands in for the bi-encoder: a hashed bag of words, so texts sharing words
+    # are close. Counts the texts it encodes.
+    dimension = 64
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        texts = list(texts)
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+        return vectors
+
+
+class FakeCrossEncoder:
+    # Stands in for the reranker: share of query words found in the document.
+    # Counts the pairs it scores.
+    def __init__(self):
+        self.scored = []
+
+    def predict(self, pairs, **kwargs):
+        self.scored.extend(tuple(pair) for pair in pairs)
+        scores = []
+        for query, doc in pairs:
+            words = set(re.findall(r"\w+", query.lower()))
+            scores.append(len(words & set(re.findall(r"\w+", doc.lower()))) / (1 + len(words)))
+        return np.array(scores, dtype=np.float32)
+
+
+@pytest.fixture
+def processed_dir(tmp_path, monkeypatch):
+    # Keeps the embedding store and bundles away from data/processed
+    import embeddings
+    monkeypatch.setattr(embeddings, "PROCESSED_DIR", str(tmp_path))
+    monkeypatch.setattr(embeddings, "STORE_FILE", str(tmp_path / "embedding_store.npz"))
+    return tmp_path
+
+
+@pytest.fixture
+def engine(processed_dir):
+    # Flat float32 engine over CATALOG, built with the fake encoder
+    from embeddings import EmbeddingEngine
+    engine = EmbeddingEngine(index_engine="flat", storage="float32", load_model=False)
+    engine.model = FakeEncoder()
+    engine._apply_changes(None, [], [dict(item) for item in CATALOG], reuse_vectors=False)
+    return engine
+
+
+@pytest.fixture
+def recommender(engine):
+    # RecommenderSystem around the fake engine, without loading models or caches
+    from recommender import RecommenderSystem
+    system = RecommenderSystem.__new__(RecommenderSystem)
+    system.cache = None
+    system.engine = engine
+    system.semantic_cache = None
+    system.reranker = FakeCrossEncoder()
+    system.pair_cost_s = None
+    system.pretokenized = None
+    return system
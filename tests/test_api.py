@@ -0,0 +1,184 @@
+import json
+import re
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import recommender as recommender_module
+from scheduler import BatchScheduler
+
+# One exposition sample: name, optional {label="value",...}, numeric value
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? [-+0-9.eInf]+$')
+SUFFIXES = ("_bucket", "_sum", "_count")
+QUERY = {"query": "java developer who knows sql databases", "incremental": True}
+
+
+@pytest.fixture
+def client(recommender, monkeypatch):
+    # The app around the fake recommender; the client is not entered as a
+    # context manager, so the startup hook never loads the real models
+    scheduler = BatchScheduler(recommender, max_wait_ms=0).start()
+    monkeypatch.setattr(main, "rec_system", recommender)
+    monkeypatch.setattr(main, "scheduler", scheduler)
+    yield TestClient(main.app)
+    scheduler.stop()
+
+
+def ndjson_events(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def sse_events(response):
+    events = []
+    for block in response.text.split("\n\n"):
+        if block:
+            name, data = block.split("\n")
+            payload = json.loads(data[len("data: "):])
+            assert name == f"event: {payload['event']}"
+            events.append(payload)
+    return events
+
+
+def assert_partial_then_final(events, expected):
+    names = [e["event"] for e in events]
+    assert names[0] == "candidates" and names[-1] == "final"
+    assert set(names[1:-1]) == {"rerank"}
+    elapsed = [e["elapsed_ms"] for e in events]
+    assert elapsed == sorted(elapsed)
+    # The final event carries the same answer as /recommend
+    assert events[-1]["results"] == expected
+    assert events[-1]["reranked"] > 2
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Two candidates per cross-encoder round, so the 8-item catalog takes several
+    monkeypatch.setattr(recommender_module, "RERANK_CHUNK", 2)
+
+
+def test_ndjson_stream_sends_partials_then_final(client, small_chunks):
+    expected = client.post("/recommend", json={"query": QUERY["query"]}).json()
+    response = client.post("/recommend/stream", json=QUERY)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert_partial_then_final(ndjson_events(response), expected)
+
+
+def test_sse_stream_sends_partials_then_final(client, small_chunks):
+    expected = client.post("/recommend", json={"query": QUERY["query"]}).json()
+    response = client.post("/recommend/stream", json=QUERY, headers={"Accept": "text/event-stream"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert_partial_then_final(sse_events(response), expected)
+
+
+@pytest.mark.parametrize("accept, parse", [(None, ndjson_events), ("text/event-stream", sse_events)])
+def test_failed_batch_ends_stream_with_error(client, recommender, monkeypatch, accept, parse):
+    def fail(*args, **kwargs):
+        raise RuntimeError("reranker crashed")
+    monkeypatch.setattr(recommender, "recommend_batch", fail)
+    response = client.post("/recommend/stream", json=QUERY, headers={"Accept": accept or ""})
+    events = parse(response)
+    assert [e["event"] for e in events] == ["error"]
+    assert (events[0]["status"], events[0]["detail"]) == (500, "reranker crashed")
+
+
+@pytest.mark.parametrize("accept, parse", [(None, ndjson_events), ("text/event-stream", sse_events)])
+def test_deadline_ends_stream_with_timeout_error(client, recommender, monkeypatch, accept, parse):
+    recommend_batch = recommender.recommend_batch
+
+    def slow(queries, listeners=None, **options):
+        listeners[0]("candidates", [])
+        time.sleep(0.3)
+        return recommend_batch(queries, listeners=listeners, **options)
+    monkeypatch.setattr(recommender, "recommend_batch", slow)
+    monkeypatch.setattr(main, "REQUEST_TIMEOUT_S", 0.1)
+    events = parse(client.post("/recommend/stream", json=QUERY, headers={"Accept": accept or ""}))
+    # Partials sent before the deadline stay; the timeout error is always last
+    assert [e["event"] for e in events] == ["candidates", "error"]
+    assert (events[-1]["status"], events[-1]["detail"]) == (503, "Request deadline exceeded")
+
+
+
+def scrape(client):
+    # {family: {sample line without value: value}} from /metrics, checking the format
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    families = {}
+    family = None
+    for line in response.text.splitlines():
+        if line.startswith("# HELP "):
+            continue
+        if line.startswith("# TYPE "):
+            _, _, family, kind = line.split(" ")
+            assert kind in ("gauge", "counter", "histogram")
+            families[family] = {}
+            continue
+        assert SAMPLE.match(line), line
+        key, value = line.rsplit(" ", 1)
+        # Every sample follows the TYPE line of its own family
+        assert family is not None and key.split("{")[0] in (family, *(family + s for s in SUFFIXES)), line
+        families[family][key] = float(value)
+    return families
+
+
+def test_metrics_exposition_counts_a_request(client):
+    before = scrape(client)
+    client.post("/recommend", json={"query": "python data structures"})
+    after = scrape(client)
+    assert after["shl_requests_total"]["shl_requests_total"] == before["shl_requests_total"]["shl_requests_total"] + 1
+    request = after["shl_request_seconds"]
+    # Buckets are cumulative and +Inf equals the count
+    buckets = [value for key, value in request.items() if "_bucket" in key]
+    assert buckets == sorted(buckets)
+    assert request['shl_request_seconds_bucket{le="+Inf"}'] == request["shl_request_seconds_count"]
+    assert 'shl_stage_seconds_count{stage="cross_encoder"}' in after["shl_stage_seconds"]
+
+
+def test_server_timing_only_when_asked(client, monkeypatch):
+    monkeypatch.setattr(main, "TIMING_HEADER", False)
+    assert "server-timing" not in client.post("/recommend", json={"query": "python"}).headers
+    header = client.post("/recommend", json={"query": "python"}, headers={"X-Timing": "1"}).headers["server-timing"]
+    timings = dict(entry.split(";dur=") for entry in header.split(", "))
+    assert {"encode", "faiss_search", "cross_encoder", "queue"} <= set(timings)
+    assert all(float(ms) >= 0 for ms in timings.values())
+
+
+
+def test_filters_are_applied_or_refused(client, recommender, monkeypatch):
+    filtered = client.post("/recommend", json={"query": "java test", "filters": {"type": "Simulations"}})
+    assert [r["url"] for r in filtered.json()] == ["/sales"]
+    unknown = client.post("/recommend", json={"query": "java test", "filters": {"colour": "red"}})
+    assert unknown.status_code == 400
+    # Without a filter index the request fails instead of ignoring the filters
+    monkeypatch.setattr(recommender.engine, "filter_index", None)
+    for path in ("/recommend", "/recommend/stream"):
+        response = client.post(path, json={"query": "java test", "filters": {"type": "Simulations"}})
+        assert response.status_code == 503
+    assert client.post("/recommend", json={"query": "java test"}).status_code == 200
+
+def test_readyz_gates_on_startup(recommender, monkeypatch):
+    # The real initialize() over a preloaded fake recommender, as a forked serve.py worker runs it
+    monkeypatch.setattr(main, "rec_system", recommender)
+    monkeypatch.setattr(main, "scheduler", None)
+    monkeypatch.setattr(main, "inference_pool", None)
+    monkeypatch.setattr(main, "startup", main.Startup())
+    client = TestClient(main.app)
+
+    response = client.get("/readyz")
+    assert response.status_code == 503 and response.json()["status"] == "starting"
+    assert client.get("/livez").status_code == 200
+    assert client.post("/recommend", json={"query": "python"}).status_code == 503
+    assert "shl_ready 0" in client.get("/metrics").text.splitlines()
+
+    main.startup.start(main.initialize, background=False)
+    try:
+        status = client.get("/readyz")
+        assert status.status_code == 200
+        assert status.json()["ready"] and status.json()["preloaded"]
+        assert status.json()["warmup"]["rounds"] >= 1
+        assert client.post("/recommend", json={"query": "python"}).status_code == 200
+        assert "shl_ready 1" in client.get("/metrics").text.splitlines()
+    finally:
+        main.scheduler.stop()
+        main.inference_pool.shutdown(wait=False)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from benchmark import compare, synthetic_items, synthetic_vectors
+
+
+def report(**results):
+    return {"results": results}
+
+
+def flagged(entries):
+    return sorted(f"{e['benchmark']}:{e['metric']}" for e in entries)
+
+
+def test_compare_flags_changes_beyond_threshold():
+    baseline = report(search={"p50_ms": 10.0, "qps": 100.0, "recall@10": 0.95, "p99_ms": 20.0})
+    current = report(search={"p50_ms": 12.0, "qps": 130.0, "recall@10": 0.94, "p99_ms": 20.5})
+    diff = compare(current, baseline, threshold=0.1)
+    assert flagged(diff["regressions"]) == ["search:p50_ms"]
+    assert flagged(diff["improvements"]) == ["search:qps"]
+    assert diff["deltas"]["search:p99_ms"] == 0.025
+
+
+def test_compare_skips_missing_and_zero_baselines():
+    baseline = report(search={"p50_ms": 0.0}, old={"p50_ms": 5.0})
+    current = report(search={"p50_ms": 3.0, "note": "x"}, new={"p50_ms": 1.0})
+    assert compare(current, baseline)["deltas"] == {}
+
+
+def test_new_errors_regress_even_from_zero():
+    diff = compare(report(e2e={"errors": 2}), report(e2e={"errors": 0}))
+    assert flagged(diff["regressions"]) == ["e2e:errors"]
+    diff = compare(report(e2e={"errors": 1}), report(e2e={"errors": 3}))
+    assert flagged(diff["improvements"]) == ["e2e:errors"]
+    assert compare(report(e2e={"errors": 0}), report(e2e={"errors": 0}))["regressions"] == []
+
+
+def test_synthetic_data_is_reproducible():
+    first = list(synthetic_items(20, seed=3))
+    assert first == list(synthetic_items(20, seed=3))
+    assert {"name", "url", "description", "type"} <= set(first[0])
+    assert len({item["url"] for item in first}) == 20
+    vectors = synthetic_vectors(50, dim=16)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-5)
@@ -0,0 +1,94 @@
+import json
+from multiprocessing.pool import ThreadPool
+
+import bulk_score
+import recommender
+from bulk_score import ResultWriter, ordered_window
+
+
+class FakeSystem:
+    # recommend_batch stand-in: one result per query, its URL derived from the text
+    cache = None
+
+    def __init__(self):
+        self.queries = []
+
+    def recommend_batch(self, queries, k=10):
+        self.queries.extend(queries)
+        return [[{"url": f"/{q}", "name": q, "rerank_score": 1.0}] for q in queries]
+
+
+def write_input(path, queries):
+    with open(path, "w") as f:
+        for q in queries:
+            f.write(json.dumps({"Query": q}) + "\n")
+
+
+def read_output(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_window_reads_ahead_only_a_few_items():
+    consumed = []
+
+    def items():
+        for i in range(20):
+            consumed.append(i)
+            yield i
+
+    with ThreadPool(2) as pool:
+        results = ordered_window(pool, lambda x: x * 10, items(), window=3)
+        assert next(results) == 0
+        assert len(consumed) == 3
+        assert list(results) == [x * 10 for x in range(1, 20)]
+
+
+def test_writer_truncates_past_the_checkpoint_and_resumes(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    writer = ResultWriter(path, top_n=5)
+    writer.write(0, ["a", "b"], [[{"url": "/a", "score": 1.0}], []])
+    # A crash mid-chunk leaves a partial line after the last checkpoint
+    writer.file.write(b'{"row": 2, "query": "c", "resu')
+    writer.file.close()
+
+    resumed = ResultWriter(path, top_n=5)
+    assert resumed.rows_done == 2
+    resumed.write(2, ["c"], [[]])
+    resumed.close(finished=True)
+    assert [r["row"] for r in read_output(path)] == [0, 1, 2]
+    assert not (tmp_path / "out.jsonl.checkpoint").exists()
+
+
+def test_writer_starts_over_without_resume(tmp_path):
+    path = str(tmp_path / "out.csv")
+    writer = ResultWriter(path, top_n=1)
+    writer.write(0, ["a"], [[{"url": "/a", "score": 0.5}]])
+    writer.file.close()
+    restarted = ResultWriter(path, top_n=1, resume=False)
+    assert restarted.rows_done == 0
+    restarted.close(finished=True)
+    with open(path) as f:
+        assert f.read().splitlines() == ["row,Query,url_1,score_1"]
+
+
+def test_run_resumes_from_checkpoint(tmp_path, monkeypatch):
+    system = FakeSystem()
+    monkeypatch.setattr(recommender, "RecommenderSystem", lambda **kwargs: system)
+    source, output = str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")
+    queries = [f"q{i}" for i in range(7)] + [""]
+    write_input(source, queries)
+
+    # An earlier run that stopped after the first chunk
+    writer = ResultWriter(output, top_n=3)
+    writer.write(0, queries[:3], [[] for _ in range(3)])
+    writer.file.close()
+
+    summary = bulk_score.run(source, output, chunk_size=3, top_n=3)
+    assert summary["rows"] == 5 and summary["total_rows"] == 8
+    # Only rows after the checkpoint were scored; the empty query never reaches the model
+    assert system.queries == [f"q{i}" for i in range(3, 7)]
+    rows = read_output(output)
+    assert [r["row"] for r in rows] == list(range(8))
+    assert rows[4]["results"] == [{"url": "/q4", "name": "q4", "score": 1.0}]
+    assert rows[7]["results"] == []
@@ -0,0 +1,59 @@
+import faiss
+import numpy as np
+import pytest
+
+from bundle import BundleMismatchError, ColumnarMetadata, load_bundle, write_bundle
+
+RECORDS = [
+    {"url": "/a", "name": "A", "tags": ["x"], "duration": 30},
+    {"url": "/b", "name": None, "duration": None},
+    {"url": "/c", "tags": [], "duration": 0, "remote": False},
+    {"url": "/d", "name": "", "tags": None},
+]
+
+
+def flat_index(vectors):
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    return index
+
+
+def test_columns_round_trip_missing_and_null_fields():
+    metadata = ColumnarMetadata.from_records(RECORDS)
+    assert metadata.kinds == {"url": "str", "name": "str", "tags": "json", "duration": "json", "remote": "json"}
+    assert list(metadata) == RECORDS
+    # Column access reads a null and a missing field alike
+    assert metadata.value("tags", 1) is None and metadata.value("tags", 3) is None
+    assert metadata.value("name", 3) == ""
+
+
+def test_columns_without_nulls_keep_no_mask():
+    metadata = ColumnarMetadata.from_records([{"url": "/a"}, {"url": "/b"}])
+    assert metadata.nulls == {}
+
+
+def test_bundle_round_trip(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    path = write_bundle(str(tmp_path), flat_index(vectors), vectors, RECORDS, "model", "hash")
+    for mmap in (True, False):
+        bundle = load_bundle(path, model_name="model", mmap=mmap)
+        assert list(bundle.metadata) == RECORDS
+        np.testing.assert_array_equal(bundle.vectors, vectors)
+
+
+def test_bundle_with_swapped_metadata_fails_to_load(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    path = write_bundle(str(tmp_path), flat_index(vectors), vectors, RECORDS, "model", "hash")
+    # Same row count, rows in another order: counts and dimension still agree
+    ColumnarMetadata.from_records(RECORDS[::-1]).save(path)
+    with pytest.raises(BundleMismatchError, match="checksum"):
+        load_bundle(path)
+
+
+def test_bundle_with_truncated_vectors_fails_to_load(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    path = write_bundle(str(tmp_path), flat_index(vectors), vectors, RECORDS, "model", "hash")
+    with open(f"{path}/vectors.npy", "ab") as f:
+        f.write(b"\0" * 16)
+    with pytest.raises(BundleMismatchError):
+        load_bundle(path)
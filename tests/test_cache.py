@@ -0,0 +1,144 @@
+import time
+
+import numpy as np
+
+from cache import LRUCache, QueryCache, SemanticCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_entries_expire():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_new_index_version_invalidates_every_tier():
+    cache = QueryCache(maxsize=10, ttl=0, path="")
+    cache.set_version("v1")
+    cache.put("vectors", np.ones(2), "java")
+    cache.put("scores", 0.5, "java", "/java-8")
+    assert cache.get("scores", "java", "/java-8") == 0.5
+    cache.set_version("v2")
+    assert cache.get("vectors", "java") is None
+    assert cache.get("scores", "java", "/java-8") is None
+
+
+def test_disk_tier_survives_restart_but_not_a_rebuild(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = QueryCache(maxsize=10, ttl=0, path=path)
+    first.set_version("v1")
+    first.put("scores", 0.25, "java", "/java-8")
+
+    restarted = QueryCache(maxsize=10, ttl=0, path=path)
+    restarted.set_version("v1")
+    assert restarted.get("scores", "java", "/java-8") == 0.25
+    restarted.set_version("v2")
+    restarted.set_version("v1")
+    assert restarted.get("scores", "java", "/java-8") is None
+
+
+def test_engine_reuses_cached_vectors_and_candidates(engine):
+    engine.cache = QueryCache(maxsize=100, ttl=0, path="")
+    engine._set_index_version()
+    first = engine.search_batch(["python data", "java"], k=3)
+    encoded = len(engine.model.encoded)
+    second = engine.search_batch(["java", "python data"], k=3)
+    # No bi-encoder call and no FAISS search the second time
+    assert len(engine.model.encoded) == encoded
+    assert engine.cache.stats()["candidates"]["memory"]["hits"] == 2
+    assert second == first[::-1]
+    # Filters are part of the candidates key
+    engine.search_batch(["java"], k=3, filters={"type": "Simulations"})
+    assert engine.cache.stats()["candidates"]["memory"]["misses"] == 3
+
+
+def test_recommender_scores_each_pair_once(recommender):
+    recommender.cache = QueryCache(maxsize=100, ttl=0, path="")
+    recommender.cache.set_version(recommender.engine.index_version)
+    first = recommender.recommend("java test", k=3)
+    scored = len(recommender.reranker.scored)
+    second = recommender.recommend("java test", k=3)
+    assert len(recommender.reranker.scored) == scored
+    assert len(set(recommender.reranker.scored)) == scored
+    assert [r["url"] for r in first] == [r["url"] for r in second]
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).reshape(1, -1)
+
+
+def semantic_cache(**kwargs):
+    return SemanticCache(**{"maxsize": 10, "ttl": 0, "threshold": 0.9, "audit_rate": 0, **kwargs})
+
+
+def test_semantic_hit_needs_similar_query_and_same_options():
+    cache = semantic_cache()
+    options = SemanticCache.options_key(k=3, filters=None)
+    cache.put("java developer", unit(1, 0, 0)[0], options, [{"url": "/java-8"}], "v1")
+    hit = cache.lookup(np.vstack([unit(1, 0.1, 0), unit(1, 1, 0)]), options, "v1")
+    assert hit[0][0] == [{"url": "/java-8"}] and hit[0][1] > 0.9
+    assert hit[1] is None
+    assert cache.lookup(unit(1, 0, 0), SemanticCache.options_key(k=5, filters=None), "v1") == [None]
+
+
+def test_semantic_hits_are_copies():
+    cache = semantic_cache()
+    cache.put("q", unit(1, 0)[0], "o", [{"url": "/a"}], "v1")
+    cache.lookup(unit(1, 0), "o", "v1")[0][0][0]["url"] = "/changed"
+    assert cache.lookup(unit(1, 0), "o", "v1")[0][0] == [{"url": "/a"}]
+
+
+def test_semantic_cache_drops_entries_on_new_version():
+    cache = semantic_cache()
+    cache.put("q", unit(1, 0)[0], "o", [{"url": "/a"}], "v1")
+    assert cache.lookup(unit(1, 0), "o", "v2") == [None]
+    assert cache.stats()["invalidations"] == 1
+    assert cache.lookup(unit(1, 0), "o", "v1") == [None]
+
+
+def test_semantic_cache_evicts_and_expires():
+    cache = semantic_cache(maxsize=2)
+    for i, vector in enumerate([unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)]):
+        cache.put(f"q{i}", vector[0], "o", [{"url": f"/{i}"}], "v1")
+    assert cache.lookup(unit(1, 0, 0), "o", "v1") == [None]
+    assert cache.stats()["evictions"] == 1 and cache.index.ntotal == 2
+
+    expiring = semantic_cache(ttl=0.01)
+    expiring.put("q", unit(1, 0)[0], "o", [{"url": "/a"}], "v1")
+    time.sleep(0.02)
+    assert expiring.lookup(unit(1, 0), "o", "v1") == [None]
+    assert expiring.index.ntotal == 0
+
+
+def test_audited_hits_record_overlap():
+    cache = semantic_cache(audit_rate=1.0)
+    cache.put("q", unit(1, 0)[0], "o", [{"url": "/a"}, {"url": "/b"}], "v1")
+    results, _, audit = cache.lookup(unit(1, 0), "o", "v1")[0]
+    assert audit
+    cache.put("q2", unit(1, 0)[0], "o", [{"url": "/a"}, {"url": "/c"}], "v1", cached=results)
+    assert cache.stats()["mean_overlap"] == 0.5
+
+
+def test_recommender_answers_repeat_queries_from_semantic_cache(recommender):
+    recommender.semantic_cache = semantic_cache(threshold=0.99)
+    first = recommender.recommend("java test", k=3)
+    scored = len(recommender.reranker.scored)
+    trace = {}
+    assert recommender.recommend("Java test", k=3, trace=trace) == first
+    assert trace["rerank_stop"] == "semantic"
+    assert len(recommender.reranker.scored) == scored
+    # A latency budget bypasses the cache
+    recommender.recommend("java test", k=3, latency_budget_ms=10000)
+    assert len(recommender.reranker.scored) > scored
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crawler as crawler_module
+import scraper
+from crawler import Crawler
+
+CATALOG_PATH = "/solutions/products/product-catalog/"
+PRODUCTS = {
+    "java-8-new": ("Java 8 (New)", "Multi-choice test that measures knowledge of Java class design and exceptions."),
+    "opq32r": ("Occupational Personality Questionnaire OPQ32r", "Personality questionnaire for workplace behaviour."),
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # A catalog listing on the first page and one detail page per product, with ETags
+    flaky = {}
+    hits = []
+    retry_after = "0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.flaky.get(self.path, 0) > 0:
+            self.flaky[self.path] -= 1
+            return self._send(503, headers={"Retry-After": self.retry_after})
+        if self.path.startswith(CATALOG_PATH + "?start="):
+            links = ""
+            if self.path.endswith("start=0"):
+                links = "".join(f'<a href="{CATALOG_PATH}view/{slug}/">{name}</a>' for slug, (name, _) in PRODUCTS.items())
+            return self._send(200, f"<html><body>{links}</body></html>".encode())
+        for slug, (name, description) in PRODUCTS.items():
+            if self.path == f"{CATALOG_PATH}view/{slug}/":
+                etag = f'"{slug}-v1"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers={"ETag": etag})
+                page = (f'<html><head><meta name="description" content="{description}"></head>'
+                        f"<body><main><p>{description} It takes about 15 minutes.</p></main></body></html>")
+                return self._send(200, page.encode(), {"ETag": etag})
+        self._send(404)
+
+
+@pytest.fixture
+def stub_site(tmp_path, monkeypatch):
+    StubHandler.flaky = {}
+    StubHandler.hits = []
+    StubHandler.retry_after = "0"
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # Same as SHL_SCRAPE_BASE_URL; output paths are relative to the working directory
+    monkeypatch.setattr(scraper, "BASE_URL", base_url)
+    monkeypatch.setattr(scraper, "START_URL", base_url + CATALOG_PATH)
+    monkeypatch.chdir(tmp_path)
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+def _crawler(tmp_path):
+    return Crawler(cache_dir=str(tmp_path / "http_cache"), rate=0, retries=3)
+
+
+def _output():
+    with open(scraper.OUTPUT_FILE) as f:
+        return {item["url"]: item for item in json.load(f)}
+
+
+def test_crawler_verifies_tls_by_default():
+    assert Crawler(cache_dir="").verify is True
+
+
+def test_scrape_against_stub_server(stub_site, tmp_path):
+    scraper.main(crawler=_crawler(tmp_path), parse_workers=1)
+
+    items = _output()
+    assert set(items) == {f"{stub_site}{CATALOG_PATH}view/{slug}/" for slug in PRODUCTS}
+    java = items[f"{stub_site}{CATALOG_PATH}view/java-8-new/"]
+    assert java["name"] == "Java 8 (New)"
+    assert java["description"].startswith("Multi-choice test")
+    assert java["type"] == "Technical"
+
+
+def test_refresh_uses_conditional_gets(stub_site, tmp_path):
+    scraper.main(crawler=_crawler(tmp_path), parse_workers=1)
+    first = _output()
+
+    crawler = _crawler(tmp_path)
+    scraper.main(refresh=True, crawler=crawler, parse_workers=1)
+    # Detail pages answer 304 and keep the records parsed last time
+    assert crawler.stats["not_modified"] >= len(PRODUCTS)
+    assert _output() == first
+
+
+def test_retries_transient_errors(stub_site, tmp_path):
+    detail = f"{CATALOG_PATH}view/opq32r/"
+    StubHandler.flaky[detail] = 2
+    crawler = _crawler(tmp_path)
+    scraper.main(crawler=crawler, parse_workers=1)
+
+    assert StubHandler.hits.count(detail) == 3
+    assert crawler.stats["retries"] >= 2
+    assert f"{stub_site}{detail}" in _output()
+
+
+def test_retry_after_is_capped(stub_site, tmp_path, monkeypatch):
+    detail = f"{CATALOG_PATH}view/opq32r/"
+    StubHandler.flaky[detail] = 1
+    StubHandler.retry_after = "3600"
+    monkeypatch.setattr(crawler_module, "BACKOFF_MAX_S", 0.05)
+    started = time.time()
+    scraper.main(crawler=_crawler(tmp_path), parse_workers=1)
+
+    # The server asked for an hour; the retry waited at most the backoff cap
+    assert time.time() - started < 5
+    assert StubHandler.hits.count(detail) == 2
+    assert f"{stub_site}{detail}" in _output()
@@ -0,0 +1,69 @@
+import numpy as np
+
+from diversity import dedupe, diversify, mmr
+
+
+def unit(*rows):
+    vectors = np.asarray(rows, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_dedupe_keeps_best_ranked_copy():
+    results = [{"url": "a", "rerank_score": 3}, {"url": "b", "rerank_score": 2}, {"url": "a", "rerank_score": 1}]
+    assert dedupe(results) == results[:2]
+
+
+def test_lambda_one_is_relevance_order():
+    vectors = unit([1, 0], [1, 0.01], [0, 1])
+    assert mmr([1.0, 0.9, 0.1], vectors, 3, lam=1.0) == [0, 1, 2]
+
+
+def test_near_duplicate_gives_way():
+    # 1 is a near copy of 0, so the less relevant but different 2 goes second
+    vectors = unit([1, 0], [1, 0.01], [0, 1])
+    assert mmr([1.0, 0.9, 0.6], vectors, 2, lam=0.5) == [0, 2]
+
+
+def test_type_quota_caps_a_type_then_relaxes():
+    vectors = np.eye(5, dtype=np.float32)
+    types = ["T", "T", "T", "B", "T"]
+    # Half of k=4 for any one type: two Technical, the only Behavioral, then the
+    # quota relaxes because nothing else is left
+    assert mmr([1.0, 0.9, 0.8, 0.1, 0.7], vectors, 4, lam=1.0, types=types, quota=0.5) == [0, 1, 3, 2]
+
+
+def test_diversify_dedupes_before_truncating():
+    vectors = unit([1, 0], [1, 0.01], [0, 1])
+    positions = {"a": 0, "a2": 1, "b": 2}
+    results = dedupe([
+        {"url": "a", "rerank_score": 5.0},
+        {"url": "a", "rerank_score": 4.5},
+        {"url": "a2", "rerank_score": 4.0},
+        {"url": "b", "rerank_score": 1.0},
+    ])
+    picked = diversify(results, vectors, positions, 2, lam=0.5, quota=0)
+    assert [r["url"] for r in picked] == ["a", "b"]
+
+
+def test_unscored_tail_keeps_its_place():
+    vectors = unit([1, 0], [1, 0.01], [0, 1])
+    positions = {"a": 0, "a2": 1, "b": 2}
+    results = [{"url": "a", "rerank_score": 2.0}, {"url": "a2", "rerank_score": 1.9}, {"url": "b"}]
+    picked = diversify(results, vectors, positions, 3, lam=0.5, quota=0)
+    # Only scored results are reordered; the FAISS-ordered tail stays behind them
+    assert [r["url"] for r in picked] == ["a", "a2", "b"]
+
+
+def test_missing_vectors_fall_back_to_rerank_order():
+    results = [{"url": "a", "rerank_score": 2.0}, {"url": "x", "rerank_score": 1.0}]
+    assert diversify(results, unit([1, 0]), {"a": 0}, 2, lam=0.5) == results
+
+
+def test_recommender_diversifies_only_when_asked(recommender):
+    query = "opq32r personality questionnaire report"
+    plain = recommender.recommend_batch([query], k=3)[0]
+    assert plain == recommender.recommend_batch([query], k=3, diversity=False)[0]
+    diverse = recommender.recommend_batch([query], k=3, diversity=True)[0]
+    assert len({r["url"] for r in diverse}) == 3
+    # MMR reorders the same scored candidates; the best one always stays first
+    assert diverse[0]["url"] == plain[0]["url"]
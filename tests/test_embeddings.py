@@ -0,0 +1,79 @@
+import faiss
+import numpy as np
+
+from conftest import CATALOG, FakeEncoder
+from embeddings import EmbeddingEngine, corpus_text
+
+
+def rebuild(engine, items):
+    # Incremental update against the engine's current index, as create_index does after a reload
+    previous_index, previous_items = engine.index, list(engine.assessments)
+    engine.model.encoded.clear()
+    return engine._apply_changes(previous_index, previous_items, items)
+
+
+def labels_by_url(engine):
+    return {item["url"]: int(label)
+            for item, label in zip(engine.assessments, faiss.vector_to_array(engine.index.id_map))}
+
+
+def test_first_build_encodes_everything(engine):
+    assert len(engine.model.encoded) == len(CATALOG)
+    assert engine.index.ntotal == len(CATALOG)
+    assert engine.url_positions == {item["url"]: i for i, item in enumerate(engine.assessments)}
+
+
+def test_only_new_and_changed_texts_are_encoded(engine):
+    before = labels_by_url(engine)
+    items = [dict(item) for item in CATALOG if item["url"] != "/sql"]
+    items[0]["description"] = "Rewritten description of the Java 8 test."
+    items.append({"url": "/go", "name": "Go (New)", "type": "Knowledge & Skills", "description": "Go test."})
+
+    report = rebuild(engine, items)
+    assert {key: report[key] for key in ("added", "changed", "deleted", "unchanged", "encoded")} == \
+        {"added": 1, "changed": 1, "deleted": 1, "unchanged": len(CATALOG) - 2, "encoded": 2}
+    assert sorted(engine.model.encoded) == sorted([corpus_text(items[0]), corpus_text(items[-1])])
+    after = labels_by_url(engine)
+    # Kept and changed items keep their labels; the new one gets a fresh label
+    assert all(after[url] == before[url] for url in after if url != "/go")
+    assert after["/go"] > max(before.values())
+    assert "/sql" not in after
+
+
+def test_metadata_and_vectors_stay_aligned(engine):
+    items = [dict(item) for item in CATALOG[::-1]]
+    items[2]["name"] = "Renamed assessment"
+    rebuild(engine, items)
+    encoder = FakeEncoder()
+    for item, vector in zip(engine.assessments, engine.vectors):
+        expected = encoder.encode([corpus_text(item)])[0]
+        np.testing.assert_allclose(vector, expected / np.linalg.norm(expected), rtol=1e-6)
+    hits = engine.search("Renamed assessment", k=1)
+    assert hits[0]["name"] == "Renamed assessment"
+
+
+def test_duplicate_urls_keep_the_last_record(engine):
+    items = [dict(item) for item in CATALOG] + [dict(CATALOG[0], name="Java 8 (Updated)")]
+    report = rebuild(engine, items)
+    assert report["total"] == len(CATALOG) and report["changed"] == 1
+    assert engine.assessments[engine.url_positions["/java-8"]]["name"] == "Java 8 (Updated)"
+
+
+def test_reverted_text_reuses_stored_vector(engine):
+    original = [dict(item) for item in CATALOG]
+    edited = [dict(item) for item in CATALOG]
+    edited[1]["description"] = "Temporary text."
+    rebuild(engine, edited)
+    report = rebuild(engine, original)
+    # The embedding store only keeps current texts, so the old one is encoded again
+    assert report["changed"] == 1 and report["encoded"] == 1
+    assert rebuild(engine, original)["encoded"] == 0
+
+
+def test_full_rebuild_ignores_previous_index(processed_dir):
+    engine = EmbeddingEngine(index_engine="flat", storage="float32", load_model=False)
+    engine.model = FakeEncoder()
+    engine._apply_changes(None, [], CATALOG, reuse_vectors=False)
+    engine.model.encoded.clear()
+    report = engine._apply_changes(None, [], CATALOG, reuse_vectors=False)
+    assert report["encoded"] == len(CATALOG) and report["added"] == len(CATALOG)
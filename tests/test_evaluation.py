@@ -0,0 +1,37 @@
+import pytest
+
+from evaluation import normalize_url, ranking_metrics, relevance_matrix
+
+# Two queries: the first has three relevant URLs and finds two of them at ranks 1
+# and 3; the second has one and finds it at rank 2
+RANKED = [["a", "x", "b"], ["y", "c", "z"]]
+RELEVANT = [["a", "b", "d"], ["c"]]
+
+
+def test_normalize_url_drops_domain_and_solutions():
+    assert normalize_url("https://www.shl.com/solutions/products/java-8") == "/products/java-8/"
+    assert normalize_url("/products/java-8/") == "/products/java-8/"
+
+
+def test_relevance_matrix_marks_hits():
+    rel = relevance_matrix(RANKED, RELEVANT, depth=3)
+    assert rel.tolist() == [[1, 0, 1], [0, 1, 0]]
+    assert relevance_matrix(RANKED, RELEVANT, depth=2).tolist() == [[1, 0], [0, 1]]
+
+
+def test_ranking_metrics_match_hand_computed_values():
+    metrics = ranking_metrics(relevance_matrix(RANKED, RELEVANT, 3), [3, 1], ks=(1, 3))
+    expected = {
+        "mrr": (1 + 1 / 2) / 2,
+        # Macro: (1/3 + 0) / 2 and (2/3 + 1) / 2
+        "recall@1": 1 / 6, "recall@3": 5 / 6,
+        # Rows: 1 of 4 and 3 of 4 labelled (query, URL) pairs
+        "row_recall@1": 0.25, "row_recall@3": 0.75,
+        "hit_rate@1": 0.5, "hit_rate@3": 1.0,
+        # IDCG@3 is 1 + 1/log2(3) + 1/2 for the first query and 1 for the second
+        "ndcg@1": 0.5, "ndcg@3": ((1 + 0.5) / (1 + 1 / 1.5849625 + 0.5) + 1 / 1.5849625) / 2,
+        # AP@k divides by min(relevant, k): (1 + 2/3) / 3 and (1/2) / 1 at 3
+        "map@1": (1 + 0) / 2, "map@3": (5 / 9 + 1 / 2) / 2,
+    }
+    for name, value in expected.items():
+        assert metrics[name] == pytest.approx(value, abs=1e-4), name
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from filters import UnknownFilterError, normalize_filters
+
+SKILLS = "Knowledge & Skills"
+
+
+def brute_force(engine, query, k, allowed):
+    # Exact top-k over the allowed types, straight from the stored vectors
+    query_vec = engine.encode_queries([query])[0]
+    rows = [i for i, item in enumerate(engine.assessments) if item["type"] in allowed]
+    rows.sort(key=lambda i: -float(engine.vectors[i] @ query_vec))
+    return [engine.assessments[i]["url"] for i in rows[:k]]
+
+
+def test_normalize_filters_is_canonical():
+    assert normalize_filters({"type": ["b", "a"], "x": None}) == (("type", ("a", "b")),)
+    assert normalize_filters({"type": "a"}) == normalize_filters({"type": ["a"]})
+    assert normalize_filters({}) is None
+
+
+def test_mask_ors_values_and_ands_fields(engine):
+    filters = normalize_filters({"type": [SKILLS, "Simulations"]})
+    mask = engine.filter_index.mask(filters)
+    assert [item["type"] for item, keep in zip(engine.assessments, mask) if keep].count(SKILLS) == 4
+    assert mask.sum() == 5
+    both = normalize_filters({"type": SKILLS, "name": "Python (New)"})
+    assert [engine.assessments[i]["url"] for i in np.flatnonzero(engine.filter_index.mask(both))] == ["/python"]
+
+
+def test_unknown_field_is_rejected(engine):
+    with pytest.raises(UnknownFilterError):
+        engine.filter_index.mask(normalize_filters({"colour": "red"}))
+
+
+def test_partitions_are_built_on_first_use(engine):
+    assert engine.filter_index.partitions == {}
+    engine.search_vectors(engine.encode_queries(["java"]), k=3, filters={"type": [SKILLS, "Simulations"]})
+    # Multi-value filters use the bitmap over the main index
+    assert engine.filter_index.partitions == {}
+    engine.search_vectors(engine.encode_queries(["java"]), k=3, filters={"type": SKILLS})
+    assert list(engine.filter_index.partitions) == [("type", SKILLS)]
+
+
+@pytest.mark.parametrize("allowed", [[SKILLS], [SKILLS, "Simulations"], ["Personality & Behavior"]])
+def test_filtered_search_matches_brute_force(engine, allowed):
+    results = engine.search_vectors(engine.encode_queries(["personality test of java"]), k=3,
+                                    filters={"type": allowed})[0]
+    assert [r["url"] for r in results] == brute_force(engine, "personality test of java", 3, allowed)
+
+
+def test_filter_with_fewer_matches_than_k(engine):
+    results = engine.search_batch(["sales"], k=5, filters={"type": "Simulations"})[0]
+    assert [r["url"] for r in results] == ["/sales"]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import index_engines
+from benchmark import synthetic_queries, synthetic_vectors
+from index_engines import (autotune, build_index, exact_labels, hold_out, label_lookup, recall_at_k,
+                           search_rescored)
+
+TARGET = 0.9
+
+
+def recall(index, vectors, queries, k=10, rescore_factor=1):
+    _, found = search_rescored(index, queries, k, vectors, label_lookup(index), rescore_factor)
+    return recall_at_k(found, exact_labels(index, vectors, queries, k))
+
+
+@pytest.mark.parametrize("storage", ["sq8", "pq"])
+def test_exact_rescore_restores_recall(monkeypatch, storage):
+    # 16 sub-quantizers keep PQ training quick; its codes alone lose much of the top 10
+    monkeypatch.setattr(index_engines, "PQ_M", 16)
+    vectors = synthetic_vectors(600, dim=32, clusters=16)
+    queries = synthetic_queries(vectors, 100)
+    index, _ = build_index("flat", vectors, np.arange(len(vectors)), storage)
+    raw = recall(index, vectors, queries)
+    rescored = recall(index, vectors, queries, rescore_factor=4)
+    assert rescored >= 0.95 and rescored > raw
+    if storage == "pq":
+        assert raw < 0.8
+
+
+@pytest.mark.parametrize("engine", ["hnsw", "ivf-flat"])
+def test_autotune_meets_target_on_held_out_queries(engine):
+    vectors = synthetic_vectors(2000, dim=64, clusters=16)
+    index, build = build_index(engine, vectors, np.arange(len(vectors)))
+    tuning = autotune(index, engine, build, vectors, synthetic_queries(vectors, 100, seed=1), k=10, target=TARGET)
+    # The cheapest value that reaches the target on the tuning queries...
+    assert tuning["recall"] >= TARGET
+    assert all(point["recall"] < TARGET for point in tuning["sweep"][:-1])
+    # ...is left set on the index and still reaches it on queries it never saw
+    assert recall(index, vectors, synthetic_queries(vectors, 200, seed=2)) >= TARGET
+
+
+def test_hold_out_drops_each_querys_own_label():
+    found = np.array([[3, 1, 2], [5, 6, 7]])
+    assert hold_out(found, np.array([1, -1]), 2).tolist() == [[3, 2], [5, 6]]
+    assert hold_out(found, None, 2).tolist() == [[3, 1], [5, 6]]
@@ -0,0 +1,87 @@
+import numpy as np
+
+import recommender as recommender_module
+
+from conftest import CATALOG
+from lexical import BM25Index, is_code, reciprocal_rank_fusion, tokenize
+
+
+def urls(rows):
+    return [CATALOG[row]["url"] for row in rows]
+
+
+def test_tokenize_keeps_codes_and_skills_whole():
+    assert tokenize("OPQ32r, C++ and C# on Java 7.1") == ["opq32r", "c++", "and", "c#", "on", "java", "7.1"]
+    assert is_code("opq32r") and not is_code("c++") and not is_code("7.1")
+
+
+def test_bm25_ranks_name_matches_first():
+    index = BM25Index.build(CATALOG)
+    positions, scores = index.search("java", 3)
+    assert urls(positions) == ["/java-8", "/core-java"]
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_bm25_mask_excludes_rows():
+    index = BM25Index.build(CATALOG)
+    mask = np.array([item["type"] != "Knowledge & Skills" for item in CATALOG])
+    positions, _ = index.search("java personality", 5, mask)
+    assert urls(positions) == ["/opq32r", "/opq32r-report"]
+
+
+def test_arrays_round_trip():
+    index = BM25Index.build(CATALOG)
+    arrays, documents = index.to_arrays()
+    loaded = BM25Index.from_arrays(arrays, documents, CATALOG)
+    np.testing.assert_array_equal(loaded.scores("sql database"), index.scores("sql database"))
+
+
+def test_exact_matches_full_names_and_codes_only():
+    index = BM25Index.build(CATALOG)
+    assert urls(index.exact_matches("Python (New)")) == ["/python"]
+    # Shortest name containing the code first
+    assert urls(index.exact_matches("opq32r")) == ["/opq32r-report", "/opq32r"]
+    # Job titles and skills are not product lookups, even when they appear in names
+    assert index.exact_matches("Sales Representative") == []
+    assert index.exact_matches("java") == []
+    mask = np.array([item["url"] != "/opq32r-report" for item in CATALOG])
+    assert urls(index.exact_matches("OPQ32r", mask)) == ["/opq32r"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    # Second in both lists beats first in one
+    assert [key for key, _ in fused] == ["b", "a", "d", "c"]
+    assert np.isclose(dict(fused)["b"], 1 / 62 + 1 / 61)
+
+
+def test_hybrid_search_adds_lexical_hits_with_dense_scores(engine):
+    results = engine.search_batch(["negotiation"], k=3)[0]
+    assert results[0]["url"] == "/sales"
+    assert "bm25_score" in results[0] and "rrf_score" in results[0]
+    vector = engine.vectors[engine.url_positions["/sales"]]
+    query = engine.encode_queries(["negotiation"])[0]
+    assert np.isclose(results[0]["score"], float(vector @ query))
+
+
+def test_lexical_matches_only_for_lookups(engine):
+    assert engine.lexical_matches("Sales Representative") is None
+    assert [r["url"] for r in engine.lexical_matches("OPQ32r", k=1)] == ["/opq32r-report"]
+    filtered = engine.lexical_matches("OPQ32r", filters={"type": "Simulations"})
+    assert filtered is None
+
+
+def test_shortcut_is_off_by_default(recommender):
+    trace = {}
+    recommender.recommend("OPQ32r", k=3, trace=trace)
+    assert trace["rerank_stop"] != "lexical"
+
+
+def test_shortcut_fills_up_to_k(recommender, monkeypatch):
+    monkeypatch.setattr(recommender_module, "SHORTCIRCUIT", True)
+    trace = {}
+    results = recommender.recommend("OPQ32r", k=4, trace=trace)
+    assert trace["rerank_stop"] == "lexical"
+    # Exact matches first, then retrieval results, with no repeats
+    assert [r["url"] for r in results[:2]] == ["/opq32r-report", "/opq32r"]
+    assert len({r["url"] for r in results}) == 4
@@ -0,0 +1,87 @@
+import numpy as np
+
+from long_query import aggregate, chunk_query, condense, select_chunks, sentences
+
+TERMS = {"java", "sql", "server", "python"}
+JD = ("We are a great company. Must know Java and SQL Server. Free snacks. "
+      "Python is a plus. We are a great company.")
+
+
+def catalog_weight(text):
+    # Stands in for the BM25 term weight: catalog terms in the text
+    return sum(word.strip(".,").lower() in TERMS for word in text.split())
+
+
+def test_sentences_split_on_punctuation_lines_and_bullets():
+    text = "Java developer. Knows SQL; builds APIs\nAgile team • remote, flexible hours"
+    assert sentences(text, max_words=3) == ["Java developer.", "Knows SQL;", "builds APIs", "Agile team",
+                                            "remote, flexible hours"]
+    # Run-on text is windowed
+    assert sentences("a b c d e f g", max_words=3) == ["a b c", "d e f", "g"]
+
+
+def test_short_queries_are_one_chunk():
+    assert chunk_query("Java developer", chunk_words=5) == ["Java developer"]
+
+
+def test_chunks_pack_whole_sentences():
+    text = "one two three. four five six. seven eight nine ten eleven twelve."
+    assert chunk_query(text, chunk_words=5) == ["one two three.", "four five six.", "seven eight nine ten eleven",
+                                                "twelve."]
+    # With ten words the six-word sentence stays whole
+    assert chunk_query(text, chunk_words=10) == ["one two three. four five six.",
+                                                 "seven eight nine ten eleven twelve."]
+
+
+def test_chunk_cap_keeps_heaviest_in_order():
+    text = "one two three. four five six. seven eight nine ten eleven twelve."
+    assert chunk_query(text, chunk_words=5, max_chunks=2) == ["one two three.", "seven eight nine ten eleven"]
+    # Later chunks weigh more here, so the last two survive
+    weight = lambda chunk: text.index(chunk)
+    assert chunk_query(text, weight=weight, chunk_words=5, max_chunks=2) == ["seven eight nine ten eleven",
+                                                                           "twelve."]
+
+
+def chunk_hits():
+    # Query 0 has one chunk (row 0); query 1 has two (rows 1 and 2)
+    labels = np.array([[5, 6, -1], [1, 2, 3], [2, 4, 1]], dtype=np.int64)
+    distances = np.array([[0.9, 0.8, -np.inf], [0.9, 0.5, 0.4], [0.8, 0.7, 0.3]], dtype=np.float32)
+    return distances, labels, np.array([0, 1, 1])
+
+
+def test_aggregate_max_keeps_best_chunk_score():
+    distances, labels = aggregate(*chunk_hits(), count=2, k=4, how="max")
+    assert labels.tolist() == [[5, 6, -1, -1], [1, 2, 4, 3]]
+    np.testing.assert_allclose(distances[1], [0.9, 0.8, 0.7, 0.4])
+
+
+def test_aggregate_sum_averages_over_chunks():
+    distances, labels = aggregate(*chunk_hits(), count=2, k=3, how="sum")
+    # 2: (0.5 + 0.8) / 2, 1: (0.9 + 0.3) / 2, 4: 0.7 / 2
+    assert labels[1].tolist() == [2, 1, 4]
+    np.testing.assert_allclose(distances[1], [0.65, 0.6, 0.35], rtol=1e-6)
+
+
+def test_select_chunks_renumbers_owners():
+    vectors = np.arange(8, dtype=np.float32).reshape(4, 2)
+    chunk_vecs, owners = select_chunks((vectors, np.array([0, 1, 1, 2])), [2, 1])
+    assert owners.tolist() == [1, 1, 0]
+    np.testing.assert_array_equal(chunk_vecs, vectors[1:])
+
+
+def test_condense_keeps_catalog_sentences_in_order():
+    assert condense(JD, budget=100, weight=catalog_weight) == JD
+    assert condense(JD, budget=10, weight=catalog_weight) == "Must know Java and SQL Server. Python is a plus."
+    # Python no longer fits; filler without catalog terms is never added
+    assert condense(JD, budget=8, weight=catalog_weight) == "Must know Java and SQL Server."
+
+
+def test_condense_falls_back_to_leading_words_of_best_sentence():
+    assert condense(JD, budget=3, weight=catalog_weight) == "Must know Java"
+
+
+def test_condense_counts_reranker_tokens():
+    # Two tokens per word: the budget of 12 holds the six-word sentence only
+    count_tokens = lambda text: 2 * len(text.split())
+    assert condense(JD, budget=12, count_tokens=count_tokens, weight=catalog_weight) == \
+        "Must know Java and SQL Server."
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+tokenizers = pytest.importorskip("tokenizers")
+transformers = pytest.importorskip("transformers")
+
+from pretokenized import PretokenizedReranker, doc_text, longest_first
+
+WORDS = [f"w{i}" for i in range(300)]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    # A BERT-shaped fast tokenizer built in memory: [CLS] q [SEP] d [SEP]
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    vocab = {"[PAD]": 0, "[UNK]": 1, "[CLS]": 2, "[SEP]": 3, ".": 4}
+    vocab.update({w: i + 5 for i, w in enumerate(WORDS)})
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tok.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tok, pad_token="[PAD]", unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]",
+        model_input_names=["input_ids", "token_type_ids", "attention_mask"],
+    )
+
+
+def fingerprint(features):
+    # Stands in for the cross-encoder: any change to a pair's real tokens changes its score
+    mask = features["attention_mask"]
+    weights = np.arange(1, mask.shape[1] + 1)
+    return ((features["input_ids"] * 7 + features["token_type_ids"]) * weights * mask).sum(axis=1).astype(np.float32)
+
+
+def text(n, offset=0):
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(n))
+
+
+@pytest.mark.parametrize("query_len,doc_len,budget", [
+    (3, 4, 10), (3, 30, 10), (30, 3, 10), (20, 20, 21), (21, 20, 21), (0, 40, 9), (40, 1, 9),
+])
+def test_longest_first_matches_the_fast_tokenizer(tokenizer, query_len, doc_len, budget):
+    encoded = tokenizer(text(query_len), text(doc_len, 50) + " .", truncation="longest_first", max_length=budget + 3)
+    types = encoded["token_type_ids"]
+    # Minus [CLS] [SEP] on the query side and [SEP] on the document side
+    assert longest_first(query_len, doc_len + 1, budget) == (types.count(0) - 2, types.count(1) - 1)
+
+
+def test_scores_match_cross_encoder_tokenization(tokenizer):
+    max_length = 24
+    assessments = [{"url": f"/p{i}", "name": text(2 + i % 3, i), "description": text(i * 3, 100 + i)}
+                   for i in range(12)]
+    queries = ["", text(2), text(15, 7), text(40, 9)]
+    items = [(q, a) for q in queries for a in assessments]
+    # The untokenized item is scored from the raw text, the rest from the store
+    items.append((text(9), {"url": "/new", "name": text(3), "description": text(30, 200)}))
+
+    reranker = PretokenizedReranker(tokenizer, fingerprint, max_length)
+    reranker.build(assessments, version="v1")
+    scores = reranker.predict(items)
+
+    # What CrossEncoder.predict feeds the model
+    features = tokenizer([q for q, _ in items], [doc_text(a) for _, a in items], padding=True,
+                         truncation="longest_first", max_length=max_length, return_tensors="np")
+    expected = fingerprint({name: np.asarray(features[name], dtype=np.int64) for name in features})
+    np.testing.assert_array_equal(scores, expected)
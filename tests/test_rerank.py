@@ -0,0 +1,82 @@
+import time
+
+import recommender as recommender_module
+from conftest import FakeCrossEncoder
+from recommender import _RerankState
+
+
+def candidates(count, matching=(), score=0.5):
+    # FAISS-ordered candidates; the fake cross-encoder only likes the `matching` ones
+    return [{"url": f"/{i}", "name": "java test" if i in matching else f"item {i}", "description": "",
+             "score": score} for i in range(count)]
+
+
+class SlowCrossEncoder(FakeCrossEncoder):
+    # Takes a fixed time per pair, so the latency budget check has a known cost to work with
+    def predict(self, pairs, **kwargs):
+        time.sleep(0.005 * len(pairs))
+        return super().predict(pairs, **kwargs)
+
+
+def rerank(system, batch, k, **kwargs):
+    trace = {}
+    results = system.rerank_candidates(["java test"], [batch], k, traces=[trace], **kwargs)[0]
+    return results, trace
+
+
+def test_full_mode_scores_every_candidate(recommender):
+    results, trace = rerank(recommender, candidates(30, matching={7, 25}), 5, rerank_mode="full")
+    assert trace["rerank_stop"] == "exhausted" and trace["reranked"] == 30
+    assert [r["url"] for r in results[:2]] == ["/7", "/25"]
+    assert len(results) == 5
+
+
+def test_cascade_stops_once_top_k_is_stable(recommender, monkeypatch):
+    monkeypatch.setattr(recommender_module, "RERANK_CHUNK", 10)
+    results, trace = rerank(recommender, candidates(40, matching={1, 3}), 5, rerank_mode="cascade")
+    # The second round leaves the top 5 unchanged, so the last 20 are never scored
+    assert trace["rerank_stop"] == "stable" and trace["reranked"] == 20
+    assert len(recommender.reranker.scored) == 20
+    assert [r["url"] for r in results[:2]] == ["/1", "/3"]
+    assert len(results) == 5
+
+
+def test_adaptive_depth_follows_the_score_distribution(monkeypatch):
+    monkeypatch.setattr(recommender_module, "CASCADE_MIN_DEPTH", 10)
+    flat = candidates(40)
+    peaked = [dict(c, score=0.9 if i == 0 else 0.2) for i, c in enumerate(flat)]
+    assert _RerankState("q", flat, 5, cascade=True).depth == 40
+    assert _RerankState("q", peaked, 5, cascade=True).depth == 10
+    assert _RerankState("q", peaked, 15, cascade=True).depth == 15
+    assert _RerankState("q", [], 5, cascade=True).stopped == "exhausted"
+
+
+def test_budget_stops_the_cascade_and_still_returns_k(recommender, monkeypatch):
+    monkeypatch.setattr(recommender_module, "RERANK_CHUNK", 10)
+    recommender.reranker = SlowCrossEncoder()
+    batch = candidates(40, matching={4, 30})
+    # One 10-pair round costs ~50 ms; a second would overrun the 80 ms budget
+    results, trace = rerank(recommender, batch, 12, latency_budget_ms=80, started=time.perf_counter())
+    assert trace["rerank_stop"] == "budget" and trace["reranked"] == 10
+    assert len(results) == 12
+    # Scored candidates first, then the unscored ones in FAISS order
+    assert results[0]["url"] == "/4"
+    assert [r["url"] for r in results[10:]] == ["/10", "/11"]
+    assert "rerank_score" not in results[-1]
+
+
+def test_spent_budget_returns_retrieval_order(recommender):
+    batch = candidates(20, matching={5})
+    results, trace = rerank(recommender, batch, 5, latency_budget_ms=10, started=time.perf_counter() - 1)
+    assert trace["rerank_stop"] == "budget" and trace["reranked"] == 0
+    assert [r["url"] for r in results] == ["/0", "/1", "/2", "/3", "/4"]
+    assert recommender.reranker.scored == []
+
+
+def test_listeners_see_each_intermediate_round(recommender, monkeypatch):
+    monkeypatch.setattr(recommender_module, "RERANK_CHUNK", 10)
+    events = []
+    recommender.rerank_candidates(["java test"], [candidates(40, matching={1, 3})], 5, rerank_mode="cascade",
+                                  listeners=[lambda event, results: events.append((event, len(results)))])
+    # Two rounds run; only the first is intermediate
+    assert events == [("rerank", 5)]
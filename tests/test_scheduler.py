@@ -0,0 +1,142 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scheduler import BatchScheduler, DeadlineExceeded, QueueFullError
+
+
+class FakeRecommender:
+    # Records every recommend_batch call; optionally blocks until released
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def recommend_batch(self, queries, traces=None, listeners=None, **options):
+        with self.lock:
+            self.calls.append((list(queries), options))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            if self.gate is not None:
+                self.gate.wait(5)
+            return [[{"query": q, **options}] for q in queries]
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_queued_requests_share_one_batch():
+    rec = FakeRecommender()
+    scheduler = BatchScheduler(rec, max_batch_size=8, max_wait_ms=50)
+    futures = [scheduler.submit(f"q{i}", k=5) for i in range(5)]
+    scheduler.start()
+    try:
+        results = [f.result(timeout=5) for f in futures]
+    finally:
+        scheduler.stop()
+    assert rec.calls == [([f"q{i}" for i in range(5)], {"k": 5})]
+    assert [r[0]["query"] for r in results] == [f"q{i}" for i in range(5)]
+    assert scheduler.stats.snapshot()["batch_sizes"] == {5: 1}
+
+
+def test_batches_split_at_max_size_and_by_options():
+    rec = FakeRecommender()
+    scheduler = BatchScheduler(rec, max_batch_size=3, max_wait_ms=50)
+    futures = [scheduler.submit(f"a{i}", k=5) for i in range(4)] + [scheduler.submit("b", k=10)]
+    scheduler.start()
+    try:
+        for f in futures:
+            f.result(timeout=5)
+    finally:
+        scheduler.stop()
+    # Only requests with identical options share a recommend_batch call
+    assert sorted((len(queries), options["k"]) for queries, options in rec.calls) == [(1, 5), (1, 10), (3, 5)]
+
+
+def test_in_flight_batches_bounded_by_workers():
+    gate = threading.Event()
+    rec = FakeRecommender(gate)
+    pool = ThreadPoolExecutor(max_workers=4)
+    scheduler = BatchScheduler(rec, max_batch_size=1, max_wait_ms=0, executor=pool, workers=2).start()
+    try:
+        futures = [scheduler.submit(f"q{i}") for i in range(4)]
+        time.sleep(0.2)
+        # The pool could run four, but the scheduler only hands it two at a time
+        assert rec.running == 2
+        gate.set()
+        for f in futures:
+            f.result(timeout=5)
+    finally:
+        gate.set()
+        scheduler.stop()
+        pool.shutdown()
+    assert rec.peak == 2
+    assert len(rec.calls) == 4
+
+
+def test_batch_failure_reaches_every_caller():
+    class Broken:
+        def recommend_batch(self, queries, **kwargs):
+            raise ValueError("model exploded")
+
+    scheduler = BatchScheduler(Broken(), max_wait_ms=20)
+    futures = [scheduler.submit("a"), scheduler.submit("b")]
+    scheduler.start()
+    try:
+        for f in futures:
+            with pytest.raises(ValueError, match="model exploded"):
+                f.result(timeout=5)
+    finally:
+        scheduler.stop()
+
+
+def test_full_queue_rejects_new_requests():
+    scheduler = BatchScheduler(FakeRecommender(), max_queue=2)
+    scheduler.submit("a")
+    scheduler.submit("b")
+    with pytest.raises(QueueFullError):
+        scheduler.submit("c")
+    assert scheduler.stats.snapshot()["rejected"] == 1
+    scheduler.start()
+    scheduler.stop()
+
+
+def test_expired_and_cancelled_requests_are_dropped_before_inference():
+    rec = FakeRecommender()
+    scheduler = BatchScheduler(rec, max_wait_ms=20)
+    late = scheduler.submit("late", timeout=0.01)
+    gone = scheduler.submit("gone")
+    gone.cancel()
+    kept = scheduler.submit("kept")
+    time.sleep(0.05)
+    scheduler.start()
+    try:
+        assert kept.result(timeout=5)[0]["query"] == "kept"
+        with pytest.raises(DeadlineExceeded):
+            late.result(timeout=5)
+    finally:
+        scheduler.stop()
+    assert rec.calls == [(["kept"], {})]
+    assert scheduler.stats.snapshot()["expired"] == 2
+
+
+def test_stop_fails_requests_still_queued():
+    gate = threading.Event()
+    scheduler = BatchScheduler(FakeRecommender(gate), max_batch_size=1, max_wait_ms=0).start()
+    running = scheduler.submit("running")
+    time.sleep(0.1)
+    queued = scheduler.submit("queued")
+    stopper = threading.Thread(target=scheduler.stop)
+    stopper.start()
+    # Release the running batch only once stop() has been requested
+    scheduler._stopped.wait(5)
+    gate.set()
+    stopper.join(5)
+    assert running.result(timeout=5)[0]["query"] == "running"
+    with pytest.raises(RuntimeError, match="stopped"):
+        queued.result(timeout=5)
@@ -0,0 +1,31 @@
+import subprocess
+
+import pytest
+
+import embeddings
+import serve
+
+
+@pytest.fixture
+def no_legacy_index(processed_dir, monkeypatch):
+    monkeypatch.setattr(embeddings, "INDEX_FILE", str(processed_dir / "assessments.index"))
+    monkeypatch.setattr(embeddings, "MAPPING_FILE", str(processed_dir / "mapping.pkl"))
+
+
+def test_published_bundle_starts_without_building(engine, no_legacy_index, monkeypatch):
+    engine.save_index()
+    monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: pytest.fail("built the index"))
+    serve.ensure_index()
+
+
+def test_missing_index_is_built_in_a_subprocess(no_legacy_index, monkeypatch):
+    calls = []
+
+    def run(command):
+        calls.append(command)
+        return subprocess.CompletedProcess(command, 0)
+    monkeypatch.setattr(subprocess, "run", run)
+    # The build "succeeds" but publishes nothing, so the server refuses to start
+    with pytest.raises(SystemExit, match="run src/scraper.py"):
+        serve.ensure_index()
+    assert calls[0][1].endswith("embeddings.py")
@@ -0,0 +1,56 @@
+import numpy as np
+
+from conftest import CATALOG
+from stream_index import ShardWriter, merge_shards, publish
+
+
+def one_hot(*rows, dimension=8):
+    # Row i of the result marks which input record it came from
+    vectors = np.zeros((len(rows), dimension), dtype=np.float32)
+    vectors[np.arange(len(rows)), rows] = 1.0
+    return vectors
+
+
+def test_merge_keeps_last_write_aligned_with_its_vector(tmp_path):
+    shards = tmp_path / "shards"
+    writer = ShardWriter(str(shards))
+    writer.write([
+        {"url": "/a", "name": "A", "duration": 30, "tags": ["x"]},
+        {"url": "/b", "name": None, "duration": None},
+        {"url": "/c", "name": "C", "tags": []},
+    ], one_hot(0, 1, 2))
+    writer.write([
+        {"url": "/a", "name": "A (Updated)", "tags": None},
+        {"url": "/d", "name": "", "duration": 0, "remote": False},
+    ], one_hot(3, 4))
+    writer.write([{"url": "/b", "name": "B", "duration": 45}], one_hot(5))
+
+    metadata, vectors, report = merge_shards(str(shards), str(tmp_path / "staging"))
+    assert report == {"shards": 3, "records": 6, "unique": 4, "duplicates": 2}
+    # Winners in shard order; the later copy of /a and /b replaces the earlier one
+    # whole, fields missing from it included
+    assert list(metadata) == [
+        {"url": "/c", "name": "C", "tags": []},
+        {"url": "/a", "name": "A (Updated)", "tags": None},
+        {"url": "/d", "name": "", "duration": 0, "remote": False},
+        {"url": "/b", "name": "B", "duration": 45},
+    ]
+    np.testing.assert_array_equal(vectors, one_hot(2, 3, 4, 5))
+    assert metadata.value("duration", 1) is None and metadata.value("tags", 3) is None
+
+
+def test_publish_serves_merged_shards(engine, tmp_path):
+    shards = tmp_path / "shards"
+    writer = ShardWriter(str(shards))
+    first = [dict(item) for item in CATALOG[:5]]
+    second = [dict(CATALOG[0], name="Java 8 (Updated)", description=None)] + [dict(item) for item in CATALOG[5:]]
+    for records in (first, second):
+        writer.write(records, engine.encode_queries([item["url"] for item in records]))
+
+    report = publish(engine, str(shards))
+    assert report["unique"] == len(CATALOG) and report["duplicates"] == 1
+    assert not shards.exists()
+    java = engine.assessments[engine.url_positions["/java-8"]]
+    assert java["name"] == "Java 8 (Updated)" and java["description"] is None
+    expected = engine.encode_queries(["/java-8"])[0]
+    np.testing.assert_allclose(engine.vectors[engine.url_positions["/java-8"]], expected, rtol=1e-6)